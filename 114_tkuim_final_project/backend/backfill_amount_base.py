@@ -0,0 +1,20 @@
+"""
+回填腳本：為舊交易補上基準幣別金額 (amount_base / base_rate)
+
+儀表板統計直接加總 amount_base，舊資料需先執行一次此腳本。
+
+使用方法：
+    python backfill_amount_base.py [batch_size]
+
+例如: python backfill_amount_base.py 500
+"""
+
+import sys
+
+from services.currency_service import backfill_amount_base, BASE_CURRENCY
+
+
+if __name__ == "__main__":
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    updated = backfill_amount_base(batch_size=batch_size)
+    print(f"✅ 已為 {updated} 筆交易補上 {BASE_CURRENCY} 基準金額")
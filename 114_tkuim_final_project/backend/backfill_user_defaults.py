@@ -0,0 +1,15 @@
+"""
+回填腳本：為既有使用者複製預設分類與支付方式
+
+預設值已改為在註冊時建立，舊帳號需執行一次此腳本。
+
+使用方法：
+    python backfill_user_defaults.py
+"""
+
+from services.category_service import backfill_user_defaults
+
+
+if __name__ == "__main__":
+    count = backfill_user_defaults()
+    print(f"✅ 已為 {count} 位使用者建立預設分類與支付方式")
@@ -0,0 +1,65 @@
+"""
+自動分類效能測試：以歷史記帳訓練，量測保留資料的準確率與批次分類速度。
+
+用法:
+    python benchmark_categorizer.py                          # test_data/*.csv
+    python benchmark_categorizer.py --rows 100000 --holdout 0.3
+    python benchmark_categorizer.py --user-id <ID>           # 使用資料庫中某位使用者的歷史
+
+準確率 = 有預測的保留列中分類正確的比例；涵蓋率 = 有預測的保留列比例。
+"""
+import argparse
+import csv
+import glob
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.categorizer_service import Categorizer, count_tokens, evaluate
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_data")
+
+
+def load_history(user_id=None):
+    if user_id:
+        from database import transactions_collection
+        return list(transactions_collection.find({"user_id": user_id}, {"title": 1, "category": 1, "type": 1, "_id": 0}))
+    history = []
+    for path in sorted(glob.glob(os.path.join(TEST_DATA, "*.csv"))):
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            history.extend(csv.DictReader(f))
+    return history
+
+
+def main():
+    parser = argparse.ArgumentParser(description="History-trained categorizer benchmark")
+    parser.add_argument("--rows", type=int, default=100_000, help="批次分類列數")
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--user-id", help="從資料庫讀取此使用者的歷史")
+    args = parser.parse_args()
+
+    history = load_history(args.user_id)
+    result = evaluate(history, holdout=args.holdout)
+    print(f"歷史筆數: {len(history):,}  訓練: {result['train']:,}  保留: {result['test']:,}")
+    print(f"準確率: {result['accuracy']:.1%}  涵蓋率: {result['coverage']:.1%}")
+
+    # 批次速度：歷史標題加上流水號 (模擬銀行明細中每筆不同的標題)
+    model = Categorizer(count_tokens(history))
+    rng = random.Random(42)
+    batch = []
+    for i in range(args.rows):
+        tx = rng.choice(history)
+        title = tx["title"] if i % 2 else f"{tx['title']} {i}"
+        batch.append((title, tx.get("type") or "expense"))
+    start = time.perf_counter()
+    for title, tx_type in batch:
+        model.predict(title, tx_type)
+    elapsed = time.perf_counter() - start
+    print(f"分類 {args.rows:,} 列: {elapsed:.3f} 秒 ({args.rows / elapsed:,.0f} 列/秒)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+匯入解析效能測試：串流解析 vs. 舊的 pandas 解析 (每秒列數與記憶體峰值)。
+
+用法:
+    python benchmark_import_parsing.py                       # CSV，10 萬列
+    python benchmark_import_parsing.py --rows 500000
+    python benchmark_import_parsing.py --format xlsx         # openpyxl 唯讀模式 vs. pd.read_excel
+    python benchmark_import_parsing.py --format xlsx --sheets 12
+
+測試資料格式與 test_data/dad.csv 相同 (UTF-8 BOM，日期為 2026/1/1)。
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.import_service import iter_csv_rows, iter_xlsx_rows, chunked, DateParser, normalize_record
+
+TITLES = [("加油", "Transport", "Credit Card"), ("便利商店午餐", "Food", "E-wallet"),
+          ("全聯買菜", "Food", "Cash"), ("電費", "Utilities", "Bank"), ("1月薪資", "Salary", "Bank")]
+
+
+COLUMNS = ["date", "type", "category", "title", "amount", "payment_method", "note"]
+
+
+def make_rows(rows: int):
+    """Synthetic rows in the test_data format."""
+    rng = random.Random(42)
+    for i in range(rows):
+        title, category, method = rng.choice(TITLES)
+        kind = "income" if category == "Salary" else "expense"
+        note = "" if i % 3 else "備註"
+        yield [f"2026/{rng.randint(1, 12)}/{rng.randint(1, 28)}", kind, category, title,
+               rng.randint(10, 5000), method, note]
+
+
+def make_csv(rows: int) -> bytes:
+    lines = [",".join(COLUMNS)] + [",".join(map(str, row)) for row in make_rows(rows)]
+    return "\ufeff".encode() + "\n".join(lines).encode("utf-8")
+
+
+def make_xlsx(rows: int, sheets: int) -> bytes:
+    """Workbook with the rows split over `sheets` sheets (like monthly bank statements)."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    per_sheet = -(-rows // sheets)
+    data = make_rows(rows)
+    for n in range(sheets):
+        sheet = workbook.create_sheet(f"Sheet{n + 1}")
+        sheet.append(COLUMNS)
+        for _ in range(per_sheet):
+            row = next(data, None)
+            if row is None:
+                break
+            sheet.append(row)
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def parse_with_pandas(data: bytes) -> int:
+    """The previous import path: read_csv, to_dict, pd.to_datetime per row."""
+    import pandas as pd
+
+    df = pd.read_csv(io.BytesIO(data))
+    count = 0
+    for r in df.to_dict(orient="records"):
+        r["date"] = pd.to_datetime(r["date"]).strftime("%Y-%m-%d")
+        count += 1
+    return count
+
+
+def parse_excel_with_pandas(data: bytes) -> int:
+    """The previous Excel path: read_excel (every sheet) and to_dict."""
+    import pandas as pd
+
+    count = 0
+    for df in pd.read_excel(io.BytesIO(data), sheet_name=None).values():
+        for r in df.to_dict(orient="records"):
+            r["date"] = pd.to_datetime(r["date"]).strftime("%Y-%m-%d")
+            count += 1
+    return count
+
+
+def parse_streaming(data: bytes, reader=iter_csv_rows) -> int:
+    """The streaming path, in import chunks."""
+    _, rows = reader(io.BytesIO(data))
+    date_parser = DateParser()
+    count = 0
+    for chunk in chunked(rows):
+        count += len([normalize_record(row, date_parser) for row in chunk])
+    return count
+
+
+def measure(func, data: bytes):
+    """(rows/sec, peak traced memory in MB); timed without tracing overhead"""
+    start = time.perf_counter()
+    count = func(data)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count / elapsed, peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CSV import parsing benchmark")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--format", choices=["csv", "xlsx"], default="csv")
+    parser.add_argument("--sheets", type=int, default=1, help="XLSX 工作表數")
+    args = parser.parse_args()
+
+    if args.format == "csv":
+        data = make_csv(args.rows)
+        paths = [("pandas", parse_with_pandas), ("csv 串流", parse_streaming)]
+    else:
+        data = make_xlsx(args.rows, args.sheets)
+        paths = [("pandas", parse_excel_with_pandas),
+                 ("唯讀串流", lambda d: parse_streaming(d, iter_xlsx_rows))]
+    print(f"列數: {args.rows:,}  檔案大小: {len(data) / (1024 * 1024):.1f} MB")
+    print(f"{'解析方式':<10} {'列/秒':>12} {'記憶體峰值 (MB)':>18}")
+    for name, func in paths:
+        rate, peak = measure(func, data)
+        print(f"{name:<10} {rate:>12,.0f} {peak:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+密碼雜湊效能測試：各 scrypt 成本 (N) 下，每個 CPU 核心每秒可處理的登入次數。
+
+用法:
+    python benchmark_password_hashing.py              # N = 2^12 .. 2^16
+    python benchmark_password_hashing.py --seconds 3  # 每個成本測試 3 秒
+
+選擇 PASSWORD_SCRYPT_N 時，請確認單核登入吞吐量足以應付尖峰登入量。
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.password_service import hash_password_sync, verify_password_sync
+
+
+def measure(n: int, seconds: float, workers: int) -> float:
+    """Verifications per second using `workers` threads."""
+    hashed = hash_password_sync("Benchmark123", n=n)
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        count = 0
+        while time.perf_counter() < deadline:
+            verify_password_sync("Benchmark123", hashed)
+            count += 1
+        return count
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        total = sum(pool.map(lambda _: worker(), range(workers)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="scrypt login throughput benchmark")
+    parser.add_argument("--seconds", type=float, default=2.0, help="測試時間 (每個成本)")
+    parser.add_argument("--min-log2", type=int, default=12)
+    parser.add_argument("--max-log2", type=int, default=16)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    print(f"CPU 核心數: {cores}")
+    print(f"{'N':>8} {'ms/登入':>10} {'登入/秒/核':>12} {f'登入/秒 ({cores} 核)':>18}")
+    for log2 in range(args.min_log2, args.max_log2 + 1):
+        n = 2 ** log2
+        single = measure(n, args.seconds, 1)
+        total = measure(n, args.seconds, cores)
+        print(f"{n:>8} {1000 / single:>10.1f} {single:>12.1f} {total:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
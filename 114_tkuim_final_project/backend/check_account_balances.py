@@ -0,0 +1,32 @@
+"""
+檢查腳本：比對 account_balances 與交易紀錄重新計算的結果
+
+使用方法：
+    python check_account_balances.py            # 只回報差異
+    python check_account_balances.py --repair   # 回報並修正差異 (檢查期間有新寫入的帳戶會略過，請再執行一次)
+"""
+
+import sys
+
+from services.balance_service import check_balances, repair_balances
+
+
+if __name__ == "__main__":
+    repair = "--repair" in sys.argv
+    drift = check_balances()
+
+    if not drift:
+        print("✅ 所有帳戶餘額皆一致")
+        sys.exit(0)
+
+    print("=" * 60)
+    print(f"發現 {len(drift)} 筆帳戶餘額不一致：")
+    for d in drift:
+        print(f"  User: {d['user_id']} | {d['account']:15} | 儲存: {d['stored']} | 應為: {d['expected']} | 差異: {d['drift']}")
+    print("=" * 60)
+    if repair:
+        repaired = repair_balances(drift)
+        print(f"🔧 已修正 {repaired} 筆帳戶餘額")
+        if repaired < len(drift):
+            print(f"⚠️ {len(drift) - repaired} 筆在檢查期間有新的交易寫入，已略過，請再執行一次")
+    sys.exit(1)
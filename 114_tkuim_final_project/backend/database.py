@@ -1,7 +1,9 @@
 # database.py - MongoDB connection, collections, and indexes
 import os
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
 from pathlib import Path
 
 # Load .env from current directory
@@ -24,6 +26,18 @@ recurring_collection = db["recurring"]
 category_budgets_collection = db["category_budgets"]
 payment_methods_collection = db["payment_methods"]
 ledgers_collection = db["ledgers"]
+account_balances_collection = db["account_balances"]
+memberships_collection = db["memberships"]
+invites_collection = db["invites"]
+tokens_collection = db["tokens"]
+email_outbox_collection = db["email_outbox"]
+token_versions_collection = db["token_versions"]
+rate_limits_collection = db["rate_limits"]
+data_versions_collection = db["data_versions"]
+export_jobs_collection = db["export_jobs"]
+category_tokens_collection = db["category_tokens"]
+category_models_collection = db["category_models"]
+migrations_collection = db["migrations"]
 
 # Alias for backward compatibility
 collection = transactions_collection
@@ -39,6 +53,7 @@ def create_indexes():
     transactions_collection.create_index([("date", DESCENDING)])
     transactions_collection.create_index([("user_id", ASCENDING), ("date", DESCENDING)])
     transactions_collection.create_index([("type", ASCENDING)])
+    transactions_collection.create_index([("amount_base", ASCENDING)])
     
     # Users: login queries
     users_collection.create_index([("username", ASCENDING)], unique=True)
@@ -46,21 +61,89 @@ def create_indexes():
     users_collection.create_index([("family_id", ASCENDING)])
     users_collection.create_index([("invite_code", ASCENDING)])
     
-    # Categories: lookup by user and type
+    # Categories: lookup by user and type; one per (user, name, type) so seeding upserts cannot duplicate
     categories_collection.create_index([("user_id", ASCENDING)])
     categories_collection.create_index([("type", ASCENDING)])
     categories_collection.create_index([("is_default", ASCENDING)])
     
+    # Payment methods: lookup by user; one per (user, name)
+    payment_methods_collection.create_index([("user_id", ASCENDING)])
+    
+    try:
+        categories_collection.create_index(
+            [("user_id", ASCENDING), ("name", ASCENDING), ("type", ASCENDING)], unique=True
+        )
+        payment_methods_collection.create_index([("user_id", ASCENDING), ("name", ASCENDING)], unique=True)
+    except OperationFailure as e:
+        # Another worker is still removing old duplicates; the next start builds the index
+        print(f"⚠️ 分類/支付方式唯一索引尚未建立: {e}")
+    
     # Templates: quick entry lookup
     templates_collection.create_index([("user_id", ASCENDING)])
     
+    transactions_collection.create_index(
+        [("recurring_id", ASCENDING), ("occurrence_date", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"recurring_id": {"$exists": True}}
+    )
+    
+    # Imported rows: re-importing the same file skips rows already stored
+    transactions_collection.create_index(
+        [("import_fingerprint", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"import_fingerprint": {"$exists": True}}
+    )
+    
     # Recurring transactions
     recurring_collection.create_index([("user_id", ASCENDING)])
     recurring_collection.create_index([("next_date", ASCENDING)])
+    recurring_collection.create_index([("is_active", ASCENDING), ("next_date", ASCENDING)])
+    
+    # Account balances: one document per (user, account), maintained with $inc
+    account_balances_collection.create_index([("user_id", ASCENDING), ("account", ASCENDING)], unique=True)
+    
+    # Memberships: every permission check is one lookup on (principal, scope)
+    memberships_collection.create_index([("principal", ASCENDING), ("scope", ASCENDING)], unique=True)
+    memberships_collection.create_index([("scope", ASCENDING), ("role", ASCENDING)])
+    
+    # Invites: unique codes, removed by MongoDB once expires_at has passed
+    invites_collection.create_index([("code", ASCENDING)], unique=True)
+    invites_collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    invites_collection.create_index([("ledger_id", ASCENDING), ("expires_at", ASCENDING)])
+    
+    # Tokens: looked up by hash, removed by MongoDB once expires_at has passed
+    tokens_collection.create_index([("token_hash", ASCENDING)], unique=True)
+    tokens_collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    tokens_collection.create_index([("user_id", ASCENDING), ("purpose", ASCENDING)])
+    
+    # Email outbox: sender polls due messages; every message (any status) is removed after 1 day.
+    # Bodies carry reset links and delete codes, and all retries finish well within a day.
+    email_outbox_collection.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)])
+    if "sent_at_1" in email_outbox_collection.index_information():
+        email_outbox_collection.drop_index("sent_at_1")  # Replaced by the created_at TTL
+    email_outbox_collection.create_index([("created_at", ASCENDING)], expireAfterSeconds=24 * 3600)
+    
+    # Token versions: revocation map is refreshed by updated_at
+    token_versions_collection.create_index([("updated_at", ASCENDING)])
+    
+    # Rate limit buckets: removed once idle long enough to be full again
+    rate_limits_collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    
+    # Export jobs: reused while the filter and data versions match; GridFS files expire with the job
+    export_jobs_collection.create_index([("cache_key", ASCENDING), ("status", ASCENDING)])
+    export_jobs_collection.create_index([("expires_at", ASCENDING)])
+    db["exports.files"].create_index([("metadata.expires_at", ASCENDING)])
+    
+    # Categorizer: one counter per (user, type, token, category)
+    category_tokens_collection.create_index(
+        [("user_id", ASCENDING), ("type", ASCENDING), ("token", ASCENDING), ("category", ASCENDING)],
+        unique=True
+    )
     
     # Category budgets
     category_budgets_collection.create_index([("user_id", ASCENDING)])
     category_budgets_collection.create_index([("user_id", ASCENDING), ("category", ASCENDING)])
+    category_budgets_collection.create_index([("user_id", ASCENDING), ("month", ASCENDING)])
     
     print("✅ MongoDB indexes created successfully")
 
@@ -99,3 +182,39 @@ def paginate_query(collection_obj, query: dict, page: int = 1, page_size: int =
         "has_prev": page > 1
     }
 
+
+
+# One-off startup work shared by several workers
+def claim_migration(name: str, lease_seconds: int = 600) -> bool:
+    """
+    Claim a startup migration so only one worker runs it.
+    
+    The claim is a lease: after `lease_seconds` another worker may claim
+    it again (e.g. the first one crashed, or the data was wiped), unless
+    the migration was marked with `finish_migration`.
+    
+    Args:
+        name: Migration name
+        lease_seconds: How long the claim blocks other workers
+    
+    Returns:
+        True if this worker should run the migration
+    """
+    now = datetime.utcnow()
+    try:
+        # Matches only an expired claim; otherwise the upsert collides on _id
+        migrations_collection.update_one(
+            {"_id": name, "done": {"$ne": True}, "claimed_until": {"$lt": now}},
+            {"$set": {"claimed_until": now + timedelta(seconds=lease_seconds), "claimed_at": now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def finish_migration(name: str) -> None:
+    """Mark a claimed migration as done so no worker runs it again."""
+    migrations_collection.update_one(
+        {"_id": name}, {"$set": {"done": True, "finished_at": datetime.utcnow()}}, upsert=True
+    )
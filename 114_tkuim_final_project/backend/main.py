@@ -1,14 +1,14 @@
 # backend/main.py
 import os
-import pandas as pd
+import csv
 import io
-import hashlib
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from pydantic import BaseModel
 from typing import Optional, List
 from bson import ObjectId
@@ -21,6 +21,46 @@ import secrets
 from fastapi import Header
 
 from pathlib import Path
+from services.currency_service import BASE_CURRENCY, AMOUNT_BASE_EXPR, get_base_rate, stamp_amount_base
+from services.recurring_service import (
+    RecurringScheduler, execute_one, expand_occurrences, anchor_day_for, anchor_day_after_edit
+)
+from services.forecast_service import forecast
+from services.category_service import (
+    get_user_categories, get_user_payment_methods, seed_user_defaults,
+    remove_duplicates as remove_duplicate_categories
+)
+from services.family_service import resolve_members, invalidate_member
+from services.invite_service import create_invite as store_invite, find_invite, active_invites, migrate_string_expiry, to_api as invite_to_api
+from services.token_service import (
+    PURPOSE_PASSWORD_RESET, PURPOSE_ACCOUNT_DELETE, issue_token, find_token, is_expired,
+    consume_token, purge_legacy_user_fields
+)
+from services.email_service import EmailSender, enqueue_email
+from services.password_service import hash_password, verify_password, needs_rehash, PasswordPoolBusy
+from services.session_service import build_claims, user_from_claims, revocations
+from services.membership_service import (
+    LEDGER, FAMILY, grant, revoke, revoke_scope, has_access, scopes_for,
+    principals_in, family_of, rebuild_memberships
+)
+from services.balance_service import apply_transactions, replace_transaction, get_balances, rebuild_balances, bump_data_versions
+from services.import_service import (
+    read_rows, missing_columns, chunked, DateParser, validate_chunk, validate_upload, Fingerprinter, insert_new
+)
+from services.categorizer_service import get_categorizer, learn as learn_categories, is_generic, FALLBACK_CATEGORY
+from services.suggest_service import suggest as suggest_titles, observe as observe_titles
+from services.export_service import (
+    XLSX_MEDIA_TYPE, write_export_xlsx, submit_export, get_job as get_export_job, can_access_job, job_to_api as export_job_to_api,
+    open_job_file as open_export_file, parse_range, iter_file_range, purge_expired as purge_expired_exports
+)
+from services.stats_service import (
+    GRANULARITIES, resolve_range, get_trend, month_bounds, month_labels,
+    get_multi_month_stats, get_category_spend_by_month
+)
+from middleware.admission import setup_admission_control
+from middleware.upload_limit import setup_upload_limit
+from middleware.rate_limit import setup_rate_limiting, InMemoryStorage, MongoStorage, client_ip
+from itertools import islice
 
 # 載入 .env 檔案 (使用明確路徑)
 env_path = Path(__file__).parent / '.env'
@@ -61,8 +101,11 @@ def init_db():
             {"name": "Salary", "icon": "💰", "type": "income", "color": "#2ECC71", "is_default": True},
             {"name": "Other", "icon": "✨", "type": "expense", "color": "#95A5A6", "is_default": True},
         ]
-        categories_collection.insert_many(defaults)
-        print(f"✅ Inserted {len(defaults)} default categories")
+        try:
+            categories_collection.insert_many(defaults, ordered=False)
+            print(f"✅ Inserted {len(defaults)} default categories")
+        except BulkWriteError:
+            pass  # Another worker inserted them first (unique index)
     
     # Initialize default payment methods
     if payment_methods_collection.count_documents({"is_default": True}) == 0:
@@ -72,15 +115,57 @@ def init_db():
             {"name": "Bank", "icon": "🏦", "is_default": True},
             {"name": "LinePay", "icon": "📱", "is_default": True},
         ]
-        payment_methods_collection.insert_many(default_methods)
-        print(f"✅ Inserted {len(default_methods)} default payment methods")
+        try:
+            payment_methods_collection.insert_many(default_methods, ordered=False)
+            print(f"✅ Inserted {len(default_methods)} default payment methods")
+        except BulkWriteError:
+            pass  # Another worker inserted them first (unique index)
+    
+    # Migration: 建立唯一索引前，移除重複的分類與支付方式 (只執行一次，之後由唯一索引防止重複)
+    from database import create_indexes, claim_migration, finish_migration
+    if claim_migration("dedupe_categories"):
+        count = remove_duplicate_categories()
+        finish_migration("dedupe_categories")
+        if count:
+            print(f"🔧 已移除 {count} 筆重複的分類/支付方式")
     
     # Create MongoDB indexes for query optimization
-    from database import create_indexes
     create_indexes()
     
     init_default_admin()
 
+# 併發控制：匯出/匯入/儀表板統計各有併發上限與短佇列，超過時立即回應 503 + Retry-After
+admission = setup_admission_control(app)
+
+# 上傳大小上限：超過時在讀取內容前即回應 413 (上傳本身由 Starlette 暫存於磁碟)
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(10 * 1024 * 1024)))
+setup_upload_limit(app, [(r"^/api/import$", IMPORT_MAX_BYTES)])
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+
+# 速率限制：以登入使用者 ID 為單位 (未登入時以 IP)，多個 worker 共用 MongoDB 上的 token bucket
+def principal_key(request) -> str:
+    authorization = request.headers.get("authorization", "")
+    if authorization.startswith("Bearer "):
+        try:
+            payload = jwt.decode(authorization[7:], SECRET_KEY, algorithms=[ALGORITHM])
+            return f"user:{payload.get('uid') or payload.get('sub')}"
+        except jwt.PyJWTError:
+            pass
+    return f"ip:{client_ip(request)}"
+
+if os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true":
+    from database import rate_limits_collection
+    setup_rate_limiting(
+        app,
+        MongoStorage(rate_limits_collection) if os.getenv("RATE_LIMIT_STORAGE", "mongo") == "mongo" else InMemoryStorage(),
+        key_func=principal_key
+    )
+
+# 密碼雜湊執行緒池已滿時快速回應 503，而不是讓請求排隊
+@app.exception_handler(PasswordPoolBusy)
+def password_pool_busy_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": "伺服器忙碌中，請稍後再試"}, headers={"Retry-After": "1"})
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173", "http://127.0.0.1:5173"],
@@ -103,9 +188,10 @@ category_budgets_collection = db["category_budgets"]
 payment_methods_collection = db["payment_methods"]
 ledgers_collection = db["ledgers"]
 invites_collection = db["invites"]
+account_balances_collection = db["account_balances"]
+memberships_collection = db["memberships"]
 
 # --- 密碼加密 ---
-# --- 密碼加密 (Salted SHA256) ---
 _env_secret = os.getenv("SECRET_KEY")
 if not _env_secret:
     print("⚠️  WARNING: SECRET_KEY not set in .env, using random key (tokens will invalidate on restart)")
@@ -114,18 +200,7 @@ else:
     SECRET_KEY = _env_secret
 ALGORITHM = "HS256"
 
-def hash_password(password: str) -> str:
-    salt = secrets.token_hex(8) # 16 chars
-    hashed = hashlib.sha256((salt + password).encode()).hexdigest()
-    return f"{salt}${hashed}"
-
-def verify_password(plain: str, hashed: str) -> bool:
-    try:
-        salt, hash_val = hashed.split('$')
-        verify_hash = hashlib.sha256((salt + plain).encode()).hexdigest()
-        return verify_hash == hash_val
-    except ValueError:
-        return False
+# 雜湊實作見 services/password_service (scrypt，於有界執行緒池中執行)
 
 # --- JWT Token ---
 def create_access_token(data: dict):
@@ -148,19 +223,22 @@ async def get_current_user(authorization: Optional[str] = Header(None)):
         raise HTTPException(status_code=401, detail="Token 已過期，請重新登入")
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Token 無效")
-        
-    user = users_collection.find_one({"username": username})
-    if not user:
-        raise HTTPException(status_code=401, detail="使用者不存在")
     
-    return fix_id(user)
-
-# --- 邀請碼生成 ---
-import random
-import string
+    # 舊版 Token (只有 sub/role) 無法檢查撤銷版本，改密碼後仍會有效，因此要求重新登入
+    if not payload.get("uid"):
+        raise HTTPException(status_code=401, detail="Token 已失效，請重新登入")
+    
+    # Token 已帶使用者 ID 與角色：驗證簽章與版本即可，不需查資料庫
+    if not revocations.is_current(payload):
+        raise HTTPException(status_code=401, detail="Token 已失效，請重新登入")
+    return user_from_claims(payload)
 
-def generate_invite_code(length: int = 6) -> str:
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
+# 併發控制的即時佇列與上限 (僅管理員，避免暴露可被利用的飽和門檻)
+@app.get("/api/metrics/admission")
+def get_admission_metrics(current_user: dict = Depends(get_current_user)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="權限不足")
+    return admission.metrics()
 
 # --- Models ---
 class Transaction(BaseModel):
@@ -219,25 +297,12 @@ class ResetWithTokenRequest(BaseModel):
     token: str
     new_password: str
 
-# Email 發送功能
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-
+# Email 發送功能 (寫入 outbox，由背景 EmailSender 發送)
 def send_reset_email(to_email: str, reset_token: str):
-    smtp_email = os.getenv("SMTP_EMAIL")
-    smtp_password = os.getenv("SMTP_PASSWORD")
-    smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-    smtp_port = int(os.getenv("SMTP_PORT", "587"))
     frontend_url = os.getenv("FRONTEND_URL", "http://localhost:5173")
     
     reset_link = f"{frontend_url}?reset_token={reset_token}"
     
-    msg = MIMEMultipart()
-    msg['From'] = smtp_email
-    msg['To'] = to_email
-    msg['Subject'] = "🔐 PyMoney 密碼重設"
-    
     body = f"""
     <html>
     <body style="font-family: Arial, sans-serif; padding: 20px;">
@@ -252,17 +317,11 @@ def send_reset_email(to_email: str, reset_token: str):
     </html>
     """
     
-    msg.attach(MIMEText(body, 'html'))
-    
     try:
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_email, smtp_password)
-        server.send_message(msg)
-        server.quit()
+        enqueue_email(to_email, "🔐 PyMoney 密碼重設", body)
         return True
     except Exception as e:
-        print(f"Email 發送失敗: {e}")
+        print(f"Email 排入佇列失敗: {e}")
         return False
 
 
@@ -299,6 +358,8 @@ def init_default_admin():
             {"_id": admin_result.inserted_id},
             {"$set": {"family_id": family_id}}
         )
+        grant(admin_id, FAMILY, family_id, role="admin")
+        seed_user_defaults(admin_id)
         
         print("✅ 已建立預設管理員帳號: admin / admin (含預設家庭)")
 
@@ -325,23 +386,87 @@ def startup_event():
             {"_id": admin["_id"]},
             {"$set": {"family_id": family_id}}
         )
+        grant(admin_id, FAMILY, family_id, role="admin")
         print(f"🔧 已為現有管理員 {admin['display_name']} 建立家庭")
 
+    # Migration: 邀請碼 expires_at 由 ISO 字串改為 datetime (TTL 索引才會生效)
+    count = migrate_string_expiry()
+    if count:
+        print(f"🔧 已轉換 {count} 筆邀請碼期限")
+
+    # Migration: 重設 token / 刪除驗證碼已移至 tokens 集合 (只執行一次)
+    from database import claim_migration, finish_migration
+    if claim_migration("purge_legacy_user_fields"):
+        count = purge_legacy_user_fields()
+        finish_migration("purge_legacy_user_fields")
+        if count:
+            print(f"🔧 已清除 {count} 位使用者的暫存驗證欄位")
+
+    # Migration: 首次啟用 memberships 時，從帳本與家庭成員列表建立
+    if memberships_collection.estimated_document_count() == 0 and \
+            (ledgers_collection.estimated_document_count() > 0 or families_collection.estimated_document_count() > 0):
+        count = rebuild_memberships()
+        print(f"🔧 已建立 {count} 筆成員權限")
+
+    # Migration: 首次啟用帳戶餘額快取時，從歷史交易重建 (多個 worker 同時啟動時只由一個執行)
+    if account_balances_collection.estimated_document_count() == 0 and collection.estimated_document_count() > 0 \
+            and claim_migration("account_balances"):
+        count = rebuild_balances()
+        print(f"🔧 已重建 {count} 筆帳戶餘額")
+
+    # 清除過期的匯出檔案
+    count = purge_expired_exports()
+    if count:
+        print(f"🔧 已清除 {count} 個過期匯出檔")
+
+# 重複交易自動執行排程 (多個 worker 同時執行也不會重複入帳)
+recurring_scheduler = RecurringScheduler(
+    interval=int(os.getenv("RECURRING_SWEEP_INTERVAL", "300")),
+    batch_size=int(os.getenv("RECURRING_SWEEP_BATCH", "500"))
+)
+
+@app.on_event("startup")
+def start_recurring_scheduler():
+    if os.getenv("RECURRING_SCHEDULER_ENABLED", "true").lower() == "true":
+        recurring_scheduler.start()
+        print("✅ 重複交易排程已啟動")
+
+@app.on_event("shutdown")
+def stop_recurring_scheduler():
+    recurring_scheduler.stop()
+
+# 郵件 outbox 背景發送 (重用 SMTP 連線，失敗以指數退避重試)
+email_sender = EmailSender(
+    interval=float(os.getenv("EMAIL_SEND_INTERVAL", "5")),
+    batch_size=int(os.getenv("EMAIL_SEND_BATCH", "50"))
+)
+
+@app.on_event("startup")
+def start_email_sender():
+    if os.getenv("EMAIL_SENDER_ENABLED", "true").lower() == "true":
+        email_sender.start()
+        print("✅ 郵件發送排程已啟動")
+
+@app.on_event("shutdown")
+def stop_email_sender():
+    email_sender.stop()
+
 # --- Helper for Family Access ---
+def resolve_principal(user: str) -> Optional[str]:
+    # user might be ObjectId string or username
+    if ObjectId.is_valid(user):
+        return user
+    doc = users_collection.find_one({"username": user}, {"_id": 1})
+    return str(doc["_id"]) if doc else None
+
 def is_family_member(user_a: str, user_b: str) -> bool:
-    # user_a is usually from current_user['username']
-    u1 = users_collection.find_one({"username": user_a})
-    # user_b might be username or ObjectId
-    u2 = users_collection.find_one({"username": user_b})
-    if not u2:
-        try:
-            u2 = users_collection.find_one({"_id": ObjectId(user_b)})
-        except:
-            pass
-            
-    if u1 and u2 and u1.get("family_id") and u1["family_id"] == u2.get("family_id"):
-        return True
-    return False
+    # 兩者皆為 ID 時只需查 memberships (通常命中快取)
+    a = resolve_principal(user_a)
+    b = resolve_principal(user_b)
+    if not a or not b:
+        return False
+    family_id = family_of(a)
+    return bool(family_id) and has_access(b, FAMILY, family_id)
 
 # --- API 區域 ---
 # [Auth] 使用者登入 API
@@ -360,8 +485,15 @@ def login(request: LoginRequest):
     if not verify_password(request.password, user["password"]):
         raise HTTPException(status_code=401, detail="密碼錯誤")
     
+    # 舊格式或成本參數已調整的雜湊，於登入成功時重新雜湊
+    if needs_rehash(user["password"]):
+        users_collection.update_one(
+            {"_id": user["_id"], "password": user["password"]},
+            {"$set": {"password": hash_password(request.password)}}
+        )
+    
     # 產生 JWT Token
-    access_token = create_access_token(data={"sub": user["username"], "role": user["role"]})
+    access_token = create_access_token(data=build_claims(user, revocations.version(str(user["_id"]))))
     
     return {
         "success": True,
@@ -413,11 +545,10 @@ def self_register(request: RegisterRequest):
         "family_id": None,
         "invite_code": None,
         "invite_expires": None,
-        "reset_token": None,
-        "reset_expires": None,
         "created_at": datetime.now().isoformat()
     }
     result = users_collection.insert_one(new_user)
+    seed_user_defaults(str(result.inserted_id))
     return {"message": "註冊成功", "id": str(result.inserted_id)}
 
 # [Auth] 忘記密碼 - 發送重設郵件
@@ -430,12 +561,7 @@ def forgot_password(request: ForgotPasswordRequest):
     
     # 產生重設 token
     reset_token = secrets.token_urlsafe(32)
-    expires = datetime.now() + timedelta(minutes=30)
-    
-    users_collection.update_one(
-        {"_id": user["_id"]},
-        {"$set": {"reset_token": reset_token, "reset_expires": expires.isoformat()}}
-    )
+    issue_token(reset_token, str(user["_id"]), PURPOSE_PASSWORD_RESET, timedelta(minutes=30))
     
     # 發送郵件
     if send_reset_email(request.email, reset_token):
@@ -446,15 +572,13 @@ def forgot_password(request: ForgotPasswordRequest):
 # [Auth] 使用 token 重設密碼
 @app.post("/api/auth/reset-password")
 def reset_password_with_token(request: ResetWithTokenRequest):
-    user = users_collection.find_one({"reset_token": request.token})
-    if not user:
+    token = find_token(request.token, PURPOSE_PASSWORD_RESET)
+    if not token:
         raise HTTPException(status_code=400, detail="無效的重設連結")
     
     # 檢查是否過期
-    if user.get("reset_expires"):
-        expires = datetime.fromisoformat(user["reset_expires"])
-        if datetime.now() > expires:
-            raise HTTPException(status_code=400, detail="重設連結已過期，請重新申請")
+    if is_expired(token):
+        raise HTTPException(status_code=400, detail="重設連結已過期，請重新申請")
     
     # Password strength validation
     if len(request.new_password) < 8:
@@ -466,15 +590,14 @@ def reset_password_with_token(request: ResetWithTokenRequest):
     if not re.search(r'[0-9]', request.new_password):
         raise HTTPException(status_code=400, detail="密碼必須包含數字")
     
-    # 更新密碼並清除 token
+    # 清除 token (僅能使用一次) 並更新密碼
+    if not consume_token(token):
+        raise HTTPException(status_code=400, detail="無效的重設連結")
     users_collection.update_one(
-        {"_id": user["_id"]},
-        {"$set": {
-            "password": hash_password(request.new_password),
-            "reset_token": None,
-            "reset_expires": None
-        }}
+        {"_id": ObjectId(token["user_id"])},
+        {"$set": {"password": hash_password(request.new_password)}}
     )
+    revocations.bump(token["user_id"])  # 登出所有既有的登入
     
     return {"message": "密碼已重設成功，請使用新密碼登入"}
 
@@ -498,15 +621,15 @@ def create_ledger_invite(ledger_id: str, current_user: dict = Depends(get_curren
          # Let's stick to Owner only for control.
          raise HTTPException(status_code=403, detail="只有帳本擁有者可以產生邀請碼")
 
-    code = generate_invite_code()
-    expires = datetime.now() + timedelta(minutes=30) # 30 mins expiry
+    invite = invite_to_api(store_invite(ledger_id, user_id, timedelta(minutes=30))) # 30 mins expiry
     
+    # 帳本上保留最新邀請碼供成員面板顯示
     ledgers_collection.update_one(
         {"_id": ObjectId(ledger_id)},
-        {"$set": {"invite_code": code, "invite_expires": expires.isoformat()}}
+        {"$set": {"invite_code": invite["code"], "invite_expires": invite["expires_at"]}}
     )
     
-    return {"code": code, "expires_at": expires.isoformat()}
+    return {"code": invite["code"], "expires_at": invite["expires_at"]}
 
 # [Invite] 邀請人接受邀請碼 (將對方加入自己的家庭)
 # [Invite] 接受帳本邀請碼
@@ -515,20 +638,17 @@ def accept_invite(request: InviteCodeRequest, current_user: dict = Depends(get_c
     user_id = current_user["id"]
     code = request.code.upper().strip()
     
-    # Find ledger with this code
-    ledger = ledgers_collection.find_one({"invite_code": code})
-    if not ledger:
+    # Find invite by code (unique index; expired codes are removed by TTL index)
+    invite = find_invite(code)
+    if not invite:
         raise HTTPException(status_code=404, detail="邀請碼無效或已過期")
-        
-    # Check expiry
-    if ledger.get("invite_expires"):
-        expires = datetime.fromisoformat(ledger["invite_expires"])
-        if datetime.now() > expires:
-            raise HTTPException(status_code=400, detail="邀請碼已過期")
+    
+    ledger = ledgers_collection.find_one({"_id": ObjectId(invite["ledger_id"])})
+    if not ledger:
+        raise HTTPException(status_code=404, detail="帳本不存在")
             
     # Check if already member
-    members = ledger.get("members", [])
-    if user_id in members:
+    if has_access(user_id, LEDGER, str(ledger["_id"])):
          return {"message": "您已經是此帳本的成員了", "ledger_id": str(ledger["_id"])}
 
     # Add user to ledger
@@ -536,6 +656,7 @@ def accept_invite(request: InviteCodeRequest, current_user: dict = Depends(get_c
         {"_id": ledger["_id"]},
         {"$addToSet": {"members": user_id}}
     )
+    grant(user_id, LEDGER, str(ledger["_id"]))
     
     return {"message": f"成功加入帳本「{ledger['name']}」！", "ledger_id": str(ledger["_id"])}
 
@@ -546,23 +667,25 @@ def get_family_members(family_id: str):
     if not family:
         raise HTTPException(status_code=404, detail="家庭不存在")
     
+    # 成員與管理員一次查詢 ($in)
+    member_ids = family.get("members", [])
+    admin_id = family.get("admin_id")
+    profiles = resolve_members(member_ids + ([admin_id] if admin_id else []))
+    
     members = []
-    for member_id in family.get("members", []):
-        user = users_collection.find_one({"_id": ObjectId(member_id)})
+    for member_id in member_ids:
+        user = profiles.get(member_id)
         if user:
             members.append({
-                "id": str(user["_id"]),
+                "id": user["id"],
                 "username": user["username"],
                 "display_name": user["display_name"],
                 "role": user["role"]
             })
     
     admin_name = ""
-    admin_id = family.get("admin_id")
-    if admin_id:
-        admin_user = users_collection.find_one({"_id": ObjectId(admin_id)})
-        if admin_user:
-            admin_name = admin_user.get("display_name", "")
+    if admin_id and admin_id in profiles:
+        admin_name = profiles[admin_id].get("display_name") or ""
 
     return {"family_name": family["name"], "members": members, "admin_name": admin_name}
 
@@ -588,6 +711,7 @@ def leave_family(user_id: str):
         {"_id": ObjectId(user_id)},
         {"$set": {"family_id": None}}
     )
+    revoke(user_id, FAMILY, family_id)
     
     return {"message": "已離開家庭"}
 
@@ -600,7 +724,7 @@ def rename_family(request: RenameFamilyRequest, current_user: dict = Depends(get
     # Everyone in the family can rename (per user request)
     # Removed strict role check
     
-    family_id = current_user.get("family_id")
+    family_id = family_of(current_user["id"])
     if not family_id:
         raise HTTPException(status_code=400, detail="你尚未建立或加入家庭")
     
@@ -653,6 +777,7 @@ def create_ledger(request: CreateLedgerRequest, current_user: dict = Depends(get
     }
     
     result = ledgers_collection.insert_one(ledger)
+    grant(user_id, LEDGER, str(result.inserted_id), role="owner")
     
     return {"message": "帳本已建立", "id": str(result.inserted_id), "name": request.name.strip()}
 
@@ -661,14 +786,9 @@ def create_ledger(request: CreateLedgerRequest, current_user: dict = Depends(get
 def get_ledgers(current_user: dict = Depends(get_current_user)):
     user_id = current_user["id"]
     
-    # Get ledgers where user is owner or member
-    # Logic: Owner ID Match OR User ID in Members List
-    ledgers = list(ledgers_collection.find({
-        "$or": [
-            {"owner_id": user_id},
-            {"members": user_id}
-        ]
-    }))
+    # Get ledgers where user is owner or member (from memberships)
+    ledger_ids = [ObjectId(lid) for lid in scopes_for(user_id, LEDGER)]
+    ledgers = list(ledgers_collection.find({"_id": {"$in": ledger_ids}}))
     
     return [{
         "id": str(l["_id"]),
@@ -734,6 +854,7 @@ def delete_ledger(ledger_id: str, current_user: dict = Depends(get_current_user)
         raise HTTPException(status_code=400, detail=f"此帳本還有 {tx_count} 筆交易，請先刪除或移動交易")
     
     ledgers_collection.delete_one({"_id": ObjectId(ledger_id)})
+    revoke_scope(LEDGER, ledger_id)
     
     return {"message": "帳本已刪除"}
 
@@ -744,12 +865,14 @@ def get_ledger_members(ledger_id: str, current_user: dict = Depends(get_current_
     if not ledger:
         raise HTTPException(status_code=404, detail="帳本不存在")
         
+    member_ids = ledger.get("members", [])
+    profiles = resolve_members(member_ids)
     members = []
-    for member_id in ledger.get("members", []):
-         user = users_collection.find_one({"_id": ObjectId(member_id)})
+    for member_id in member_ids:
+         user = profiles.get(member_id)
          if user:
              members.append({
-                 "id": str(user["_id"]),
+                 "id": user["id"],
                  "display_name": user["display_name"],
                  "username": user["username"],
                  "role": "owner" if member_id == ledger.get("owner_id") else "member"
@@ -775,6 +898,7 @@ def remove_ledger_member(ledger_id: str, member_id: str, current_user: dict = De
         {"_id": ObjectId(ledger_id)},
         {"$pull": {"members": member_id}}
     )
+    revoke(member_id, LEDGER, ledger_id)
     
     return {"message": "成員已移除"}
 
@@ -793,6 +917,7 @@ def leave_ledger(ledger_id: str, current_user: dict = Depends(get_current_user))
         {"_id": ObjectId(ledger_id)},
         {"$pull": {"members": user_id}}
     )
+    revoke(user_id, LEDGER, ledger_id)
     
     return {"message": "已離開帳本"}
 
@@ -821,6 +946,7 @@ def direct_add_member(admin_id: str, member_id: str):
         result = families_collection.insert_one(family)
         family_id = str(result.inserted_id)
         users_collection.update_one({"_id": ObjectId(admin_id)}, {"$set": {"family_id": family_id}})
+        grant(admin_id, FAMILY, family_id, role="admin")
     
     # Add to family
     families_collection.update_one(
@@ -831,6 +957,7 @@ def direct_add_member(admin_id: str, member_id: str):
         {"_id": ObjectId(member_id)},
         {"$set": {"family_id": family_id}}
     )
+    grant(member_id, FAMILY, family_id)
     
     return {"message": f"已將 {user['display_name']} 加入家庭"}
 
@@ -861,6 +988,7 @@ def remove_member(admin_id: str, member_id: str):
         {"_id": ObjectId(member_id)},
         {"$set": {"family_id": None}}
     )
+    revoke(member_id, FAMILY, family_id)
     
     # 額外安全性檢查：如果 member_id 是字串但資料庫存的是 ObjectId (或反之)
     # 此處邏輯通常會成功，因為我們在 /api/family/members 回傳的是字串，
@@ -928,6 +1056,8 @@ def update_profile(request: UpdateProfileRequest, current_user: dict = Depends(g
         {"_id": ObjectId(current_user["id"])},
         {"$set": {"display_name": request.display_name.strip()}}
     )
+    invalidate_member(current_user["id"])
+    bump_data_versions([current_user["id"]])  # 匯出檔含記帳人名稱，舊快取失效
     
     return {"message": "個人資料已更新", "display_name": request.display_name.strip()}
 
@@ -948,6 +1078,7 @@ def register_user(user: UserCreate, current_user: dict = Depends(get_current_use
         "created_at": datetime.now().isoformat()
     }
     result = users_collection.insert_one(new_user)
+    seed_user_defaults(str(result.inserted_id))
     return {"message": "註冊成功", "id": str(result.inserted_id)}
 
 # [Users] 修改個人密碼 (需驗證原密碼)
@@ -965,12 +1096,13 @@ def change_password(request: ChangePasswordRequest, current_user: dict = Depends
     if not verify_password(request.old_password, user["password"]):
         raise HTTPException(status_code=400, detail="原密碼錯誤")
     
-    # 更新新密碼
+    # 更新新密碼，並撤銷先前簽發的所有 Token
     users_collection.update_one(
         {"_id": ObjectId(current_user["id"])},
         {"$set": {"password": hash_password(request.new_password)}}
     )
-    return {"message": "密碼修改成功"}
+    version = revocations.bump(current_user["id"])
+    return {"message": "密碼修改成功", "token": create_access_token(data=build_claims(user, version))}
 
 # [Users] 發送刪除帳號驗證碼
 class SendDeleteCodeRequest(BaseModel):
@@ -996,27 +1128,13 @@ def send_delete_code(request: SendDeleteCodeRequest, current_user: dict = Depend
         raise HTTPException(status_code=400, detail="未設定 Email，無法發送驗證碼")
     
     # Generate 6-digit code
-    delete_code = ''.join(random.choices('0123456789', k=6))
-    expires = datetime.now() + timedelta(minutes=10)
+    delete_code = ''.join(secrets.choice('0123456789') for _ in range(6))
     
-    # Store code
-    users_collection.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$set": {"delete_code": delete_code, "delete_code_expires": expires.isoformat()}}
-    )
-    
-    # Send email
-    smtp_email = os.getenv("SMTP_EMAIL")
-    smtp_password = os.getenv("SMTP_PASSWORD")
-    smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-    smtp_port = int(os.getenv("SMTP_PORT", "587"))
+    # Store code (hashed, scoped to this user)
+    issue_token(delete_code, user_id, PURPOSE_ACCOUNT_DELETE, timedelta(minutes=10), scoped=True)
     
+    # Send email (queued; delivered by the background sender)
     try:
-        msg = MIMEMultipart()
-        msg['From'] = smtp_email
-        msg['To'] = user["email"]
-        msg['Subject'] = "⚠️ PyMoney 帳號刪除驗證碼"
-        
         body = f"""
         <html>
         <body style="font-family: Arial, sans-serif; padding: 20px;">
@@ -1030,13 +1148,7 @@ def send_delete_code(request: SendDeleteCodeRequest, current_user: dict = Depend
         </body>
         </html>
         """
-        msg.attach(MIMEText(body, 'html'))
-        
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_email, smtp_password)
-        server.send_message(msg)
-        server.quit()
+        enqueue_email(user["email"], "⚠️ PyMoney 帳號刪除驗證碼", body)
         
         return {"message": "驗證碼已發送至您的信箱"}
     except Exception as e:
@@ -1064,14 +1176,15 @@ def delete_me(request: DeleteAccountRequest, current_user: dict = Depends(get_cu
         raise HTTPException(status_code=400, detail="密碼錯誤")
     
     # Verify delete code
-    if not user.get("delete_code") or user["delete_code"] != request.delete_code:
+    token = find_token(request.delete_code, PURPOSE_ACCOUNT_DELETE, user_id)
+    if not token:
         raise HTTPException(status_code=400, detail="驗證碼錯誤")
     
     # Check if code expired
-    if user.get("delete_code_expires"):
-        expires = datetime.fromisoformat(user["delete_code_expires"])
-        if datetime.now() > expires:
-            raise HTTPException(status_code=400, detail="驗證碼已過期，請重新發送")
+    if is_expired(token):
+        raise HTTPException(status_code=400, detail="驗證碼已過期，請重新發送")
+    if not consume_token(token):
+        raise HTTPException(status_code=400, detail="驗證碼錯誤")
     
     # 如果使用者在家庭中，先將其移出
     family_id = user.get("family_id")
@@ -1080,8 +1193,11 @@ def delete_me(request: DeleteAccountRequest, current_user: dict = Depends(get_cu
             {"_id": ObjectId(family_id)},
             {"$pull": {"members": user_id}}
         )
+        revoke(user_id, FAMILY, family_id)
 
     users_collection.delete_one({"_id": ObjectId(user_id)})
+    invalidate_member(user_id)
+    revocations.bump(user_id)
     return {"message": "帳號已成功刪除"}
 
 # [交易] 讀取
@@ -1102,13 +1218,10 @@ def get_transactions(
     
     # STEP 1: 帳本篩選優先
     if ledger_id and ledger_id != "all":
-        # 驗證用戶是否為該帳本的成員
-        ledger = ledgers_collection.find_one({"_id": ObjectId(ledger_id)})
-        if not ledger:
-            raise HTTPException(status_code=404, detail="帳本不存在")
-        
-        # 檢查當前用戶是否為成員
-        if current_user["id"] not in ledger.get("members", []):
+        # 驗證用戶是否為該帳本的成員 (memberships 索引查詢 / 快取)
+        if not has_access(current_user["id"], LEDGER, ledger_id):
+            if not ObjectId.is_valid(ledger_id) or not ledgers_collection.find_one({"_id": ObjectId(ledger_id)}, {"_id": 1}):
+                raise HTTPException(status_code=404, detail="帳本不存在")
             raise HTTPException(status_code=403, detail="您不是此帳本的成員")
         
         # ✅ 只按 ledger_id 篩選，返回所有成員的交易
@@ -1117,13 +1230,7 @@ def get_transactions(
     # STEP 2: 「所有帳本」視圖
     else:
         # 獲取用戶所屬的所有帳本ID
-        user_ledgers = list(ledgers_collection.find({
-            "$or": [
-                {"owner_id": current_user["id"]},
-                {"members": current_user["id"]}
-            ]
-        }))
-        user_ledger_ids = [str(l["_id"]) for l in user_ledgers]
+        user_ledger_ids = scopes_for(current_user["id"], LEDGER)
         
         # 查詢條件：用戶自己的交易 OR 所屬帳本的交易
         if user_ledger_ids:
@@ -1206,7 +1313,11 @@ def get_transactions(
 def create_transaction(tx: Transaction, current_user: dict = Depends(get_current_user)):
     data = tx.dict()
     data["user_id"] = current_user["id"]  # Always set from token for security
+    stamp_amount_base(data)
     result = collection.insert_one(data)
+    apply_transactions([data])
+    learn_categories([data])
+    observe_titles([data])
     return {"message": "新增成功", "id": str(result.inserted_id)}
 
 # [交易] 更新
@@ -1218,7 +1329,18 @@ def update_transaction(id: str, tx: Transaction, current_user: dict = Depends(ge
     # IDOR Protection: verify ownership or admin
     if existing.get("user_id") != current_user["id"] and current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="無權修改此交易")
-    collection.update_one({"_id": ObjectId(id)}, {"$set": tx.dict()})
+    new_data = stamp_amount_base(tx.dict())
+    # 使用者儲存的分類即為確認過的分類，不再視為自動分類
+    old = collection.find_one_and_update(
+        {"_id": ObjectId(id)}, {"$set": new_data, "$unset": {"category_auto": ""}}
+    )
+    if old:
+        updated = {k: v for k, v in {**old, **new_data}.items() if k != "category_auto"}
+        replace_transaction(old, updated)
+        learn_categories([old], sign=-1)
+        learn_categories([updated])
+        observe_titles([old], sign=-1)
+        observe_titles([updated])
     return {"message": "更新成功"}
 
 # [交易] 刪除
@@ -1230,7 +1352,10 @@ def delete_transaction(id: str, current_user: dict = Depends(get_current_user)):
     # IDOR Protection: verify ownership or admin
     if existing.get("user_id") != current_user["id"] and current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="無權刪除此交易")
-    collection.delete_one({"_id": ObjectId(id)})
+    if collection.delete_one({"_id": ObjectId(id)}).deleted_count:
+        apply_transactions([existing], sign=-1)
+        learn_categories([existing], sign=-1)
+        observe_titles([existing], sign=-1)
     return {"message": "刪除成功"}
 
 # [Dashboard] 圓餅圖
@@ -1257,35 +1382,37 @@ def get_category_stats(
 
     pipeline = [
         {"$match": match_stage},
-        {"$group": {"_id": "$category", "total": {"$sum": "$amount"}}}
+        {"$group": {"_id": "$category", "total": {"$sum": AMOUNT_BASE_EXPR}}}
     ]
     result = list(collection.aggregate(pipeline))
     return {item["_id"]: item["total"] for item in result}
 
 # [Dashboard] 長條圖
 @app.get("/api/dashboard/trend")
-def get_trend_stats(user_id: Optional[str] = None, user_ids: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+def get_trend_stats(
+    user_id: Optional[str] = None,
+    user_ids: Optional[str] = None,
+    granularity: str = "day",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail="granularity 必須是 day / week / month / year")
+    try:
+        start, end = resolve_range(granularity, start, end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式需為 YYYY-MM-DD，且開始日期不能晚於結束日期")
+
     match_stage = {}
     member_ids = get_user_ids_to_filter(user_id, user_ids)
     if member_ids:
         match_stage["user_id"] = {"$in": member_ids}
 
-    pipeline = [
-        {"$match": match_stage}, 
-        {"$sort": {"date": 1}},  
-        {"$group": {"_id": "$date", "income": {
-            "$sum": {"$cond": [{"$eq": ["$type", "income"]}, "$amount", 0]}
-        }, "expense": {
-            "$sum": {"$cond": [{"$eq": ["$type", "expense"]}, "$amount", 0]}
-        }}},
-        {"$sort": {"_id": 1}}
-    ]
-    result = list(collection.aggregate(pipeline))
-    return {
-        "labels": [item["_id"] for item in result],
-        "incomes": [item["income"] for item in result],
-        "expenses": [item["expense"] for item in result]
-    }
+    try:
+        return get_trend(match_stage, granularity, start, end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="查詢區間過長，請縮小範圍或改用較大的時間單位")
 
 # [預算] 讀取
 @app.get("/api/budget")
@@ -1311,53 +1438,32 @@ def set_budget(budget: BudgetSetting):
 # [匯出] Excel
 from fastapi.responses import StreamingResponse
 
-@app.get("/api/export")
-def export_excel(
-    user_ids: Optional[str] = None,  # ✅ NEW: 允許篩選用戶
-    current_user: dict = Depends(get_current_user)
-):
-    # ✅ 構建查詢條件，支持用戶篩選
+def resolve_export_scope(user_ids: Optional[str], current_user: dict) -> Optional[List[str]]:
+    """匯出範圍：排序後的用戶ID列表，None 表示全部 (僅管理員)"""
     if user_ids:
         # 解析用戶ID列表
-        ids_list = [uid.strip() for uid in user_ids.split(',') if uid.strip()]
+        ids_list = sorted({uid.strip() for uid in user_ids.split(',') if uid.strip()})
         
         # 權限檢查：管理員可以匯出任何人，一般用戶只能匯出自己
         if current_user.get("role") != "admin":
             # 檢查是否只選擇了自己
-            if len(ids_list) != 1 or ids_list[0] != current_user["id"]:
+            if ids_list != [current_user["id"]]:
                 raise HTTPException(status_code=403, detail="無權匯出其他用戶資料")
-        
-        query = {"user_id": {"$in": ids_list}}
-    else:
-        # 原本邏輯：管理員全部，一般用戶只查自己
-        query = {} if current_user.get("role") == "admin" else {"user_id": current_user["id"]}
-    
-    data = list(collection.find(query).sort("date", -1))
-    if not data:
-        raise HTTPException(status_code=404, detail="無資料")
-    
-    # ✅ 添加用戶名稱欄位
-    for doc in data:
-        doc["_id"] = str(doc["_id"])
-        # 查詢記帳人名稱
-        if doc.get("user_id"):
-            user = users_collection.find_one({"_id": ObjectId(doc["user_id"])})
-            if user:
-                doc["user_display_name"] = user.get("display_name", "Unknown")
-            else:
-                doc["user_display_name"] = "Unknown"
-        else:
-            doc["user_display_name"] = "Unknown"
-    
-    df = pd.DataFrame(data)
-    # ✅ 添加 user_display_name 到匯出欄位
-    cols = ["date", "type", "category", "title", "amount", "payment_method", "note", "user_display_name"]
-    df = df[[c for c in cols if c in df.columns]]
+        return ids_list
+    # 原本邏輯：管理員全部，一般用戶只查自己
+    return None if current_user.get("role") == "admin" else [current_user["id"]]
+
+@app.get("/api/export")
+def export_excel(
+    user_ids: Optional[str] = None,  # ✅ NEW: 允許篩選用戶
+    current_user: dict = Depends(get_current_user)
+):
+    scope = resolve_export_scope(user_ids, current_user)
     
     # Use in-memory buffer
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Transactions')
+    if not write_export_xlsx(scope, output):
+        raise HTTPException(status_code=404, detail="無資料")
     output.seek(0)
     
     filename = "PyMoney_Export.xlsx"
@@ -1367,7 +1473,66 @@ def export_excel(
     return StreamingResponse(
         output, 
         headers=headers, 
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        media_type=XLSX_MEDIA_TYPE
+    )
+
+# [匯出] 背景工作：檔案存於 GridFS，相同篩選條件且資料未變動時直接重用
+class ExportJobRequest(BaseModel):
+    user_ids: Optional[str] = None
+
+def get_export_job_for(job_id: str, current_user: dict) -> dict:
+    job = get_export_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="匯出工作不存在或已過期")
+    if not can_access_job(job, current_user):
+        raise HTTPException(status_code=403, detail="無權存取此匯出工作")
+    return job
+
+@app.post("/api/export/jobs")
+def create_export_job(request: ExportJobRequest, current_user: dict = Depends(get_current_user)):
+    scope = resolve_export_scope(request.user_ids, current_user)
+    job, cached = submit_export(scope, current_user["id"])
+    return {**job, "cached": cached}
+
+@app.get("/api/export/jobs/{job_id}")
+def get_export_job_status(job_id: str, current_user: dict = Depends(get_current_user)):
+    return export_job_to_api(get_export_job_for(job_id, current_user))
+
+@app.get("/api/export/jobs/{job_id}/download")
+def download_export_job(
+    job_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    current_user: dict = Depends(get_current_user)
+):
+    job = get_export_job_for(job_id, current_user)
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail="匯出尚未完成")
+    if not job.get("file_id"):
+        raise HTTPException(status_code=404, detail="無資料")
+    
+    grid_out = open_export_file(job)
+    size = grid_out.length
+    headers = {
+        'Content-Disposition': 'attachment; filename="PyMoney_Export.xlsx"',
+        'Accept-Ranges': 'bytes'
+    }
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return JSONResponse(status_code=416, content={"detail": "請求範圍無效"},
+                            headers={'Content-Range': f'bytes */{size}'})
+    
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    headers['Content-Length'] = str(end - start + 1)
+    return StreamingResponse(
+        iter_file_range(grid_out, start, end),
+        status_code=status_code,
+        headers=headers,
+        media_type=XLSX_MEDIA_TYPE
     )
 
 @app.get("/api/import/sample")
@@ -1393,22 +1558,21 @@ def get_import_sample(format: str = "csv"):
             "note": "Income"
         }
     ]
-    df = pd.DataFrame(data)
-    
     if format == "csv":
         output = io.StringIO()
-        df.to_csv(output, index=False, encoding="utf-8-sig")
-        mem = io.BytesIO()
-        mem.write(output.getvalue().encode('utf-8-sig'))
-        mem.seek(0)
+        writer = csv.DictWriter(output, fieldnames=list(data[0].keys()))
+        writer.writeheader()
+        writer.writerows(data)
+        mem = io.BytesIO(output.getvalue().encode('utf-8-sig'))
         
         filename = "PyMoney_Import_Sample.csv"
         headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
         return StreamingResponse(mem, headers=headers, media_type="text/csv")
     else:
+        import pandas as pd
         output = io.BytesIO()
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False)
+            pd.DataFrame(data).to_excel(writer, index=False)
         output.seek(0)
         
         filename = "PyMoney_Import_Sample.xlsx"
@@ -1421,74 +1585,119 @@ def get_import_sample(format: str = "csv"):
 
 # [匯入] Excel/CSV (新功能!)
 @app.post("/api/import")
-async def import_file(
+def import_file(
     file: UploadFile = File(...), 
     ledger_id: Optional[str] = Form(None),  # ✅ FIXED: Use Form() to accept from FormData
+    dry_run: bool = Form(False),  # 只檢查不寫入，回傳每列錯誤
     current_user: dict = Depends(get_current_user)
 ):
     try:
-        contents = await file.read()
+        # 直接從暫存檔解析，不把整個上傳內容複製到記憶體
+        upload = file.file
+        upload.seek(0)
         
-        # 判斷副檔名
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(contents))
-        elif file.filename.endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(io.BytesIO(contents))
-        else:
+        # 判斷副檔名 (CSV 以 csv 模組串流解析，Excel 才載入 pandas)
+        try:
+            columns, rows = read_rows(upload, file.filename)
+        except ValueError:
             raise HTTPException(status_code=400, detail="不支援的檔案格式，請上傳 CSV 或 Excel")
 
         # 資料處理與檢查
-        required_cols = ["date", "title", "amount", "category"]
-        for col in required_cols:
-            if col not in df.columns:
-                 raise HTTPException(status_code=400, detail=f"檔案缺少欄位: {col}")
-
-        # 填補缺失值 (預設值)
-        if "type" not in df.columns: df["type"] = "expense"
-        if "payment_method" not in df.columns: df["payment_method"] = "Cash"
-        
-        # 轉成字典列表
-        records = df.to_dict(orient="records")
-        
-        # 補上 user_id 和 ledger_id，並處理日期
-        final_records = []
-        for r in records:
-            # 確保有 user_id
-            r["user_id"] = current_user["id"]
-            
-            # NEW: 設置 ledger_id (如果有提供且不是 'all')
-            if ledger_id and ledger_id != "all":
-                # Verify user has access to this ledger
-                ledger = ledgers_collection.find_one({"_id": ObjectId(ledger_id)})
-                if ledger and current_user["id"] in ledger.get("members", []):
-                    r["ledger_id"] = ledger_id
-                # If ledger not found or user not a member, don't set ledger_id
-            
-            # 處理日期 (確保是 datetime 物件，方便 MongoDB 查詢與排序)
-            try:
-                # 使用 pandas 強大的日期解析功能，支援多種格式 (2024/1/1, 2024-01-01, etc.)
-                if r.get("date"):
-                    dt = pd.to_datetime(r["date"])
-                    r["date"] = dt.strftime("%Y-%m-%d")
-                else:
-                    r["date"] = datetime.now().strftime("%Y-%m-%d")
-            except Exception as e:
-                print(f"Date parse error for {r.get('date')}: {e}")
-                # 若日期格式真的無法解析，設為今天，避免匯入失敗
-                r["date"] = datetime.now().strftime("%Y-%m-%d")
+        for col in missing_columns(columns):
+            raise HTTPException(status_code=400, detail=f"檔案缺少欄位: {col}")
+
+        # 第一輪：逐批檢查整個檔案 (不寫入)，一次回報所有錯誤列
+        report = validate_upload(rows, Fingerprinter(current_user["id"]) if dry_run else None, IMPORT_CHUNK_SIZE)
+        if dry_run:
+            return {"dry_run": True, **report.to_api()}
+        if report.error_rows:
+            first = report.errors[0]
+            return JSONResponse(status_code=400, content={
+                "detail": f"共 {report.error_rows} 列資料有誤，未匯入任何資料 (第 {first['row']} 列: {'、'.join(first['errors'])})",
+                **report.to_api()
+            })
+
+        # 帳本權限只檢查一次 (沒有權限時不設定 ledger_id)
+        target_ledger = None
+        if ledger_id and ledger_id != "all" and has_access(current_user["id"], LEDGER, ledger_id):
+            target_ledger = ledger_id
+
+        # 第二輪：逐批正規化並寫入，記憶體用量與檔案大小無關
+        upload.seek(0)
+        _, rows = read_rows(upload, file.filename)
+        date_parser = DateParser()
+        fingerprint = Fingerprinter(current_user["id"])
+        categorizer = get_categorizer(current_user["id"])
+        imported = 0
+        skipped = 0
+        auto_categorized = 0
+        for chunk in chunked(rows, IMPORT_CHUNK_SIZE):
+            final_records, _ = validate_chunk(chunk, date_parser, 0)
+            for r in final_records:
+                # 沒有分類或只有「其他」時，依使用者過去的記帳自動分類 (標記後不納入學習)
+                if is_generic(r.get("category")):
+                    category, _ = categorizer.predict(r["title"], r["type"])
+                    if category:
+                        auto_categorized += 1
+                        r["category_auto"] = True
+                    r["category"] = category or r.get("category") or FALLBACK_CATEGORY
+                r["user_id"] = current_user["id"]
+                if target_ledger:
+                    r["ledger_id"] = target_ledger
+                r["import_fingerprint"] = fingerprint(r)
+                stamp_amount_base(r)
             
-            final_records.append(r)
+            # 寫入資料庫 (每批一次查詢已存在的指紋，略過重複匯入的資料)
+            inserted, duplicates = insert_new(final_records)
+            if inserted:
+                apply_transactions(inserted)
+                learn_categories(inserted)  # 自動分類的資料 (category_auto) 不會被計入
+                observe_titles(inserted)
+            imported += len(inserted)
+            skipped += duplicates
         
-        # 寫入資料庫
-        if final_records:
-            collection.insert_many(final_records)
-            
-        return {"message": f"成功匯入 {len(final_records)} 筆資料"}
+        message = f"成功匯入 {imported} 筆資料"
+        if skipped:
+            message += f"，略過 {skipped} 筆重複資料"
+        if auto_categorized:
+            message += f"，自動分類 {auto_categorized} 筆"
+        return {"message": message, "imported": imported, "skipped_duplicates": skipped,
+                "auto_categorized": auto_categorized}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Import error: {e}")
         raise HTTPException(status_code=500, detail=f"匯入失敗: {str(e)}")
 
+# [分類] 依使用者的歷史記帳批次推薦分類
+MAX_CATEGORIZE_ITEMS = 100000
+
+class CategorizeItem(BaseModel):
+    title: str
+    type: str = "expense"
+
+class CategorizeRequest(BaseModel):
+    items: List[CategorizeItem]
+
+@app.post("/api/categorize")
+def categorize(request: CategorizeRequest, current_user: dict = Depends(get_current_user)):
+    if len(request.items) > MAX_CATEGORIZE_ITEMS:
+        raise HTTPException(status_code=400, detail=f"一次最多 {MAX_CATEGORIZE_ITEMS} 筆")
+    categorizer = get_categorizer(current_user["id"])
+    results = []
+    for item in request.items:
+        category, confidence = categorizer.predict(item.title, item.type)
+        results.append({"category": category, "confidence": confidence})
+    return {"results": results}
+
+# [快速記帳] 標題自動完成：依使用次數排序，附上常用分類、金額與付款方式 (記憶體內查詢)
+@app.get("/api/suggest")
+def get_title_suggestions(prefix: str = "", limit: int = 5, current_user: dict = Depends(get_current_user)):
+    if limit < 1 or limit > 20:
+        raise HTTPException(status_code=400, detail="limit 需介於 1 到 20")
+    return suggest_titles(current_user["id"], prefix, limit)
+
 # --- Helper: 取得有效成員 ID 列表 (對應各 API) ---
 def get_user_ids_to_filter(user_id: Optional[str] = None, user_ids: Optional[str] = None) -> List[str]:
     if user_ids:
@@ -1496,24 +1705,15 @@ def get_user_ids_to_filter(user_id: Optional[str] = None, user_ids: Optional[str
     if not user_id:
         return []
         
-    # 嘗試先用 username 找，若找不到再當作 ObjectId 找
-    user = users_collection.find_one({"username": user_id})
-    if not user:
-        try:
-            user = users_collection.find_one({"_id": ObjectId(user_id)})
-        except:
-            pass
+    # ID 直接查 memberships；username 才需要查一次使用者
+    uid = resolve_principal(user_id)
+    if not uid:
+        return [user_id]
     
-    if user:
-        uid = str(user["_id"])
-        family_id = user.get("family_id")
-        if family_id:
-            family = families_collection.find_one({"_id": ObjectId(family_id)})
-            if family:
-                return family.get("members", [])
-        return [uid]
-        
-    return [user_id]
+    family_id = family_of(uid)
+    if family_id:
+        return principals_in(FAMILY, family_id)
+    return [uid]
 
 # [Dashboard] 帳戶餘額統計 (新功能!)
 @app.get("/api/dashboard/accounts")
@@ -1521,60 +1721,8 @@ def get_account_stats(user_id: Optional[str] = None, user_ids: Optional[str] = N
     # 取得有效成員列表
     member_ids = get_user_ids_to_filter(user_id, user_ids)
     
-    # 建構過濾條件
-    match_stage = {}
-    if member_ids:
-        match_stage["user_id"] = {"$in": member_ids}
-    
-    # 1. 計算 Source (付款/轉出) 造成的餘額變動
-    pipeline_source = [
-        {"$match": match_stage},
-        {"$group": {
-            "_id": "$payment_method",
-            "balance": {
-                "$sum": {
-                    "$switch": {
-                        "branches": [
-                            {"case": {"$eq": ["$type", "income"]}, "then": "$amount"},
-                            {"case": {"$eq": ["$type", "expense"]}, "then": {"$multiply": ["$amount", -1]}},
-                            {"case": {"$eq": ["$type", "transfer"]}, "then": {"$multiply": ["$amount", -1]}} # 轉出扣款
-                        ],
-                        "default": 0
-                    }
-                }
-            }
-        }}
-    ]
-    source_res = list(collection.aggregate(pipeline_source))
-    
-    # 2. 計算 Target (轉入) 造成的餘額增加
-    pipeline_target = [
-        {"$match": {"type": "transfer", "target_account": {"$exists": True, "$ne": None}}},
-        {"$match": match_stage},  # Add filtering here too
-        {"$group": {
-            "_id": "$target_account", 
-            "balance": {"$sum": "$amount"} # 轉入增加
-        }}
-    ]
-    target_res = list(collection.aggregate(pipeline_target))
-    
-    # 3. 合併結果
-    balances = {}
-    for item in source_res:
-        if item["_id"]:
-            balance_val = item.get("balance", 0)
-            # 防止 NaN 值
-            if balance_val is None or (isinstance(balance_val, float) and not (balance_val == balance_val)):
-                balance_val = 0
-            balances[item["_id"]] = balances.get(item["_id"], 0) + balance_val
-        
-    for item in target_res:
-        if item["_id"]:
-            balance_val = item.get("balance", 0)
-            # 防止 NaN 值
-            if balance_val is None or (isinstance(balance_val, float) and not (balance_val == balance_val)):
-                balance_val = 0
-            balances[item["_id"]] = balances.get(item["_id"], 0) + balance_val
+    # 餘額於每次寫入時以 $inc 維護 (account_balances)，這裡只需讀取各帳戶
+    balances = get_balances(member_ids)
         
     # 轉回 List + 排序，並再次驗證
     import math
@@ -1587,50 +1735,35 @@ def get_account_stats(user_id: Optional[str] = None, user_ids: Optional[str] = N
     
     return sorted(result, key=lambda x: x["account"])
 
+# [Dashboard] 帳戶餘額預測 (30 / 90 / 365 天)
+@app.get("/api/dashboard/forecast")
+def get_balance_forecast(
+    user_id: Optional[str] = None,
+    user_ids: Optional[str] = None,
+    horizons: str = "30,90,365",
+    trailing_days: int = 90
+):
+    try:
+        horizon_list = sorted({int(h) for h in horizons.split(",") if h.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="horizons 格式錯誤，例如 30,90,365")
+    if not horizon_list or horizon_list[0] < 1 or horizon_list[-1] > 3650:
+        raise HTTPException(status_code=400, detail="預測天數需介於 1 到 3650 天")
+    if trailing_days < 1:
+        raise HTTPException(status_code=400, detail="trailing_days 必須大於 0")
+    
+    balances = {item["account"]: item["balance"] for item in get_account_stats(user_id, user_ids)}
+    member_ids = get_user_ids_to_filter(user_id, user_ids)
+    return forecast(balances, member_ids, horizons=tuple(horizon_list), trailing_days=trailing_days)
+
 
 
 # --- 匯率 API ---
-_rates_cache = {"timestamp": 0, "data": {}}
-
 @app.get("/api/rates/{target}")
 def get_rate(target: str):
-    global _rates_cache
-    target = target.upper()
-    now = time.time()
-    
-    # 簡單快取 (1小時)
-    if now - _rates_cache["timestamp"] > 3600 or "USDTWD" not in _rates_cache["data"]:
-        try:
-            with urllib.request.urlopen("https://tw.rter.info/capi.php") as url:
-                _rates_cache["data"] = json.loads(url.read().decode())
-                _rates_cache["timestamp"] = now
-        except Exception as e:
-            # print(f"Rate fetch failed: {e}")
-            pass
-            
-    data = _rates_cache["data"]
-    
-    # Default fallback if empty
-    if "USDTWD" not in data:
-         return {"rate": 1.0}
-         
-    usd_twd = data["USDTWD"]["Exrate"]
-    utc_str = data["USDTWD"].get("UTC", "")
-    
-    if target == "TWD":
-        return {"rate": 1.0}
-
-    if target == "USD":
-        return {"rate": usd_twd, "updated_at": utc_str}
-    
-    key = f"USD{target}"
-    if key not in data:
-        return {"rate": 1.0, "updated_at": utc_str}
-        
-    usd_target = data[key]["Exrate"]
-    
-    # 1 Target = (USDTWD / USDTarget) TWD
-    rate = usd_twd / usd_target
+    rate, utc_str = get_base_rate(target)
+    if target.upper() == BASE_CURRENCY or not utc_str:
+        return {"rate": rate}
     return {"rate": rate, "updated_at": utc_str}
 
 # ============================================================
@@ -1681,6 +1814,7 @@ class RecurringTransaction(BaseModel):
     next_date: str
     is_active: bool = True
     user_id: Optional[str] = None
+    anchor_day: Optional[int] = None  # 每月/每年的固定日 (月底自動調整)
 
 @app.get("/api/recurring")
 def get_recurring(user_id: Optional[str] = None):
@@ -1690,15 +1824,41 @@ def get_recurring(user_id: Optional[str] = None):
     items = recurring_collection.find(query).sort("next_date", 1)
     return [fix_id(r) for r in items]
 
+MAX_OCCURRENCES = 5000
+
+@app.get("/api/recurring/occurrences")
+def get_recurring_occurrences(start: str, end: str, user_id: Optional[str] = None, limit: int = MAX_OCCURRENCES):
+    """展開指定期間內所有重複交易的發生日 (行事曆/預測用，不寫入資料庫)"""
+    if limit < 1 or limit > MAX_OCCURRENCES:
+        raise HTTPException(status_code=400, detail=f"limit 需介於 1 到 {MAX_OCCURRENCES}")
+    try:
+        if datetime.strptime(start, "%Y-%m-%d") > datetime.strptime(end, "%Y-%m-%d"):
+            raise HTTPException(status_code=400, detail="開始日期不能晚於結束日期")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式需為 YYYY-MM-DD")
+    
+    query = {"is_active": True, "next_date": {"$lte": end}}
+    if user_id:
+        query["user_id"] = user_id
+    rules = recurring_collection.find(query)
+    return list(islice(expand_occurrences(rules, start, end), limit))
+
 @app.post("/api/recurring")
 def create_recurring(recurring: RecurringTransaction):
     data = recurring.dict()
+    if not data.get("anchor_day"):
+        data["anchor_day"] = anchor_day_for(data["next_date"])
     result = recurring_collection.insert_one(data)
     return {"message": "重複交易建立成功", "id": str(result.inserted_id)}
 
 @app.put("/api/recurring/{id}")
 def update_recurring(id: str, recurring: RecurringTransaction):
-    recurring_collection.update_one({"_id": ObjectId(id)}, {"$set": recurring.dict()})
+    data = recurring.dict()
+    if not data.get("anchor_day"):
+        # 前端不會傳 anchor_day：保留原本的固定日 (例如每月 31 日在 2/28 時仍是 31)
+        stored = recurring_collection.find_one({"_id": ObjectId(id)}, {"anchor_day": 1, "next_date": 1})
+        data["anchor_day"] = anchor_day_after_edit(stored, data["next_date"])
+    recurring_collection.update_one({"_id": ObjectId(id)}, {"$set": data})
     return {"message": "更新成功"}
 
 @app.delete("/api/recurring/{id}")
@@ -1713,48 +1873,12 @@ def execute_recurring(id: str):
     if not recurring:
         raise HTTPException(status_code=404, detail="找不到重複交易")
     
-    # 建立實際交易
-    tx_data = {
-        "title": recurring["title"],
-        "amount": recurring["amount"],
-        "category": recurring["category"],
-        "type": recurring["type"],
-        "payment_method": recurring["payment_method"],
-        "note": recurring.get("note", ""),
-        "date": recurring["next_date"],
-        "currency": "TWD",
-        "user_id": recurring.get("user_id")
-    }
-    collection.insert_one(tx_data)
-    
-    # 計算下次日期
-    current = datetime.strptime(recurring["next_date"], "%Y-%m-%d")
-    freq = recurring["frequency"]
-    if freq == "daily":
-        next_dt = current + timedelta(days=1)
-    elif freq == "weekly":
-        next_dt = current + timedelta(weeks=1)
-    elif freq == "monthly":
-        # 加一個月
-        month = current.month + 1
-        year = current.year
-        if month > 12:
-            month = 1
-            year += 1
-        day = min(current.day, 28)  # 避免月底問題
-        next_dt = current.replace(year=year, month=month, day=day)
-    elif freq == "yearly":
-        next_dt = current.replace(year=current.year + 1)
-    else:
-        next_dt = current + timedelta(days=30)
-    
-    # 更新下次日期
-    recurring_collection.update_one(
-        {"_id": ObjectId(id)},
-        {"$set": {"next_date": next_dt.strftime("%Y-%m-%d")}}
-    )
+    # 建立實際交易並更新下次日期 (同一期重複執行不會重複入帳)
+    next_date = execute_one(recurring)
+    if next_date is None:
+        raise HTTPException(status_code=409, detail="此重複交易已被執行，請重新整理")
     
-    return {"message": "交易已執行", "next_date": next_dt.strftime("%Y-%m-%d")}
+    return {"message": "交易已執行", "next_date": next_date}
 
 # ============================================================
 # Phase 4: 分類預算 (Category Budgets)
@@ -1803,17 +1927,19 @@ def get_category_budget_status(month: Optional[str] = None, user_id: Optional[st
         budget_query["user_id"] = user_id
     budgets = {b["category"]: b["limit"] for b in category_budgets_collection.find(budget_query)}
     
-    # 計算各分類支出
-    start_date = f"{month}-01"
-    end_date = f"{month}-31"
+    # 計算各分類支出 (半開區間 [本月1日, 下月1日))
+    try:
+        start_date, end_date = month_bounds(month)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="月份格式需為 YYYY-MM")
     
-    expense_query = {"type": "expense", "date": {"$gte": start_date, "$lte": end_date}}
+    expense_query = {"type": "expense", "date": {"$gte": start_date, "$lt": end_date}}
     if user_id:
         expense_query["user_id"] = user_id
     
     pipeline = [
         {"$match": expense_query},
-        {"$group": {"_id": "$category", "total": {"$sum": "$amount"}}}
+        {"$group": {"_id": "$category", "total": {"$sum": AMOUNT_BASE_EXPR}}}
     ]
     expenses = {item["_id"]: item["total"] for item in collection.aggregate(pipeline)}
     
@@ -1833,6 +1959,64 @@ def get_category_budget_status(month: Optional[str] = None, user_id: Optional[st
     
     return sorted(result, key=lambda x: x["category"])
 
+@app.get("/api/dashboard/category-budget-review")
+def get_category_budget_review(start_month: str, months: int = 12, user_id: Optional[str] = None):
+    """取得多個月份的分類預算使用狀況 (一次查詢)"""
+    if months < 1 or months > 120:
+        raise HTTPException(status_code=400, detail="月份數需介於 1 到 120")
+    try:
+        labels = month_labels(start_month, months)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="月份格式需為 YYYY-MM")
+    
+    budget_query = {"month": {"$in": labels}}
+    if user_id:
+        budget_query["user_id"] = user_id
+    budgets = {}
+    for b in category_budgets_collection.find(budget_query):
+        budgets.setdefault(b["month"], {})[b["category"]] = b["limit"]
+    
+    match_stage = {"user_id": user_id} if user_id else {}
+    spend = get_category_spend_by_month(match_stage, start_month, months)
+    
+    result = []
+    for label in labels:
+        month_budgets = budgets.get(label, {})
+        month_spend = spend.get(label, {})
+        categories = []
+        for cat in sorted(set(month_budgets) | set(month_spend)):
+            limit = month_budgets.get(cat, 0)
+            spent = month_spend.get(cat, 0)
+            categories.append({
+                "category": cat,
+                "limit": limit,
+                "spent": spent,
+                "remaining": limit - spent if limit > 0 else None,
+                "percent": round((spent / limit) * 100, 1) if limit > 0 else None
+            })
+        result.append({"month": label, "categories": categories})
+    return result
+
+@app.get("/api/dashboard/monthly-stats")
+def get_monthly_stats(
+    start_month: str,
+    months: int = 12,
+    user_id: Optional[str] = None,
+    user_ids: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """取得連續多個月份的收入/支出/結餘 (一次查詢)"""
+    if months < 1 or months > 120:
+        raise HTTPException(status_code=400, detail="月份數需介於 1 到 120")
+    match_stage = {}
+    member_ids = get_user_ids_to_filter(user_id, user_ids)
+    if member_ids:
+        match_stage["user_id"] = {"$in": member_ids}
+    try:
+        return get_multi_month_stats(match_stage, start_month, months)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="月份格式需為 YYYY-MM")
+
 
 # ======== Payment Methods API ========
 class PaymentMethodCreate(BaseModel):
@@ -1843,31 +2027,19 @@ class PaymentMethodCreate(BaseModel):
 @app.get("/api/payment-methods")
 def get_payment_methods(user_id: Optional[str] = None):
     if user_id:
-        # Check if user has personal methods
-        if payment_methods_collection.count_documents({"user_id": user_id}) == 0:
-            # Seed defaults
-            defaults = list(payment_methods_collection.find({"is_default": True}))
-            if defaults:
-                new_items = []
-                for d in defaults:
-                    new_item = d.copy()
-                    new_item.pop("_id")
-                    new_item["user_id"] = user_id
-                    new_item["is_default"] = False # Make it user-owned
-                    new_items.append(new_item)
-                if new_items:
-                    payment_methods_collection.insert_many(new_items)
-        
-        # Return only user's methods
-        methods = list(payment_methods_collection.find({"user_id": user_id}))
-        return [fix_id(m) for m in methods]
+        # Defaults are seeded at registration
+        return get_user_payment_methods(user_id)
         
     return []
 
 @app.post("/api/payment-methods")
 def create_payment_method(method: PaymentMethodCreate):
     data = method.dict()
-    result = payment_methods_collection.insert_one(data)
+    try:
+        result = payment_methods_collection.insert_one(data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="支付方式已存在")
+    data.pop("_id", None)
     return {"id": str(result.inserted_id), **data}
 
 @app.delete("/api/payment-methods/{method_id}")
@@ -1890,31 +2062,19 @@ def delete_payment_method(method_id: str):
 @app.get("/api/categories")
 def get_categories(user_id: Optional[str] = None):
     if user_id:
-        # Check if user has personal categories
-        if categories_collection.count_documents({"user_id": user_id}) == 0:
-            # Seed defaults
-            defaults = list(categories_collection.find({"is_default": True}))
-            if defaults:
-                new_items = []
-                for d in defaults:
-                    new_item = d.copy()
-                    new_item.pop("_id")
-                    new_item["user_id"] = user_id
-                    new_item["is_default"] = False # Make it user-owned
-                    new_items.append(new_item)
-                if new_items:
-                    categories_collection.insert_many(new_items)
-        
-        # Return only user's categories
-        categories = list(categories_collection.find({"user_id": user_id}))
-        return [fix_id(c) for c in categories]
+        # Defaults are seeded at registration
+        return get_user_categories(user_id)
         
     return []
 
 @app.post("/api/categories")
 def create_category(category: Category):
     data = category.dict()
-    result = categories_collection.insert_one(data)
+    try:
+        result = categories_collection.insert_one(data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="分類已存在")
+    data.pop("_id", None)
     return {"message": "分類建立成功", "id": str(result.inserted_id), **data}
 
 @app.delete("/api/categories/{id}")
@@ -1947,12 +2107,8 @@ def get_ledgers(current_user: dict = Depends(get_current_user)):
     user_id = current_user["id"]
     
     # Find ledgers where user is owner or member
-    ledgers = list(ledgers_collection.find({
-        "$or": [
-            {"owner_id": user_id},
-            {"members": user_id}
-        ]
-    }))
+    ledger_ids = [ObjectId(lid) for lid in scopes_for(user_id, LEDGER)]
+    ledgers = list(ledgers_collection.find({"_id": {"$in": ledger_ids}}))
     
     return [fix_id(ledger) for ledger in ledgers]
 
@@ -1971,6 +2127,7 @@ def create_ledger(ledger: LedgerCreate, current_user: dict = Depends(get_current
     }
     
     result = ledgers_collection.insert_one(new_ledger)
+    grant(user_id, LEDGER, str(result.inserted_id), role="owner")
     return {
         "message": "帳本已建立",
         "id": str(result.inserted_id),
@@ -2015,6 +2172,7 @@ def delete_ledger(ledger_id: str, current_user: dict = Depends(get_current_user)
     
     # Delete the ledger
     ledgers_collection.delete_one({"_id": ObjectId(ledger_id)})
+    revoke_scope(LEDGER, ledger_id)
     
     # Optionally: delete all transactions in this ledger
     # collection.delete_many({"ledger_id": ledger_id})
@@ -2031,17 +2189,18 @@ def get_ledger_members(ledger_id: str, current_user: dict = Depends(get_current_
         raise HTTPException(status_code=404, detail="帳本不存在")
     
     # Check if user is a member
-    if user_id not in ledger.get("members", []):
+    if not has_access(user_id, LEDGER, ledger_id):
         raise HTTPException(status_code=403, detail="您不是此帳本的成員")
     
     # Get member details
     member_ids = ledger.get("members", [])
+    profiles = resolve_members(member_ids)
     members = []
     for member_id in member_ids:
-        user = users_collection.find_one({"_id": ObjectId(member_id)})
+        user = profiles.get(member_id)
         if user:
             members.append({
-                "id": str(user["_id"]),
+                "id": user["id"],
                 "username": user.get("username"),
                 "display_name": user.get("display_name"),
                 "is_owner": member_id == ledger.get("owner_id")
@@ -2071,6 +2230,7 @@ def remove_ledger_member(ledger_id: str, member_id: str, current_user: dict = De
         {"_id": ObjectId(ledger_id)},
         {"$pull": {"members": member_id}}
     )
+    revoke(member_id, LEDGER, ledger_id)
     
     return {"message": "成員已移除"}
 
@@ -2093,33 +2253,15 @@ def create_invite(ledger_id: str, current_user: dict = Depends(get_current_user)
     if not ledger:
         raise HTTPException(status_code=404, detail="帳本不存在")
     
-    if user_id not in ledger.get("members", []):
+    if not has_access(user_id, LEDGER, ledger_id):
         raise HTTPException(status_code=403, detail="您不是此帳本的成員")
     
-    # Generate random invite code (6 characters)
-    import random
-    import string
-    code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    
-    # Check if code already exists (rare but possible)
-    while invites_collection.find_one({"code": code}):
-        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    
-    # Create invite
-    expires_at = datetime.now() + timedelta(days=7)
-    invite = {
-        "code": code,
-        "ledger_id": ledger_id,
-        "created_by": user_id,
-        "expires_at": expires_at.isoformat(),
-        "created_at": datetime.now().isoformat()
-    }
-    
-    invites_collection.insert_one(invite)
+    # Create invite (unique code index; retried on duplicate key)
+    invite = invite_to_api(store_invite(ledger_id, user_id, timedelta(days=7)))
     
     return {
-        "code": code,
-        "expires_at": expires_at.isoformat(),
+        "code": invite["code"],
+        "expires_at": invite["expires_at"],
         "message": "邀請碼已產生"
     }
 
@@ -2129,18 +2271,11 @@ def accept_invite(request: InviteCodeRequest, current_user: dict = Depends(get_c
     user_id = current_user["id"]
     code = request.code.strip().upper()
     
-    # Find invite
-    invite = invites_collection.find_one({"code": code})
+    # Find invite (expired invites are removed by the TTL index)
+    invite = find_invite(code)
     if not invite:
         raise HTTPException(status_code=404, detail="邀請碼不存在或已失效")
     
-    # Check if expired
-    expires_at = datetime.fromisoformat(invite["expires_at"])
-    if datetime.now() > expires_at:
-        # Delete expired invite
-        invites_collection.delete_one({"_id": invite["_id"]})
-        raise HTTPException(status_code=400, detail="邀請碼已過期")
-    
     # Get ledger
     ledger_id = invite["ledger_id"]
     ledger = ledgers_collection.find_one({"_id": ObjectId(ledger_id)})
@@ -2148,7 +2283,7 @@ def accept_invite(request: InviteCodeRequest, current_user: dict = Depends(get_c
         raise HTTPException(status_code=404, detail="帳本不存在")
     
     # Check if user is already a member
-    if user_id in ledger.get("members", []):
+    if has_access(user_id, LEDGER, ledger_id):
         return {
             "message": "您已經是此帳本的成員",
             "ledger_id": ledger_id
@@ -2157,8 +2292,9 @@ def accept_invite(request: InviteCodeRequest, current_user: dict = Depends(get_c
     # Add user to ledger members
     ledgers_collection.update_one(
         {"_id": ObjectId(ledger_id)},
-        {"$push": {"members": user_id}}
+        {"$addToSet": {"members": user_id}}
     )
+    grant(user_id, LEDGER, ledger_id)
     
     # Optionally: delete the invite code after use (one-time use)
     # invites_collection.delete_one({"_id": invite["_id"]})
@@ -2183,12 +2319,7 @@ def get_ledger_invites(ledger_id: str, current_user: dict = Depends(get_current_
         raise HTTPException(status_code=403, detail="只有帳本擁有者可以查看邀請碼")
     
     # Get active invites
-    invites = list(invites_collection.find({
-        "ledger_id": ledger_id,
-        "expires_at": {"$gt": datetime.now().isoformat()}
-    }))
-    
-    return [fix_id(invite) for invite in invites]
+    return [invite_to_api(invite) for invite in active_invites(ledger_id)]
 
 # [Invite] Delete/revoke invite
 @app.delete("/api/invites/{invite_id}")
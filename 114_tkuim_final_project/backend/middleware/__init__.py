@@ -5,4 +5,6 @@ This package contains middleware modules for the FastAPI application.
 
 Available Middleware:
 - rate_limit: API rate limiting to prevent abuse
+- admission: Concurrency limits and load shedding for heavy endpoints
+- upload_limit: Request body size limits for upload routes
 """
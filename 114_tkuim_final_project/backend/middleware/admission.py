@@ -0,0 +1,166 @@
+"""
+Admission Control Middleware for PyMoney API
+
+Heavy endpoints (export, import, dashboard aggregations) each get a
+concurrency limit and a short bounded queue. A request that finds the
+queue full, or waits longer than `max_wait`, is answered immediately
+with 503 and `Retry-After`, so a burst of heavy requests cannot take
+every worker thread away from cheap ones like `POST /api/transactions`.
+
+Usage in main.py:
+    from middleware.admission import setup_admission_control
+    setup_admission_control(app)
+"""
+import asyncio
+import json
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class AdmissionGate:
+    """Concurrency limit with a bounded FIFO queue and a maximum wait."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters: List[asyncio.Future] = []
+        # Metrics
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    async def acquire(self) -> bool:
+        """Wait for a slot; False if the request should be shed."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, timeout=self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # Slot was handed over as we gave up; pass it on
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise  # Client went away
+            self.rejected += 1
+            return False
+        waited = time.monotonic() - start
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        self.admitted += 1
+        return True
+
+    def release(self) -> None:
+        """Hand the slot to the next queued request, or free it."""
+        while self._waiters:
+            waiter = self._waiters.pop(0)
+            if not waiter.done():
+                waiter.set_result(None)  # Slot passes over; `active` is unchanged
+                return
+        self.active -= 1
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6)
+        }
+
+
+# Route classes, first match wins: (name, path regex, limit, max_queue, max_wait seconds)
+DEFAULT_ROUTE_CLASSES: List[Tuple[str, str, int, int, float]] = [
+    ("export", r"^/api/export", 2, 4, 2.0),
+    ("import", r"^/api/import$", 2, 4, 2.0),
+    ("dashboard", r"^/api/dashboard/", 4, 16, 1.0),
+]
+
+
+class AdmissionController:
+    """The gates of every route class; shared by the middleware and the metrics endpoint."""
+
+    def __init__(self, route_classes=None):
+        self.gates = [
+            (re.compile(pattern), AdmissionGate(name, limit, max_queue, max_wait))
+            for name, pattern, limit, max_queue, max_wait in (route_classes or DEFAULT_ROUTE_CLASSES)
+        ]
+
+    def gate_for(self, path: str) -> Optional[AdmissionGate]:
+        for pattern, gate in self.gates:
+            if pattern.search(path):
+                return gate
+        return None
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        return {gate.name: gate.metrics() for _, gate in self.gates}
+
+
+class AdmissionControlMiddleware:
+    """Pure ASGI middleware: the slot is held until the response is fully sent."""
+
+    def __init__(self, app, controller: AdmissionController, retry_after: int = 1):
+        self.app = app
+        self.controller = controller
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        gate = None
+        if scope["type"] == "http" and scope["method"] != "OPTIONS":
+            gate = self.controller.gate_for(scope["path"])
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+        if not await gate.acquire():
+            await self._reject(send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": "伺服器忙碌中，請稍後再試"}, ensure_ascii=False).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(self.retry_after).encode()),
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def setup_admission_control(app, route_classes=None) -> AdmissionController:
+    """
+    Setup admission control for a FastAPI app
+
+    Usage:
+        from middleware.admission import setup_admission_control
+        admission = setup_admission_control(app)
+        admission.metrics()  # queue depth, wait time, rejections per route class
+    """
+    controller = AdmissionController(route_classes)
+    app.state.admission = controller
+    app.add_middleware(AdmissionControlMiddleware, controller=controller)
+    print("✅ Admission control middleware enabled")
+    return controller
@@ -6,46 +6,176 @@ This module provides rate limiting to protect against:
 - DDoS attacks
 - API abuse
 
+Each caller (authenticated user id, falling back to client IP) gets one
+token bucket per route class. Buckets live in a pluggable storage backend:
+`InMemoryStorage` for tests and single-process runs, `MongoStorage` to
+share limits across uvicorn workers. Every check is one atomic operation
+on the backend.
+
 Usage in main.py:
-    from middleware.rate_limit import limiter, RateLimitMiddleware
-    app.state.limiter = limiter
-    app.add_middleware(RateLimitMiddleware)
-    
-    @app.get("/api/endpoint")
-    @limiter.limit("10/minute")
-    def endpoint():
-        pass
+    from middleware.rate_limit import setup_rate_limiting, MongoStorage
+    setup_rate_limiting(app, MongoStorage(db["rate_limits"]), key_func=principal_key)
 """
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+from pymongo import ReturnDocument
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class Quota:
+    """Token bucket parameters: `burst` tokens, refilled at `rate` tokens per second."""
+
+    def __init__(self, limit: str, burst: Optional[int] = None):
+        count, period = limit.split("/")
+        self.limit = limit
+        self.burst = burst or int(count)
+        self.rate = int(count) / _PERIODS[period.strip().rstrip("s")]
+
+    def __repr__(self):
+        return f"Quota({self.limit!r}, burst={self.burst})"
 
-# Create limiter with IP-based rate limiting
-limiter = Limiter(key_func=get_remote_address)
 
-# Pre-configured rate limit decorators
-def rate_limit_auth(limit: str = "5/minute"):
-    """Rate limit for authentication endpoints (login, register)"""
-    return limiter.limit(limit)
+class InMemoryStorage:
+    """Process-local buckets (tests, single worker)."""
 
-def rate_limit_api(limit: str = "60/minute"):
-    """Rate limit for general API endpoints"""
-    return limiter.limit(limit)
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
 
-def rate_limit_strict(limit: str = "3/minute"):
-    """Strict rate limit for sensitive operations (password reset)"""
-    return limiter.limit(limit)
+    def consume(self, key: str, quota: Quota, now: Optional[float] = None) -> Tuple[bool, float]:
+        """
+        Take one token from a bucket.
 
-def setup_rate_limiting(app):
+        Returns:
+            (allowed, seconds until a token is available)
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, ts = self._buckets.get(key, (quota.burst, now))
+            tokens = min(quota.burst, tokens + (now - ts) * quota.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+        return allowed, 0.0 if allowed else (1 - tokens) / quota.rate
+
+
+class MongoStorage:
+    """
+    Buckets shared by all workers, updated with one pipeline find_one_and_update.
+
+    Idle buckets are removed by a TTL index on `expires_at` (see database.py).
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def consume(self, key: str, quota: Quota, now: Optional[float] = None) -> Tuple[bool, float]:
+        now = time.time() if now is None else now
+        idle = quota.burst / quota.rate  # Time for an empty bucket to refill
+        refilled = {"$min": [quota.burst, {"$add": [
+            {"$ifNull": ["$tokens", quota.burst]},
+            {"$multiply": [{"$subtract": [now, {"$ifNull": ["$ts", now]}]}, quota.rate]}
+        ]}]}
+        doc = self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "ts": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expires_at": datetime.utcnow() + timedelta(seconds=idle + 60)
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if doc["allowed"]:
+            return True, 0.0
+        return False, (1 - doc["tokens"]) / quota.rate
+
+
+# Route classes, first match wins: (name, methods or None for any, path regex, quota)
+DEFAULT_ROUTE_CLASSES: List[Tuple[str, Optional[set], str, Quota]] = [
+    ("strict", {"POST"}, r"^/api/auth/(forgot-password|reset-password)$|^/api/users/send-delete-code$", Quota("3/minute")),
+    ("auth", {"POST"}, r"^/api/auth/", Quota("5/minute", burst=10)),
+    ("heavy", None, r"^/api/(export|import)", Quota("10/minute", burst=5)),
+    ("api", None, r"^/api/", Quota("120/minute", burst=60)),
+]
+
+
+def client_ip(request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    """Matches a request to its route class and consumes from the caller's bucket."""
+
+    def __init__(self, storage, key_func: Callable = None, route_classes=None):
+        self.storage = storage
+        self.key_func = key_func or (lambda request: f"ip:{client_ip(request)}")
+        self.route_classes = [
+            (name, methods, re.compile(pattern), quota)
+            for name, methods, pattern, quota in (route_classes or DEFAULT_ROUTE_CLASSES)
+        ]
+
+    def route_class(self, method: str, path: str):
+        for name, methods, pattern, quota in self.route_classes:
+            if (methods is None or method in methods) and pattern.search(path):
+                return name, quota
+        return None
+
+    def check(self, request) -> Tuple[bool, float]:
+        match = self.route_class(request.method, request.url.path)
+        if match is None:
+            return True, 0.0
+        name, quota = match
+        return self.storage.consume(f"{name}:{self.key_func(request)}", quota)
+
+
+class RateLimitMiddleware(BaseHTTPMiddleware):
+    """Answers 429 with Retry-After once the caller's bucket is empty."""
+
+    def __init__(self, app, limiter: RateLimiter):
+        super().__init__(app)
+        self.limiter = limiter
+
+    async def dispatch(self, request, call_next):
+        if request.method != "OPTIONS":
+            try:
+                # Storage calls may block (MongoDB), keep them off the event loop
+                allowed, retry_after = await run_in_threadpool(self.limiter.check, request)
+            except Exception as e:
+                # Fail open: a storage outage must not take the API down
+                print(f"Rate limit storage error: {e}")
+                allowed, retry_after = True, 0.0
+            if not allowed:
+                return JSONResponse(
+                    status_code=429,
+                    content={"detail": "請求過於頻繁，請稍後再試"},
+                    headers={"Retry-After": str(max(1, int(retry_after + 0.999)))}
+                )
+        return await call_next(request)
+
+
+def setup_rate_limiting(app, storage=None, key_func: Callable = None, route_classes=None) -> RateLimiter:
     """
     Setup rate limiting for a FastAPI app
-    
+
     Usage:
         from middleware.rate_limit import setup_rate_limiting
         setup_rate_limiting(app)
     """
+    limiter = RateLimiter(storage or InMemoryStorage(), key_func, route_classes)
     app.state.limiter = limiter
-    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-    app.add_middleware(SlowAPIMiddleware)
+    app.add_middleware(RateLimitMiddleware, limiter=limiter)
     print("✅ Rate limiting middleware enabled")
+    return limiter
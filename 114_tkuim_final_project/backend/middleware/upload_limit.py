@@ -0,0 +1,105 @@
+"""
+Upload Size Limit Middleware for PyMoney API
+
+Starlette spools multipart uploads to a temporary file (only the first
+1 MB stays in memory), but it accepts bodies of any size. This middleware
+caps the request body of upload routes: a declared `Content-Length` above
+the limit is rejected with 413 before any byte is read, and a chunked body
+is cut off as soon as it passes the limit.
+
+Usage in main.py:
+    from middleware.upload_limit import setup_upload_limit
+    setup_upload_limit(app, [(r"^/api/import$", 10 * 1024 * 1024)])
+"""
+import json
+import re
+from typing import List, Optional, Tuple
+
+
+class UploadLimitMiddleware:
+    """Pure ASGI middleware counting body bytes as they are received."""
+
+    def __init__(self, app, limits: List[Tuple[str, int]]):
+        self.app = app
+        self.limits = [(re.compile(pattern), max_bytes) for pattern, max_bytes in limits]
+
+    def limit_for(self, path: str) -> Optional[int]:
+        for pattern, max_bytes in self.limits:
+            if pattern.search(path):
+                return max_bytes
+        return None
+
+    async def __call__(self, scope, receive, send):
+        max_bytes = None
+        if scope["type"] == "http" and scope["method"] in ("POST", "PUT"):
+            max_bytes = self.limit_for(scope["path"])
+        if max_bytes is None:
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > max_bytes:
+            await self._reject(send, max_bytes)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    # Stop the body here; the app sees a client disconnect
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            if exceeded and not started:
+                return  # Replace the app's error for the cut-off body with 413
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not started:
+            await self._reject(send, max_bytes)
+
+    async def _reject(self, send, max_bytes: int):
+        if max_bytes >= 1024 * 1024:
+            detail = f"檔案過大，上限為 {max_bytes // (1024 * 1024)} MB"
+        else:
+            detail = f"檔案過大，上限為 {max_bytes // 1024} KB"
+        body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def setup_upload_limit(app, limits: List[Tuple[str, int]]) -> None:
+    """
+    Setup upload size limits for a FastAPI app
+
+    Usage:
+        from middleware.upload_limit import setup_upload_limit
+        setup_upload_limit(app, [(r"^/api/import$", 10 * 1024 * 1024)])
+    """
+    app.add_middleware(UploadLimitMiddleware, limits=limits)
+    print("✅ Upload size limit middleware enabled")
@@ -7,5 +7,21 @@ for better code organization and testability.
 Services:
 - auth_service: Authentication and user management
 - transaction_service: Transaction CRUD operations
-- family_service: Family management logic
+- family_service: Batched family and ledger member lookups
+- membership_service: Indexed (principal, scope, role) grants for permission checks
+- invite_service: TTL-indexed ledger invite codes
+- token_service: Hashed, TTL-indexed single-use tokens
+- email_service: Email outbox and background SMTP sender
+- session_service: JWT claims and per-user token revocation
+- password_service: scrypt password hashing on a bounded pool
+- currency_service: Base-currency normalization and exchange rates
+- recurring_service: Recurring transaction scheduling
+- forecast_service: Projected account balances
+- stats_service: Time-bucketed dashboard statistics
+- balance_service: Incremental per-account balances
+- export_service: Background Excel exports cached in GridFS
+- import_service: Streaming CSV/Excel import parsing
+- categorizer_service: History-trained category suggestions
+- suggest_service: In-memory title autocomplete
+- category_service: Per-user categories and payment methods
 """
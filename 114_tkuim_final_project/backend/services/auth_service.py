@@ -4,7 +4,6 @@ Auth Service - Authentication and User Management Business Logic
 This module contains authentication-related business logic extracted from main.py.
 """
 import re
-import hashlib
 import secrets
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
@@ -12,14 +11,8 @@ import jwt
 
 from database import users_collection, families_collection
 
-# Password hashing
-def hash_password(password: str) -> str:
-    """Hash a password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def verify_password(plain: str, hashed: str) -> bool:
-    """Verify a password against its hash"""
-    return hash_password(plain) == hashed
+# Password hashing (shared with main.py)
+from services.password_service import hash_password, verify_password
 
 
 # Password validation
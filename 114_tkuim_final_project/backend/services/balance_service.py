@@ -0,0 +1,248 @@
+"""
+Balance Service - Incremental Account Balances
+
+This module maintains the `account_balances` collection: one document per
+(user_id, account) whose `balance` is adjusted with `$inc` on every
+transaction write. Reading balances is then O(accounts) instead of
+aggregating the whole transaction history.
+
+Because every transaction write passes through here, it also bumps a
+per-user counter in `data_versions`, which lets exports detect that a
+user's data is unchanged and reuse a cached file.
+"""
+from typing import Dict, List, Optional, Iterable, Tuple, Any
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import transactions_collection, account_balances_collection, data_versions_collection
+from services.currency_service import AMOUNT_BASE_EXPR
+
+
+def _amount_of(tx: dict) -> float:
+    amount = tx.get("amount_base", tx.get("amount", 0))
+    # NaN != NaN; imported rows may carry NaN amounts
+    if not isinstance(amount, (int, float)) or amount != amount:
+        return 0
+    return amount
+
+
+def balance_deltas(tx: dict) -> List[Tuple[Optional[str], str, float]]:
+    """
+    Balance changes caused by one transaction.
+
+    Income adds to its payment method, expense and transfer subtract from it,
+    and a transfer adds to its target account.
+
+    Returns:
+        List of (user_id, account, delta)
+    """
+    amount = _amount_of(tx)
+    user_id = tx.get("user_id")
+    account = tx.get("payment_method")
+    tx_type = tx.get("type")
+
+    deltas = []
+    if account:
+        if tx_type == "income":
+            deltas.append((user_id, account, amount))
+        elif tx_type in ("expense", "transfer"):
+            deltas.append((user_id, account, -amount))
+    if tx_type == "transfer" and tx.get("target_account"):
+        deltas.append((user_id, tx["target_account"], amount))
+    return deltas
+
+
+def merge_deltas(changes: Iterable[Tuple[Iterable[dict], int]]) -> Dict[Tuple[Optional[str], str], float]:
+    """
+    Sum the deltas of many transactions per (user_id, account).
+
+    Args:
+        changes: Pairs of (transactions, sign); sign is +1 to apply, -1 to revert
+    """
+    merged = {}
+    for txs, sign in changes:
+        for tx in txs:
+            for user_id, account, delta in balance_deltas(tx):
+                key = (user_id, account)
+                merged[key] = merged.get(key, 0) + sign * delta
+    return merged
+
+
+def _write(merged: Dict[Tuple[Optional[str], str], float]) -> None:
+    ops = [
+        UpdateOne({"user_id": user_id, "account": account}, {"$inc": {"balance": delta}}, upsert=True)
+        for (user_id, account), delta in merged.items() if delta
+    ]
+    if ops:
+        account_balances_collection.bulk_write(ops, ordered=False)
+
+
+def bump_data_versions(user_ids: Iterable[Optional[str]]) -> None:
+    """Mark the users' transaction data as changed."""
+    ops = [
+        UpdateOne({"_id": user_id}, {"$inc": {"version": 1}}, upsert=True)
+        for user_id in set(user_ids)
+    ]
+    if ops:
+        data_versions_collection.bulk_write(ops, ordered=False)
+
+
+def get_data_versions(user_ids: Optional[List[str]] = None) -> Dict[Optional[str], int]:
+    """
+    Data version per user (all users when `user_ids` is empty).
+
+    Returns:
+        {user_id: version}; users never written to are absent
+    """
+    query = {"_id": {"$in": user_ids}} if user_ids else {}
+    return {doc["_id"]: doc["version"] for doc in data_versions_collection.find(query)}
+
+
+def apply_transactions(txs: Iterable[dict], sign: int = 1) -> None:
+    """Apply (sign=1) or revert (sign=-1) the balance effect of transactions."""
+    txs = list(txs)
+    _write(merge_deltas([(txs, sign)]))
+    bump_data_versions(tx.get("user_id") for tx in txs)
+
+
+def replace_transaction(old: dict, new: dict) -> None:
+    """Move balances from an updated transaction's old version to its new one."""
+    _write(merge_deltas([([old], -1), ([new], 1)]))
+    bump_data_versions([old.get("user_id"), new.get("user_id")])
+
+
+def get_balances(member_ids: Optional[List[str]] = None) -> Dict[str, float]:
+    """
+    Current balance per account, summed over the given users.
+
+    Args:
+        member_ids: User IDs to include (empty for all users)
+    """
+    query = {"user_id": {"$in": member_ids}} if member_ids else {}
+    balances = {}
+    for doc in account_balances_collection.find(query, {"_id": 0, "account": 1, "balance": 1}):
+        balances[doc["account"]] = balances.get(doc["account"], 0) + (doc.get("balance") or 0)
+    return balances
+
+
+def compute_balances(member_ids: Optional[List[str]] = None) -> Dict[Tuple[Optional[str], str], float]:
+    """
+    Recompute balances from the full transaction history.
+
+    Returns:
+        {(user_id, account): balance}
+    """
+    match_stage = {"user_id": {"$in": member_ids}} if member_ids else {}
+    pipeline_source = [
+        {"$match": match_stage},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "account": "$payment_method"},
+            "balance": {"$sum": {"$switch": {
+                "branches": [
+                    {"case": {"$eq": ["$type", "income"]}, "then": AMOUNT_BASE_EXPR},
+                    {"case": {"$in": ["$type", ["expense", "transfer"]]}, "then": {"$multiply": [AMOUNT_BASE_EXPR, -1]}}
+                ],
+                "default": 0
+            }}}
+        }}
+    ]
+    pipeline_target = [
+        {"$match": {**match_stage, "type": "transfer", "target_account": {"$exists": True, "$ne": None}}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "account": "$target_account"},
+            "balance": {"$sum": AMOUNT_BASE_EXPR}
+        }}
+    ]
+
+    totals = {}
+    for pipeline in (pipeline_source, pipeline_target):
+        for item in transactions_collection.aggregate(pipeline):
+            account = item["_id"].get("account")
+            balance = item.get("balance") or 0
+            if not account or balance != balance:
+                continue
+            key = (item["_id"].get("user_id"), account)
+            totals[key] = totals.get(key, 0) + balance
+    return totals
+
+
+def check_balances(member_ids: Optional[List[str]] = None,
+                   tolerance: float = 0.005) -> List[Dict[str, Any]]:
+    """
+    Compare stored balances against a full recomputation.
+
+    Stored balances are read before the recomputation, so a transaction
+    written in between makes its account look drifted; `repair_balances`
+    then skips it because the stored value no longer matches.
+
+    Args:
+        member_ids: User IDs to check (empty for all users)
+        tolerance: Differences up to this amount are ignored
+
+    Returns:
+        One dict per drifted (user_id, account) with stored, expected, drift
+        and whether a balance document exists
+    """
+    query = {"user_id": {"$in": member_ids}} if member_ids else {}
+    stored = {
+        (doc.get("user_id"), doc["account"]): doc.get("balance") or 0
+        for doc in account_balances_collection.find(query)
+    }
+    expected = compute_balances(member_ids)
+
+    drift = []
+    for key in set(expected) | set(stored):
+        want = expected.get(key, 0)
+        have = stored.get(key, 0)
+        if abs(want - have) > tolerance:
+            drift.append({"user_id": key[0], "account": key[1], "stored": have,
+                          "expected": want, "drift": have - want, "exists": key in stored})
+    return sorted(drift, key=lambda d: (str(d["user_id"]), d["account"]))
+
+
+def repair_balances(drift: List[Dict[str, Any]]) -> int:
+    """
+    Correct drifted balances found by `check_balances`.
+
+    Each write is conditional on the balance still being the value that was
+    checked: an existing document gets `$inc` of the observed drift only if
+    its balance is unchanged, and a missing one is inserted only if no
+    write created it meanwhile. Accounts written to since the check are
+    skipped rather than overwritten with a stale total; run again to fix them.
+
+    Returns:
+        Number of balances repaired
+    """
+    ops = []
+    for d in drift:
+        key = {"user_id": d["user_id"], "account": d["account"]}
+        if d["exists"]:
+            ops.append(UpdateOne({**key, "balance": d["stored"]}, {"$inc": {"balance": -d["drift"]}}))
+        else:
+            ops.append(UpdateOne({**key, "balance": {"$exists": False}},
+                                 {"$set": {"balance": d["expected"]}}, upsert=True))
+    if not ops:
+        return 0
+    try:
+        result = account_balances_collection.bulk_write(ops, ordered=False)
+        return result.modified_count + result.upserted_count
+    except BulkWriteError as e:
+        # A duplicate key means the document was created after the check
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+        return e.details.get("nModified", 0) + e.details.get("nUpserted", 0)
+
+
+def rebuild_balances() -> int:
+    """
+    Rebuild the whole collection from history (first start or after drift).
+
+    Balances are corrected in place with conditional writes instead of being
+    deleted and reinserted, so concurrent `$inc` writes are never lost;
+    accounts no longer in history are brought to 0.
+
+    Returns:
+        Number of balance documents written
+    """
+    return repair_balances(check_balances(tolerance=0))
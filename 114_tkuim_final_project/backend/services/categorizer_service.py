@@ -0,0 +1,251 @@
+"""
+Categorizer Service - History-trained Category Suggestions
+
+This module learns each user's categories from their own transactions.
+Titles are normalized and split into tokens (the whole title, words and
+CJK character bigrams); the `category_tokens` collection keeps one
+counter per (user, type, token, category), incremented on every write.
+A user's counters are compiled into an in-memory token -> category
+distribution, so categorizing a batch costs dictionary lookups only.
+
+Rows whose category was filled in by the categorizer are stored with
+`category_auto: True` and never counted, whether by `learn` or by a
+full `build_model`, so removing them later cannot take away counts that
+real transactions built up.
+"""
+import random
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from database import transactions_collection, category_tokens_collection, category_models_collection
+from services.cache import TTLCache
+from services.import_service import normalize_title
+
+CACHE_TTL_SECONDS = 300
+# The whole-title token outweighs the tokens it is made of
+EXACT_TITLE_WEIGHT = 4.0
+# Categories treated as "not categorized" on import
+GENERIC_CATEGORIES = {"other", "others", "其他", "未分類", "uncategorized", "misc"}
+FALLBACK_CATEGORY = "Other"
+# Bumped when counting rules change; models built under an older version are rebuilt on next use
+MODEL_VERSION = 2
+
+_models = TTLCache(ttl=CACHE_TTL_SECONDS, maxsize=1000)
+_built = TTLCache(ttl=CACHE_TTL_SECONDS, maxsize=50000)
+
+_CJK_RUN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+")
+_WORD = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+
+def tokenize(title: Optional[str]) -> List[str]:
+    """
+    Tokens of a title: "=" + the normalized title, Latin words, CJK bigrams.
+
+    Examples:
+        "便利商店午餐" -> ["=便利商店午餐", "便利", "利商", "商店", "店午", "午餐"]
+        "Uber Eats 12/3" -> ["=uber eats 12/3", "uber", "eats"]
+    """
+    text = normalize_title(title)
+    if not text:
+        return []
+    tokens = ["=" + text]
+    for word in _WORD.findall(_CJK_RUN.sub(" ", text)):
+        if len(word) > 1:
+            tokens.append(word)
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def is_generic(category: Optional[str]) -> bool:
+    return not category or str(category).strip().casefold() in GENERIC_CATEGORIES
+
+
+def count_tokens(txs: Iterable[dict]) -> Counter:
+    """Token counters of transactions: {(type, token, category): n}."""
+    counts = Counter()
+    for tx in txs:
+        category = tx.get("category")
+        if is_generic(category) or tx.get("category_auto"):
+            continue  # Nothing to learn from "Other" or from our own guesses
+        tx_type = tx.get("type") or "expense"
+        for token in set(tokenize(tx.get("title"))):
+            counts[(tx_type, token, category)] += 1
+    return counts
+
+
+class Categorizer:
+    """A compiled model: (type, token) -> [(category, share of the token's uses)]."""
+
+    def __init__(self, counts: Dict[Tuple[str, str, str], int]):
+        totals = defaultdict(int)
+        by_token = defaultdict(list)
+        for (tx_type, token, category), n in counts.items():
+            if n > 0:
+                totals[(tx_type, token)] += n
+                by_token[(tx_type, token)].append((category, n))
+        self._model = {
+            key: [(category, n / totals[key]) for category, n in pairs]
+            for key, pairs in by_token.items()
+        }
+        self._memo: Dict[Tuple[str, str], Tuple[Optional[str], float]] = {}
+
+    def __len__(self):
+        return len(self._model)
+
+    def predict(self, title: Optional[str], tx_type: str = "expense") -> Tuple[Optional[str], float]:
+        """
+        Most likely category of a title.
+
+        Returns:
+            (category, confidence 0..1); (None, 0.0) if no token is known
+        """
+        key = (tx_type, title)
+        cached = self._memo.get(key)
+        if cached is not None:
+            return cached
+
+        scores = defaultdict(float)
+        matched = 0.0
+        for token in tokenize(title):
+            dist = self._model.get((tx_type, token))
+            if not dist:
+                continue
+            weight = EXACT_TITLE_WEIGHT if token[0] == "=" else 1.0
+            matched += weight
+            for category, share in dist:
+                scores[category] += weight * share
+        if scores:
+            category = max(scores, key=scores.get)
+            result = (category, round(scores[category] / matched, 3))
+        else:
+            result = (None, 0.0)
+        if len(self._memo) < 100000:
+            self._memo[key] = result
+        return result
+
+
+def evaluate(history: List[dict], holdout: float = 0.2, seed: int = 42) -> Dict[str, float]:
+    """
+    Accuracy on held-out history: train on the rest, predict the held-out rows.
+
+    Returns:
+        {"train": n, "test": n, "accuracy": hits / predicted, "coverage": predicted / test}
+    """
+    rows = [tx for tx in history if not is_generic(tx.get("category"))]
+    random.Random(seed).shuffle(rows)
+    split = int(len(rows) * (1 - holdout))
+    train, test = rows[:split], rows[split:]
+    model = Categorizer(count_tokens(train))
+    predicted = hits = 0
+    for tx in test:
+        category, _ = model.predict(tx.get("title"), tx.get("type") or "expense")
+        if category is not None:
+            predicted += 1
+            hits += category == tx.get("category")
+    return {
+        "train": len(train),
+        "test": len(test),
+        "accuracy": hits / predicted if predicted else 0.0,
+        "coverage": predicted / len(test) if test else 0.0
+    }
+
+
+def _is_built(user_id: str) -> bool:
+    if _built.get(user_id):
+        return True
+    built = category_models_collection.find_one({"_id": user_id, "version": MODEL_VERSION}) is not None
+    if built:
+        _built.set(user_id, True)
+    return built
+
+
+def build_model(user_id: str) -> int:
+    """
+    (Re)build a user's token counters from their whole history.
+
+    Counters are overwritten with `$set` upserts (stale ones set to 0)
+    rather than deleted and reinserted, so a concurrent build or `learn`
+    never collides on the unique index. The model is marked built only
+    once the counters are written.
+
+    Returns:
+        Number of counters written
+    """
+    history = transactions_collection.find(
+        {"user_id": user_id}, {"title": 1, "category": 1, "type": 1, "category_auto": 1, "_id": 0}
+    )
+    counts = count_tokens(history)
+    stale = {
+        (doc["type"], doc["token"], doc["category"])
+        for doc in category_tokens_collection.find(
+            {"user_id": user_id, "n": {"$ne": 0}}, {"type": 1, "token": 1, "category": 1, "_id": 0}
+        )
+    } - set(counts)
+    ops = [
+        UpdateOne(
+            {"user_id": user_id, "type": tx_type, "token": token, "category": category},
+            {"$set": {"n": n}},
+            upsert=True
+        )
+        for (tx_type, token, category), n in list(counts.items()) + [(key, 0) for key in stale]
+    ]
+    if ops:
+        category_tokens_collection.bulk_write(ops, ordered=False)
+    category_models_collection.update_one(
+        {"_id": user_id}, {"$set": {"built": True, "version": MODEL_VERSION}}, upsert=True
+    )
+    _built.set(user_id, True)
+    _models.invalidate(user_id)
+    return len(counts)
+
+
+def learn(txs: Iterable[dict], sign: int = 1) -> None:
+    """
+    Add (sign=1) or remove (sign=-1) written transactions from their users' counters.
+
+    Users whose model was never built are skipped; their history is read
+    in full when the model is first needed.
+    """
+    by_user = defaultdict(list)
+    for tx in txs:
+        if tx.get("user_id"):
+            by_user[tx["user_id"]].append(tx)
+    for user_id, user_txs in by_user.items():
+        if not _is_built(user_id):
+            continue
+        ops = [
+            UpdateOne(
+                {"user_id": user_id, "type": tx_type, "token": token, "category": category},
+                {"$inc": {"n": sign * n}},
+                upsert=True
+            )
+            for (tx_type, token, category), n in count_tokens(user_txs).items()
+        ]
+        if ops:
+            category_tokens_collection.bulk_write(ops, ordered=False)
+        _models.invalidate(user_id)
+
+
+def get_categorizer(user_id: str) -> Categorizer:
+    """A user's compiled model (cached; built from history on first use)."""
+    model = _models.get(user_id)
+    if model is not None:
+        return model
+    if not _is_built(user_id):
+        build_model(user_id)
+    counts = {
+        (doc["type"], doc["token"], doc["category"]): doc["n"]
+        for doc in category_tokens_collection.find(
+            {"user_id": user_id, "n": {"$gt": 0}}, {"type": 1, "token": 1, "category": 1, "n": 1, "_id": 0}
+        )
+    }
+    model = Categorizer(counts)
+    _models.set(user_id, model)
+    return model
@@ -0,0 +1,122 @@
+"""
+Category Service - Per-user Categories and Payment Methods
+
+Default categories and payment methods are copied to each user once, when
+the user is created. Reads go straight to MongoDB: the lists are small and
+served by the user_id index, and an in-process cache would show other
+workers' writes late.
+"""
+from typing import List, Dict, Any
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import categories_collection, payment_methods_collection, users_collection
+
+# Unique per user (see database.create_indexes)
+CATEGORY_KEY = ("name", "type")
+PAYMENT_METHOD_KEY = ("name",)
+
+
+def _to_api(doc: dict) -> dict:
+    doc = dict(doc)
+    doc["id"] = str(doc.pop("_id"))
+    return doc
+
+
+def _seed(collection, user_id: str, key_fields) -> int:
+    """
+    Copy the global defaults of a collection to one user.
+
+    Uses upserts keyed on the item's unique key, so running it twice (or
+    from two workers at once) never creates duplicates; an upsert that
+    loses the race to the unique index counts as already seeded.
+    """
+    ops = []
+    for default in collection.find({"is_default": True, "user_id": None}):
+        item = {k: v for k, v in default.items() if k != "_id"}
+        item["user_id"] = user_id
+        item["is_default"] = False  # Make it user-owned
+        key = {"user_id": user_id, **{f: item.get(f) for f in key_fields}}
+        ops.append(UpdateOne(key, {"$setOnInsert": item}, upsert=True))
+    if not ops:
+        return 0
+    try:
+        return collection.bulk_write(ops, ordered=False).upserted_count
+    except BulkWriteError as e:
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+        return e.details.get("nUpserted", 0)
+
+
+def seed_user_defaults(user_id: str) -> None:
+    """Give a new user their own copy of the default categories and payment methods."""
+    _seed(categories_collection, user_id, CATEGORY_KEY)
+    _seed(payment_methods_collection, user_id, PAYMENT_METHOD_KEY)
+
+
+def _remove_duplicates(collection, key_fields) -> int:
+    group_id = {"user_id": "$user_id", **{f: f"${f}" for f in key_fields}}
+    extra_ids = []
+    for group in collection.aggregate([
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": group_id, "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}}
+    ], allowDiskUse=True):
+        extra_ids.extend(group["ids"][1:])  # Keep the oldest copy
+    if extra_ids:
+        collection.delete_many({"_id": {"$in": extra_ids}})
+    return len(extra_ids)
+
+
+def remove_duplicates() -> int:
+    """
+    Delete duplicate categories and payment methods (same user and key).
+
+    Needed once before the unique indexes can be built. Transactions refer
+    to categories by name, so dropping a duplicate loses nothing.
+
+    Returns:
+        Number of documents deleted
+    """
+    count = _remove_duplicates(categories_collection, CATEGORY_KEY)
+    count += _remove_duplicates(payment_methods_collection, PAYMENT_METHOD_KEY)
+    return count
+
+
+def backfill_user_defaults() -> int:
+    """
+    Seed defaults for existing users that never received them.
+
+    Returns:
+        Number of users seeded
+    """
+    seeded_categories = set(categories_collection.distinct("user_id"))
+    seeded_methods = set(payment_methods_collection.distinct("user_id"))
+    count = 0
+    for user in users_collection.find({}, {"_id": 1}):
+        user_id = str(user["_id"])
+        if user_id in seeded_categories and user_id in seeded_methods:
+            continue
+        seed_user_defaults(user_id)
+        count += 1
+    return count
+
+
+def _user_list(collection, user_id: str) -> List[Dict[str, Any]]:
+    items = [_to_api(d) for d in collection.find({"user_id": user_id})]
+    if not items:
+        # Users created before seeding moved to registration
+        seed_user_defaults(user_id)
+        items = [_to_api(d) for d in collection.find({"user_id": user_id})]
+    return items
+
+
+def get_user_categories(user_id: str) -> List[Dict[str, Any]]:
+    """Categories owned by a user."""
+    return _user_list(categories_collection, user_id)
+
+
+def get_user_payment_methods(user_id: str) -> List[Dict[str, Any]]:
+    """Payment methods owned by a user."""
+    return _user_list(payment_methods_collection, user_id)
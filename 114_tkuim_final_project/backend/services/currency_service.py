@@ -0,0 +1,159 @@
+"""
+Currency Service - Base Currency Normalization
+
+This module stamps every transaction with its amount in the base currency
+(TWD) at write time, so dashboard aggregations can `$sum` a single field
+instead of converting per query.
+"""
+import json
+import time
+import urllib.request
+from typing import Optional, Tuple, Dict, Any
+
+from pymongo import UpdateOne
+
+from database import transactions_collection
+
+BASE_CURRENCY = "TWD"
+RATES_URL = "https://tw.rter.info/capi.php"
+RATES_TTL_SECONDS = 3600
+
+# Aggregation expression for the normalized amount.
+# Falls back to `amount` for documents written before `amount_base` existed.
+AMOUNT_BASE_EXPR = {"$ifNull": ["$amount_base", "$amount"]}
+
+_rates_cache = {"timestamp": 0, "data": {}}
+
+
+def fetch_rates() -> Dict[str, Any]:
+    """
+    Get the USD-based rate table, refreshing it at most once per hour.
+
+    Returns:
+        Raw rate table keyed by currency pair (e.g. "USDTWD")
+    """
+    now = time.time()
+    if now - _rates_cache["timestamp"] > RATES_TTL_SECONDS or "USDTWD" not in _rates_cache["data"]:
+        try:
+            with urllib.request.urlopen(RATES_URL, timeout=5) as url:
+                _rates_cache["data"] = json.loads(url.read().decode())
+                _rates_cache["timestamp"] = now
+        except Exception:
+            pass
+    return _rates_cache["data"]
+
+
+def get_base_rate(currency: str) -> Tuple[float, str]:
+    """
+    Get how many base-currency units one unit of `currency` is worth.
+
+    Args:
+        currency: ISO currency code
+
+    Returns:
+        (rate, updated_at) - rate is 1.0 when unknown or unavailable
+    """
+    currency = (currency or BASE_CURRENCY).upper()
+    if currency == BASE_CURRENCY:
+        return 1.0, ""
+
+    data = fetch_rates()
+    if "USDTWD" not in data:
+        return 1.0, ""
+
+    usd_twd = data["USDTWD"]["Exrate"]
+    utc_str = data["USDTWD"].get("UTC", "")
+    if currency == "USD":
+        return usd_twd, utc_str
+
+    key = f"USD{currency}"
+    if key not in data:
+        return 1.0, utc_str
+
+    # 1 Target = (USDTWD / USDTarget) TWD
+    return usd_twd / data[key]["Exrate"], utc_str
+
+
+def _is_number(value) -> bool:
+    # NaN != NaN, which also filters out pandas' missing values
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value == value
+
+
+def normalize_amount(doc: dict, rate_lookup=None) -> Tuple[int, float]:
+    """
+    Compute the base-currency amount and the rate used for a transaction.
+
+    The form sends `amount` already converted when `foreign_amount` is set,
+    so the stored rate is only applied when the amount itself is foreign.
+
+    Args:
+        doc: Transaction fields (amount, currency, foreign_amount, exchange_rate)
+        rate_lookup: Callable(currency) -> rate, defaults to live rates
+
+    Returns:
+        (amount_base, base_rate)
+    """
+    amount = doc.get("amount") or 0
+    if not _is_number(amount):
+        amount = 0
+    currency = doc.get("currency")
+    currency = currency.strip().upper() if isinstance(currency, str) and currency.strip() else BASE_CURRENCY
+    if currency == BASE_CURRENCY:
+        return int(round(amount)), 1.0
+
+    rate = doc.get("exchange_rate")
+    if not _is_number(rate) or rate <= 0:
+        lookup = rate_lookup or (lambda c: get_base_rate(c)[0])
+        rate = float(lookup(currency))
+
+    foreign_amount = doc.get("foreign_amount")
+    if _is_number(foreign_amount) and foreign_amount:
+        return int(round(foreign_amount * rate)), float(rate)
+    return int(round(amount * rate)), float(rate)
+
+
+def stamp_amount_base(doc: dict, rate_lookup=None) -> dict:
+    """
+    Set `amount_base`, `base_rate` and `base_currency` on a transaction in place.
+
+    Args:
+        doc: Transaction document about to be written
+        rate_lookup: Optional rate lookup override
+
+    Returns:
+        The same document
+    """
+    amount_base, base_rate = normalize_amount(doc, rate_lookup)
+    doc["amount_base"] = amount_base
+    doc["base_rate"] = base_rate
+    doc["base_currency"] = BASE_CURRENCY
+    return doc
+
+
+def backfill_amount_base(batch_size: int = 1000) -> int:
+    """
+    Stamp `amount_base` on existing transactions that do not have it yet.
+
+    Args:
+        batch_size: Number of updates sent per bulk_write
+
+    Returns:
+        Number of documents updated
+    """
+    projection = {"amount": 1, "currency": 1, "foreign_amount": 1, "exchange_rate": 1}
+    cursor = transactions_collection.find({"amount_base": {"$exists": False}}, projection)
+
+    updated = 0
+    ops = []
+    for doc in cursor:
+        fields = stamp_amount_base({k: v for k, v in doc.items() if k != "_id"})
+        ops.append(UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {k: fields[k] for k in ("amount_base", "base_rate", "base_currency")}}
+        ))
+        if len(ops) >= batch_size:
+            updated += transactions_collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += transactions_collection.bulk_write(ops, ordered=False).modified_count
+    return updated
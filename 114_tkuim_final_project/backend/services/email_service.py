@@ -0,0 +1,269 @@
+"""
+Email Service - Outbox and Background SMTP Sender
+
+This module contains the email outbox. Endpoints only insert a message
+into the `email_outbox` collection; a background sender claims pending
+messages in batches, delivers them over one reused SMTP session, and
+retries failures with exponential backoff. Bodies may contain reset links
+and verification codes, so a message's HTML is removed as soon as it is
+sent or given up on, and every message expires one day after it was queued.
+"""
+import os
+import smtplib
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from database import email_outbox_collection
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+CLAIM_LEASE_SECONDS = 120
+DEFAULT_SENDER = "noreply@localhost"
+
+# Errors that mean the session is unusable and must be reopened
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError)
+
+
+def enqueue_email(to: str, subject: str, html: str) -> str:
+    """
+    Queue an HTML email for the background sender.
+
+    Returns:
+        Outbox message ID
+    """
+    now = datetime.utcnow()
+    result = email_outbox_collection.insert_one({
+        "to": to,
+        "subject": subject,
+        "html": html,
+        "status": STATUS_PENDING,
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now
+    })
+    if _sender is not None:
+        _sender.wake()
+    return str(result.inserted_id)
+
+
+def backoff_seconds(attempts: int) -> int:
+    """Delay before the next attempt after `attempts` failures."""
+    return min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+
+
+def build_message(sender: Optional[str], doc: dict) -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg['From'] = sender or DEFAULT_SENDER
+    msg['To'] = doc["to"]
+    msg['Subject'] = doc["subject"]
+    msg.attach(MIMEText(doc["html"], 'html'))
+    return msg
+
+
+class SmtpSession:
+    """
+    One SMTP connection reused across messages and batches.
+
+    The connection is opened lazily, closed after `idle_timeout` seconds
+    without traffic, and reopened once if the server dropped it.
+    """
+
+    def __init__(self, host: str, port: int, username: Optional[str] = None,
+                 password: Optional[str] = None, starttls: bool = True,
+                 idle_timeout: float = 60, timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.connections = 0
+        self._smtp = None
+        self._last_used = 0.0
+
+    @classmethod
+    def from_env(cls) -> "SmtpSession":
+        return cls(
+            host=os.getenv("SMTP_SERVER", "smtp.gmail.com"),
+            port=int(os.getenv("SMTP_PORT", "587")),
+            username=os.getenv("SMTP_EMAIL"),
+            password=os.getenv("SMTP_PASSWORD"),
+            starttls=os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+        )
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            if self.starttls:
+                # Never fall back to plaintext: credentials must not be sent unencrypted
+                if not smtp.has_extn("starttls"):
+                    raise smtplib.SMTPNotSupportedError("SMTP 伺服器不支援 STARTTLS")
+                smtp.starttls()
+                smtp.ehlo()
+            if self.username and self.password:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self.connections += 1
+
+    def send(self, msg) -> None:
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+        for attempt in range(2):
+            if self._smtp is None:
+                self._connect()
+            try:
+                self._smtp.send_message(msg)
+                self._last_used = time.monotonic()
+                return
+            except smtplib.SMTPServerDisconnected:
+                self._smtp = None
+                if attempt:
+                    raise
+
+    def close(self) -> None:
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+
+def claim_batch(worker_id: str, limit: int) -> List[dict]:
+    """
+    Atomically claim up to `limit` messages that are due for delivery.
+
+    Messages left in "sending" by a crashed worker are reclaimed once their
+    lease has expired.
+    """
+    now = datetime.utcnow()
+    lease = now + timedelta(seconds=CLAIM_LEASE_SECONDS)
+    claimed = []
+    while len(claimed) < limit:
+        doc = email_outbox_collection.find_one_and_update(
+            {"$or": [
+                {"status": STATUS_PENDING, "next_attempt_at": {"$lte": now}},
+                {"status": STATUS_SENDING, "claimed_until": {"$lt": now}}
+            ]},
+            {"$set": {"status": STATUS_SENDING, "claimed_until": lease, "claimed_by": worker_id}},
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if not doc:
+            break
+        claimed.append(doc)
+    return claimed
+
+
+def _record_failure(doc: dict, error: Exception) -> bool:
+    attempts = doc.get("attempts", 0) + 1
+    failed = attempts >= MAX_ATTEMPTS
+    update = {"$set": {
+        "status": STATUS_FAILED if failed else STATUS_PENDING,
+        "attempts": attempts,
+        "last_error": str(error),
+        "next_attempt_at": datetime.utcnow() + timedelta(seconds=backoff_seconds(attempts)),
+        "claimed_until": None
+    }}
+    if failed:
+        update["$unset"] = {"html": ""}
+    email_outbox_collection.update_one({"_id": doc["_id"]}, update)
+    return failed
+
+
+def deliver_batch(session: SmtpSession, worker_id: str, batch_size: int = 50) -> Dict[str, int]:
+    """
+    Claim and send one batch of messages over `session`.
+
+    Returns:
+        {"sent": n, "retry": n, "failed": n}
+    """
+    result = {"sent": 0, "retry": 0, "failed": 0}
+    batch = claim_batch(worker_id, batch_size)
+    for doc in batch:
+        try:
+            session.send(build_message(session.username, doc))
+        except Exception as e:
+            if isinstance(e, CONNECTION_ERRORS):
+                session.close()
+            result["failed" if _record_failure(doc, e) else "retry"] += 1
+            continue
+        email_outbox_collection.update_one(
+            {"_id": doc["_id"]},
+            {"$set": {"status": STATUS_SENT, "sent_at": datetime.utcnow(), "claimed_until": None},
+             "$unset": {"html": ""},
+             "$inc": {"attempts": 1}}
+        )
+        result["sent"] += 1
+    return result
+
+
+class EmailSender:
+    """In-process background thread that drains the outbox."""
+
+    def __init__(self, session: Optional[SmtpSession] = None, interval: float = 5, batch_size: int = 50):
+        self.session = session or SmtpSession.from_env()
+        self.interval = interval
+        self.batch_size = batch_size
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        global _sender
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="email-sender", daemon=True)
+        self._thread.start()
+        _sender = self
+
+    def stop(self):
+        global _sender
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.session.close()
+        if _sender is self:
+            _sender = None
+
+    def wake(self):
+        """Deliver newly queued mail without waiting for the next poll."""
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                result = deliver_batch(self.session, self.worker_id, self.batch_size)
+                if result["failed"]:
+                    print(f"📧 {result['failed']} 封郵件多次發送失敗，已停止重試")
+                if result["sent"] == self.batch_size:
+                    continue  # More may be waiting
+            except Exception as e:
+                print(f"Email sender error: {e}")
+            self._wake.wait(self.interval)
+
+
+_sender: Optional[EmailSender] = None
@@ -0,0 +1,245 @@
+"""
+Export Service - Excel Exports and Background Export Jobs
+
+This module builds the transaction Excel export and runs it as a
+background job. Finished files are stored in GridFS (`exports` bucket)
+and expire after `EXPORT_TTL_SECONDS`. A job is keyed by its filter and
+the data versions of the users it covers, so asking again for an
+unchanged export returns the existing file instead of rebuilding it.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+import gridfs
+from bson import ObjectId
+
+from database import db, transactions_collection, export_jobs_collection
+from services.balance_service import get_data_versions
+from services.family_service import resolve_members
+
+EXPORT_TTL_SECONDS = int(os.getenv("EXPORT_TTL_SECONDS", str(24 * 3600)))
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "1"))
+# Pending/running jobs older than this are assumed lost (e.g. worker restart)
+STALE_JOB_SECONDS = 600
+
+EXPORT_COLUMNS = ["date", "type", "category", "title", "amount", "payment_method", "note", "user_display_name"]
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+_fs = gridfs.GridFS(db, collection="exports")
+_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+
+
+def export_query(scope: Optional[List[str]]) -> dict:
+    """Transaction filter for an export scope (None = all users)."""
+    return {} if scope is None else {"user_id": {"$in": scope}}
+
+
+def write_export_xlsx(scope: Optional[List[str]], fileobj) -> int:
+    """
+    Write the Excel export of a scope to a binary file object.
+
+    Returns:
+        Number of exported transactions
+    """
+    import pandas as pd
+
+    data = list(transactions_collection.find(export_query(scope)).sort("date", -1))
+    if not data:
+        return 0
+
+    # 記帳人名稱：一次查詢所有使用者
+    profiles = resolve_members({doc["user_id"] for doc in data if doc.get("user_id")})
+    for doc in data:
+        doc["_id"] = str(doc["_id"])
+        profile = profiles.get(doc.get("user_id"))
+        doc["user_display_name"] = (profile or {}).get("display_name") or "Unknown"
+
+    df = pd.DataFrame(data)
+    df = df[[c for c in EXPORT_COLUMNS if c in df.columns]]
+    with pd.ExcelWriter(fileobj, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Transactions')
+    return len(data)
+
+
+def cache_key(scope: Optional[List[str]]) -> str:
+    """Key identifying an export by its filter and the current data versions."""
+    versions = get_data_versions(scope)
+    payload = {
+        "scope": scope,
+        "versions": sorted((str(k), v) for k, v in versions.items())
+    }
+    return hashlib.sha256(json.dumps(payload).encode()).hexdigest()
+
+
+def job_to_api(job: dict) -> dict:
+    """API representation of an export job."""
+    return {
+        "id": str(job["_id"]),
+        "status": job["status"],
+        "rows": job.get("rows"),
+        "size": job.get("size"),
+        "error": job.get("error"),
+        "created_at": job["created_at"].isoformat(),
+        "expires_at": job["expires_at"].isoformat()
+    }
+
+
+def submit_export(scope: Optional[List[str]], requested_by: str) -> Tuple[dict, bool]:
+    """
+    Start an export job, or reuse one with the same filter and data version.
+
+    Args:
+        scope: Sorted user IDs to export (None = all users)
+        requested_by: User ID of the requester
+
+    Returns:
+        (job, cached) where cached is True if an existing job was reused
+    """
+    purge_expired()
+    key = cache_key(scope)
+    now = datetime.utcnow()
+    existing = export_jobs_collection.find_one({
+        "cache_key": key,
+        "expires_at": {"$gt": now},
+        "$or": [
+            {"status": STATUS_DONE},
+            {"status": {"$in": [STATUS_PENDING, STATUS_RUNNING]},
+             "created_at": {"$gt": now - timedelta(seconds=STALE_JOB_SECONDS)}}
+        ]
+    }, sort=[("created_at", -1)])
+    if existing:
+        return job_to_api(existing), True
+
+    job = {
+        "cache_key": key,
+        "scope": scope,
+        "requested_by": requested_by,
+        "status": STATUS_PENDING,
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=EXPORT_TTL_SECONDS)
+    }
+    job["_id"] = export_jobs_collection.insert_one(job).inserted_id
+    _executor.submit(run_export_job, job["_id"])
+    return job_to_api(job), False
+
+
+def run_export_job(job_id: ObjectId) -> None:
+    """Build the file of a job and store it in GridFS (runs in the export worker)."""
+    job = export_jobs_collection.find_one_and_update(
+        {"_id": job_id, "status": STATUS_PENDING},
+        {"$set": {"status": STATUS_RUNNING, "started_at": datetime.utcnow()}}
+    )
+    if not job:
+        return
+    try:
+        # Spool to disk: large exports never sit fully in memory
+        with tempfile.TemporaryFile() as tmp:
+            rows = write_export_xlsx(job["scope"], tmp)
+            size = tmp.tell()
+            tmp.seek(0)
+            file_id = _fs.put(
+                tmp,
+                filename="PyMoney_Export.xlsx",
+                content_type=XLSX_MEDIA_TYPE,
+                metadata={"job_id": job_id, "expires_at": job["expires_at"]}
+            ) if rows else None
+        export_jobs_collection.update_one(
+            {"_id": job_id},
+            {"$set": {"status": STATUS_DONE, "file_id": file_id, "rows": rows,
+                      "size": size if rows else 0, "finished_at": datetime.utcnow()}}
+        )
+    except Exception as e:
+        print(f"Export job {job_id} failed: {e}")
+        export_jobs_collection.update_one(
+            {"_id": job_id},
+            {"$set": {"status": STATUS_FAILED, "error": str(e), "finished_at": datetime.utcnow()}}
+        )
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """Raw job document, or None if unknown or expired."""
+    if not ObjectId.is_valid(job_id):
+        return None
+    return export_jobs_collection.find_one({"_id": ObjectId(job_id), "expires_at": {"$gt": datetime.utcnow()}})
+
+
+def can_access_job(job: dict, user: dict) -> bool:
+    """
+    Whether a user may read a job's status and file.
+
+    Access follows the exported data, not the requester: jobs are reused
+    across requesters with the same filter, so a user may open any job
+    whose scope is exactly their own data. Admins may open every job.
+    """
+    if user.get("role") == "admin":
+        return True
+    return job.get("requested_by") == user["id"] or job.get("scope") == [user["id"]]
+
+
+def open_job_file(job: dict):
+    """GridOut of a finished job (seekable, read in chunks)."""
+    return _fs.get(job["file_id"])
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range `Range: bytes=...` header.
+
+    Returns:
+        (start, end) inclusive, None for no/unsupported header
+
+    Raises:
+        ValueError: If the range cannot be satisfied
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    if start_text == "":
+        # Suffix range: last N bytes
+        length = int(end_text)
+        if length <= 0:
+            raise ValueError("Unsatisfiable range")
+        return max(0, size - length), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if start >= size or end < start:
+        raise ValueError("Unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+def iter_file_range(grid_out, start: int, end: int, chunk_size: int = 256 * 1024):
+    """Yield bytes start..end (inclusive) of a GridFS file."""
+    grid_out.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = grid_out.read(min(chunk_size, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+def purge_expired() -> int:
+    """
+    Delete expired export jobs and their GridFS files.
+
+    Returns:
+        Number of files deleted
+    """
+    now = datetime.utcnow()
+    count = 0
+    for grid_file in _fs.find({"metadata.expires_at": {"$lte": now}}):
+        _fs.delete(grid_file._id)
+        count += 1
+    export_jobs_collection.delete_many({"expires_at": {"$lte": now}})
+    return count
@@ -0,0 +1,61 @@
+"""
+Family Service - Family and Ledger Membership Logic
+
+This module resolves member ids to display profiles for the family and
+ledger member panels with a single `$in` query, backed by a short-TTL
+member directory cache.
+"""
+from typing import Dict, Iterable, Any
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from database import users_collection
+from services.cache import TTLCache
+
+DIRECTORY_TTL_SECONDS = 30
+
+# Only the fields the member panels return
+MEMBER_PROJECTION = {"username": 1, "display_name": 1, "role": 1}
+
+_member_directory = TTLCache(ttl=DIRECTORY_TTL_SECONDS)
+
+
+def resolve_members(member_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Look up profiles for many users in one round trip.
+
+    Args:
+        member_ids: User ID strings (invalid or unknown IDs are skipped)
+
+    Returns:
+        {user_id: {"id", "username", "display_name", "role"}}
+    """
+    found = {}
+    missing = []
+    for member_id in dict.fromkeys(member_ids):
+        profile = _member_directory.get(member_id)
+        if profile is not None:
+            found[member_id] = profile
+            continue
+        try:
+            missing.append(ObjectId(member_id))
+        except (InvalidId, TypeError):
+            continue
+
+    if missing:
+        for user in users_collection.find({"_id": {"$in": missing}}, MEMBER_PROJECTION):
+            profile = {
+                "id": str(user["_id"]),
+                "username": user.get("username"),
+                "display_name": user.get("display_name"),
+                "role": user.get("role")
+            }
+            _member_directory.set(profile["id"], profile)
+            found[profile["id"]] = profile
+    return found
+
+
+def invalidate_member(user_id: str) -> None:
+    """Drop a cached profile after the user changed it or was deleted."""
+    _member_directory.invalidate(user_id)
@@ -0,0 +1,161 @@
+"""
+Forecast Service - Projected Account Balances
+
+This module projects account balances forward by combining current balances,
+expanded recurring rules and a trailing per-category spending rate. The
+projection is computed with NumPy over an (accounts x days) array.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any
+
+import numpy as np
+
+from database import transactions_collection, recurring_collection
+from services.currency_service import AMOUNT_BASE_EXPR
+from services.recurring_service import expand_occurrences, DATE_FORMAT
+
+DEFAULT_HORIZONS = (30, 90, 365)
+DEFAULT_TRAILING_DAYS = 90
+
+
+def get_trailing_rates(member_ids: List[str], today: str,
+                       trailing_days: int = DEFAULT_TRAILING_DAYS) -> List[Dict[str, Any]]:
+    """
+    Average daily spending per (category, payment_method) over the trailing window.
+
+    Transactions generated by recurring rules are excluded because the rules
+    themselves are projected separately.
+
+    Args:
+        member_ids: User IDs to include (empty for all)
+        today: Last day of the window (YYYY-MM-DD, exclusive)
+        trailing_days: Window length in days
+
+    Returns:
+        List of dicts with category, account and daily_rate
+    """
+    start = (datetime.strptime(today, DATE_FORMAT) - timedelta(days=trailing_days)).strftime(DATE_FORMAT)
+    match_stage = {
+        "type": "expense",
+        "date": {"$gte": start, "$lt": today},
+        "recurring_id": {"$exists": False}
+    }
+    if member_ids:
+        match_stage["user_id"] = {"$in": member_ids}
+
+    pipeline = [
+        {"$match": match_stage},
+        {"$group": {
+            "_id": {"category": "$category", "account": "$payment_method"},
+            "total": {"$sum": AMOUNT_BASE_EXPR}
+        }}
+    ]
+    return [{
+        "category": item["_id"].get("category"),
+        "account": item["_id"].get("account"),
+        "daily_rate": (item["total"] or 0) / trailing_days
+    } for item in transactions_collection.aggregate(pipeline)]
+
+
+def project_balances(balances: Dict[str, float], occurrences, trailing_rates: List[Dict[str, Any]],
+                     start: str, horizons=DEFAULT_HORIZONS) -> Dict[str, Any]:
+    """
+    Project account balances over the largest horizon.
+
+    Args:
+        balances: Current balance per account
+        occurrences: Iterable of recurring occurrences (date, type, amount, payment_method)
+        trailing_rates: Output of get_trailing_rates
+        start: First projected day (YYYY-MM-DD); day 0 is `start`
+        horizons: Day offsets to report
+
+    Returns:
+        Dict with per-account balances at each horizon and per-category expected spend
+    """
+    horizon = max(horizons)
+    start_dt = datetime.strptime(start, DATE_FORMAT)
+
+    occurrences = [o for o in occurrences if o.get("payment_method")]
+    accounts = sorted(
+        (set(balances) | {o["payment_method"] for o in occurrences} | {r["account"] for r in trailing_rates})
+        - {None}
+    )
+    index = {name: i for i, name in enumerate(accounts)}
+
+    # Recurring events scattered into the (accounts x days) delta array
+    deltas = np.zeros((len(accounts), horizon), dtype=np.float64)
+    if occurrences:
+        rows = np.fromiter((index[o["payment_method"]] for o in occurrences), dtype=np.intp, count=len(occurrences))
+        days = np.fromiter(
+            ((datetime.strptime(o["date"], DATE_FORMAT) - start_dt).days for o in occurrences),
+            dtype=np.intp, count=len(occurrences)
+        )
+        signs = np.fromiter((1.0 if o["type"] == "income" else -1.0 for o in occurrences),
+                            dtype=np.float64, count=len(occurrences))
+        amounts = np.fromiter((o["amount"] for o in occurrences), dtype=np.float64, count=len(occurrences))
+        in_range = (days >= 0) & (days < horizon)
+        np.add.at(deltas, (rows[in_range], days[in_range]), signs[in_range] * amounts[in_range])
+
+    # Trailing spending applied as a constant daily outflow per account
+    daily_spend = np.zeros(len(accounts), dtype=np.float64)
+    rated = [r for r in trailing_rates if r["account"] in index]
+    if rated:
+        np.add.at(daily_spend, [index[r["account"]] for r in rated], [r["daily_rate"] for r in rated])
+    deltas -= daily_spend[:, None]
+
+    current = np.array([balances.get(name, 0) or 0 for name in accounts], dtype=np.float64)
+    trajectory = current[:, None] + np.cumsum(deltas, axis=1)
+
+    result = []
+    for name, i in index.items():
+        result.append({
+            "account": name,
+            "balance": float(current[i]),
+            "projected": {str(h): round(float(trajectory[i, h - 1]), 2) for h in horizons}
+        })
+
+    categories = {}
+    for r in trailing_rates:
+        categories[r["category"]] = categories.get(r["category"], 0) + r["daily_rate"]
+
+    return {
+        "start": start,
+        "horizons": list(horizons),
+        "accounts": result,
+        "category_spend": {
+            cat: {str(h): round(rate * h, 2) for h in horizons} for cat, rate in sorted(categories.items())
+        }
+    }
+
+
+def forecast(balances: Dict[str, float], member_ids: List[str], today: Optional[str] = None,
+             horizons=DEFAULT_HORIZONS, trailing_days: int = DEFAULT_TRAILING_DAYS) -> Dict[str, Any]:
+    """
+    Build a balance forecast for the given members.
+
+    Args:
+        balances: Current balance per account (from the account stats)
+        member_ids: User IDs whose rules and history are included
+        today: Reference date, defaults to the current date
+        horizons: Day offsets to report
+        trailing_days: Window for the spending-rate model
+
+    Returns:
+        Projection result from project_balances
+    """
+    today = today or datetime.now().strftime(DATE_FORMAT)
+    start = (datetime.strptime(today, DATE_FORMAT) + timedelta(days=1)).strftime(DATE_FORMAT)
+    end = (datetime.strptime(today, DATE_FORMAT) + timedelta(days=max(horizons))).strftime(DATE_FORMAT)
+
+    rule_query = {"is_active": True, "next_date": {"$lte": end}}
+    if member_ids:
+        rule_query["user_id"] = {"$in": member_ids}
+    rules = recurring_collection.find(rule_query)
+
+    return project_balances(
+        balances,
+        expand_occurrences(rules, start, end),
+        get_trailing_rates(member_ids, today, trailing_days),
+        start,
+        horizons
+    )
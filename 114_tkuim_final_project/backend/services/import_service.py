@@ -0,0 +1,446 @@
+"""
+Import Service - Streaming CSV/Excel Import Parsing
+
+This module turns an uploaded file into normalized transaction records.
+CSV files are read with the `csv` module straight from the upload stream
+(BOM and encoding detected from the first bytes) and XLSX files with
+openpyxl in read-only mode; columns are coerced to their types row by
+row, and rows are handed out in fixed-size chunks so memory stays flat
+regardless of file size. pandas is only loaded for legacy .xls files.
+
+Every row is validated (required values, numeric amount, known type,
+parseable date) and problems are reported per row, so a whole file can
+be checked in one dry run before anything is written.
+
+Imported rows carry an `import_fingerprint` under a unique index, so
+re-importing the same statement skips rows that are already stored with
+one `$in` probe per chunk.
+"""
+import codecs
+import csv
+import hashlib
+import io
+import math
+import re
+import unicodedata
+from datetime import date, datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+from database import transactions_collection
+
+# `category` may be missing or empty: the import fills it from the user's history
+REQUIRED_COLUMNS = ["date", "title", "amount"]
+COLUMN_DEFAULTS = {"type": "expense", "payment_method": "Cash"}
+TRANSACTION_TYPES = {"income", "expense", "transfer"}
+CHUNK_SIZE = 1000
+# Rows listed in a validation report; further errors are only counted
+MAX_REPORTED_ERRORS = 1000
+
+# Bytes inspected for BOM and encoding detection
+SAMPLE_SIZE = 64 * 1024
+# Fallback for files saved by Excel on Traditional Chinese Windows
+LEGACY_ENCODING = "cp950"
+
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+def detect_encoding(sample: bytes) -> str:
+    """
+    Guess the text encoding of a CSV file from its first bytes.
+
+    Args:
+        sample: Leading bytes of the file
+
+    Returns:
+        Codec name usable with `io.TextIOWrapper`
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # Incremental decode: a multi-byte character cut at the end of the sample is fine
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return LEGACY_ENCODING
+
+
+def _clean_header(columns: Iterable[Optional[str]]) -> List[str]:
+    return [(c or "").strip().lstrip("\ufeff") for c in columns]
+
+
+def iter_csv_rows(fileobj) -> Tuple[List[str], Iterator[Dict[str, Any]]]:
+    """
+    Read a CSV upload row by row.
+
+    Args:
+        fileobj: Binary file object positioned at the start of the file
+
+    Returns:
+        (column names, iterator of {column: raw string value})
+    """
+    sample = fileobj.read(SAMPLE_SIZE)
+    fileobj.seek(0)
+    text = io.TextIOWrapper(fileobj, encoding=detect_encoding(sample), newline="")
+    reader = csv.reader(text)
+    columns = _clean_header(next(reader, []))
+
+    def rows():
+        try:
+            for values in reader:
+                if any(v.strip() for v in values):
+                    yield dict(zip(columns, values))
+        finally:
+            # Leave the upload open so it can be read again (validation, then import)
+            text.detach()
+
+    return columns, rows()
+
+
+def iter_xlsx_rows(fileobj) -> Tuple[List[str], Iterator[Dict[str, Any]]]:
+    """
+    Read an XLSX upload row by row with openpyxl in read-only mode.
+
+    Cells are streamed from the sheet XML instead of loading the workbook
+    DOM. Every sheet whose header row has the required columns is
+    imported, so bank workbooks split by month come in whole; other
+    sheets (summaries, notes) are skipped.
+
+    Returns:
+        (column names, iterator of {column: cell value})
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    sheets = []
+    for sheet in workbook.worksheets:
+        header = next(sheet.iter_rows(max_row=1, values_only=True), None)
+        if header:
+            sheets.append((sheet, _clean_header(None if c is None else str(c) for c in header)))
+    importable = [(sheet, columns) for sheet, columns in sheets if not missing_columns(columns)]
+    if not importable:
+        workbook.close()
+        # Report the first sheet's header so the caller can name the missing columns
+        return (sheets[0][1] if sheets else []), iter(())
+
+    def rows():
+        try:
+            for sheet, columns in importable:
+                for values in sheet.iter_rows(min_row=2, values_only=True):
+                    if any(v is not None and str(v).strip() for v in values):
+                        yield dict(zip(columns, values))
+        finally:
+            workbook.close()
+
+    return importable[0][1], rows()
+
+
+def iter_xls_rows(fileobj) -> Tuple[List[str], Iterator[Dict[str, Any]]]:
+    """
+    Read a legacy .xls upload (first sheet) through pandas.
+
+    Returns:
+        (column names, iterator of {column: cell value})
+    """
+    import pandas as pd
+
+    df = pd.read_excel(fileobj)
+    df = df.astype(object).where(df.notna(), None)
+    columns = _clean_header(str(c) for c in df.columns)
+    df.columns = columns
+    return columns, iter(df.to_dict(orient="records"))
+
+
+def read_rows(fileobj, filename: str) -> Tuple[List[str], Iterator[Dict[str, Any]]]:
+    """
+    Pick the reader for an upload by its extension.
+
+    Raises:
+        ValueError: If the file type is not supported
+    """
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return iter_csv_rows(fileobj)
+    if name.endswith(".xlsx"):
+        return iter_xlsx_rows(fileobj)
+    if name.endswith(".xls"):
+        return iter_xls_rows(fileobj)
+    raise ValueError("Unsupported file type")
+
+
+def missing_columns(columns: List[str]) -> List[str]:
+    return [c for c in REQUIRED_COLUMNS if c not in columns]
+
+
+def chunked(rows: Iterable, size: int = CHUNK_SIZE) -> Iterator[list]:
+    """Split an iterator into lists of at most `size` items."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class DateParser:
+    """
+    Parses the date formats found in bank and app exports.
+
+    The pattern that matched last is tried first, so a file written in
+    one format costs a single regex match per row.
+    """
+
+    PATTERNS = [
+        # 2024-01-31, 2024/1/31, 2024.01.31, optionally followed by a time
+        (re.compile(r"^(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})(?:[ T].*)?$"), (1, 2, 3)),
+        # 20240131
+        (re.compile(r"^(\d{4})(\d{2})(\d{2})$"), (1, 2, 3)),
+        # 01/31/2024 (month first, as pandas assumes)
+        (re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{4})(?:[ T].*)?$"), (3, 1, 2)),
+    ]
+
+    def __init__(self):
+        self._patterns = list(self.PATTERNS)
+
+    def parse(self, value: Any) -> Optional[str]:
+        """
+        Normalize a date cell to "YYYY-MM-DD".
+
+        Returns:
+            The date string, or None if the value is empty or unparseable
+        """
+        if isinstance(value, (datetime, date)):
+            return value.strftime("%Y-%m-%d")
+        text = str(value).strip() if value is not None else ""
+        if not text:
+            return None
+        for i, (pattern, order) in enumerate(self._patterns):
+            match = pattern.match(text)
+            if not match:
+                continue
+            try:
+                parsed = date(*(int(match.group(g)) for g in order))
+            except ValueError:
+                return None
+            if i:
+                self._patterns.insert(0, self._patterns.pop(i))
+            return parsed.strftime("%Y-%m-%d")
+        return None
+
+
+_AMOUNT_NOISE = re.compile(r"[,\s$]|NT|TWD|元")
+
+
+def parse_amount(value: Any) -> Optional[float]:
+    """
+    Coerce an amount cell to int (whole numbers) or float.
+
+    Returns:
+        The number, or None if the value is empty
+
+    Raises:
+        ValueError: If the value is not a number
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = value
+    else:
+        text = _AMOUNT_NOISE.sub("", str(value))
+        if not text:
+            return None
+        number = float(text)
+    if not math.isfinite(number):
+        raise ValueError(f"Not a finite number: {value}")
+    if isinstance(number, float) and number.is_integer():
+        return int(number)
+    return number
+
+
+def normalize_record(row: Dict[str, Any], date_parser: DateParser) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Coerce one raw row to a transaction record and validate it.
+
+    Strings are stripped, empty cells become None, `type` and
+    `payment_method` get their defaults, `amount` becomes a number and
+    `date` a "YYYY-MM-DD" string.
+
+    Returns:
+        (record, list of problems; empty if the row can be imported)
+    """
+    record = {}
+    for key, value in row.items():
+        if not key:
+            continue  # Extra cells without a header
+        if isinstance(value, str):
+            value = value.strip() or None
+        record[key] = value
+    for key, default in COLUMN_DEFAULTS.items():
+        if not record.get(key):
+            record[key] = default
+
+    errors = [f"{column} 不可為空白" for column in REQUIRED_COLUMNS if record.get(column) is None]
+    raw_amount = record.get("amount")
+    try:
+        record["amount"] = parse_amount(raw_amount)
+    except ValueError:
+        errors.append(f"金額格式錯誤: {raw_amount}")
+    raw_date = record.get("date")
+    record["date"] = date_parser.parse(raw_date)
+    if raw_date is not None and record["date"] is None:
+        errors.append(f"日期無法解析: {raw_date}")
+    if record["type"] not in TRANSACTION_TYPES:
+        errors.append(f"未知的類型: {record['type']}")
+    return record, errors
+
+
+def validate_chunk(chunk: List[Dict[str, Any]], date_parser: DateParser,
+                   first_row: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Normalize and validate one chunk of rows.
+
+    Args:
+        chunk: Raw rows
+        date_parser: Parser shared by the whole file
+        first_row: Spreadsheet row number of the chunk's first row
+
+    Returns:
+        (valid records, [{"row": row number, "errors": [...]}] for invalid rows)
+    """
+    valid, invalid = [], []
+    for row_number, row in enumerate(chunk, start=first_row):
+        record, errors = normalize_record(row, date_parser)
+        if errors:
+            invalid.append({"row": row_number, "errors": errors})
+        else:
+            valid.append(record)
+    return valid, invalid
+
+
+class ImportReport:
+    """Row counts and per-row errors of one import (capped at MAX_REPORTED_ERRORS)."""
+
+    def __init__(self):
+        self.rows = 0
+        self.error_rows = 0
+        self.duplicates = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def add(self, row_count: int, invalid: List[Dict[str, Any]]) -> None:
+        self.rows += row_count
+        self.error_rows += len(invalid)
+        self.errors.extend(invalid[:MAX_REPORTED_ERRORS - len(self.errors)])
+
+    def to_api(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "valid_rows": self.rows - self.error_rows,
+            "error_rows": self.error_rows,
+            "duplicates": self.duplicates,
+            "errors": self.errors,
+            "errors_truncated": self.error_rows > len(self.errors)
+        }
+
+
+def validate_upload(rows: Iterable[Dict[str, Any]], fingerprint: Optional["Fingerprinter"] = None,
+                    chunk_size: int = CHUNK_SIZE) -> ImportReport:
+    """
+    Validate a whole upload without writing anything.
+
+    Args:
+        rows: Raw rows from `read_rows`
+        fingerprint: If given, also count rows that are already stored
+        chunk_size: Rows per chunk
+
+    Returns:
+        The report
+    """
+    report = ImportReport()
+    date_parser = DateParser()
+    first_row = 2  # Row 1 is the header
+    for chunk in chunked(rows, chunk_size):
+        valid, invalid = validate_chunk(chunk, date_parser, first_row)
+        report.add(len(chunk), invalid)
+        if fingerprint and valid:
+            fingerprints = [fingerprint(record) for record in valid]
+            report.duplicates += len(find_existing(fingerprints))
+        first_row += len(chunk)
+    return report
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_title(title: Any) -> str:
+    """Title as compared for duplicates: NFKC, case-folded, single spaces."""
+    text = unicodedata.normalize("NFKC", str(title or ""))
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+class Fingerprinter:
+    """
+    Fingerprints imported rows on (user, date, amount, title, payment method).
+
+    Identical rows within one file (two coffees on the same day) are told
+    apart by their occurrence number, so re-importing the file reproduces
+    exactly the same fingerprints.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self._seen: Dict[str, int] = {}
+
+    def __call__(self, record: Dict[str, Any]) -> str:
+        amount = record.get("amount")
+        key = "\x1f".join([
+            self.user_id,
+            str(record.get("date") or ""),
+            repr(amount) if amount is not None else "",
+            normalize_title(record.get("title")),
+            str(record.get("payment_method") or "")
+        ])
+        occurrence = self._seen.get(key, 0)
+        self._seen[key] = occurrence + 1
+        return hashlib.sha1(f"{key}\x1f{occurrence}".encode()).hexdigest()
+
+
+def find_existing(fingerprints: List[str]) -> set:
+    """Fingerprints of the list that are already stored (one `$in` query)."""
+    return {
+        doc["import_fingerprint"]
+        for doc in transactions_collection.find(
+            {"import_fingerprint": {"$in": fingerprints}}, {"import_fingerprint": 1, "_id": 0}
+        )
+    }
+
+
+def insert_new(records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Insert the records of one chunk whose fingerprint is not stored yet.
+
+    Args:
+        records: Records with `import_fingerprint` set
+
+    Returns:
+        (inserted records, number of skipped duplicates)
+    """
+    existing = find_existing([r["import_fingerprint"] for r in records])
+    new = [r for r in records if r["import_fingerprint"] not in existing]
+    if not new:
+        return [], len(records)
+    try:
+        transactions_collection.insert_many(new, ordered=False)
+    except BulkWriteError as e:
+        # A concurrent import stored some of the same rows first
+        failed = {err["index"] for err in e.details["writeErrors"] if err.get("code") == 11000}
+        if len(failed) != len(e.details["writeErrors"]):
+            raise
+        new = [r for i, r in enumerate(new) if i not in failed]
+    return new, len(records) - len(new)
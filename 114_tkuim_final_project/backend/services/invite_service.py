@@ -0,0 +1,99 @@
+"""
+Invite Service - Ledger Invite Codes
+
+This module contains invite code creation and lookup. Invites store a real
+UTC datetime in `expires_at`; a TTL index removes them once expired and a
+unique index on `code` makes generation a plain insert that is retried on
+a duplicate key.
+"""
+import secrets
+import string
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from database import invites_collection
+
+CODE_ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 6
+MAX_ATTEMPTS = 10
+
+
+def _now() -> datetime:
+    # PyMongo returns naive UTC datetimes, so compare in naive UTC as well
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def generate_code(length: int = CODE_LENGTH) -> str:
+    """Generate a random invite code"""
+    return ''.join(secrets.choice(CODE_ALPHABET) for _ in range(length))
+
+
+def create_invite(ledger_id: str, created_by: str, ttl: timedelta) -> dict:
+    """
+    Store a new invite with a unique code.
+
+    Args:
+        ledger_id: Ledger the invite grants access to
+        created_by: User ID of the inviter
+        ttl: How long the code stays valid
+
+    Returns:
+        The inserted invite document
+    """
+    now = _now()
+    for _ in range(MAX_ATTEMPTS):
+        invite = {
+            "code": generate_code(),
+            "ledger_id": ledger_id,
+            "created_by": created_by,
+            "expires_at": now + ttl,
+            "created_at": now
+        }
+        try:
+            invites_collection.insert_one(invite)
+            return invite
+        except DuplicateKeyError:
+            continue
+    raise RuntimeError("Could not generate a unique invite code")
+
+
+def find_invite(code: str) -> Optional[dict]:
+    """Look up an unexpired invite by code (the TTL sweep may lag by a minute)."""
+    return invites_collection.find_one({"code": code, "expires_at": {"$gt": _now()}})
+
+
+def active_invites(ledger_id: str) -> List[dict]:
+    """Unexpired invites of a ledger."""
+    return list(invites_collection.find({"ledger_id": ledger_id, "expires_at": {"$gt": _now()}}))
+
+
+def to_api(invite: dict) -> dict:
+    """Serialize an invite with ISO timestamps (marked as UTC)."""
+    doc = dict(invite)
+    if "_id" in doc:
+        doc["id"] = str(doc.pop("_id"))
+    for field in ("expires_at", "created_at"):
+        if isinstance(doc.get(field), datetime):
+            doc[field] = doc[field].replace(tzinfo=timezone.utc).isoformat()
+    return doc
+
+
+def migrate_string_expiry() -> int:
+    """
+    Convert invites stored with ISO-string `expires_at` (local time) to datetimes.
+
+    Returns:
+        Number of invites converted
+    """
+    count = 0
+    for invite in invites_collection.find({"expires_at": {"$type": "string"}}):
+        try:
+            expires = datetime.fromisoformat(invite["expires_at"]).astimezone(timezone.utc).replace(tzinfo=None)
+        except ValueError:
+            invites_collection.delete_one({"_id": invite["_id"]})
+            continue
+        invites_collection.update_one({"_id": invite["_id"]}, {"$set": {"expires_at": expires}})
+        count += 1
+    return count
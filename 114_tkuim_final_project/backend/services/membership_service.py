@@ -0,0 +1,152 @@
+"""
+Membership Service - Unified Authorization Lookups
+
+This module contains the `memberships` collection that every permission
+check reads. Each document is one (principal, scope, role) grant, where
+scope is "ledger:<id>" or "family:<id>". The embedded member lists on
+ledgers and families are still written for display, but access decisions
+come from here: one indexed lookup, or a hit in the in-process decision
+cache.
+"""
+from typing import List, Optional
+
+from pymongo import UpdateOne
+
+from database import memberships_collection, ledgers_collection, families_collection
+from services.cache import TTLCache
+
+LEDGER = "ledger"
+FAMILY = "family"
+
+# Short TTL: revocations made on another worker take effect within this window
+DECISION_TTL_SECONDS = 15
+
+_decisions = TTLCache(ttl=DECISION_TTL_SECONDS, maxsize=50000)
+_NO_ROLE = ""
+
+
+def scope_key(kind: str, scope_id: str) -> str:
+    """Build a scope string such as "ledger:<id>"."""
+    return f"{kind}:{scope_id}"
+
+
+def _invalidate(principal: str, scope: str) -> None:
+    kind = scope.split(":", 1)[0]
+    _decisions.invalidate(("role", principal, scope), ("scopes", principal, kind), ("principals", scope))
+
+
+def grant(principal: str, kind: str, scope_id: str, role: str = "member") -> None:
+    """Give a user a role on a ledger or family (idempotent)."""
+    scope = scope_key(kind, scope_id)
+    memberships_collection.update_one(
+        {"principal": principal, "scope": scope},
+        {"$set": {"role": role}},
+        upsert=True
+    )
+    _invalidate(principal, scope)
+
+
+def revoke(principal: str, kind: str, scope_id: str) -> None:
+    """Remove a user's role on a ledger or family."""
+    scope = scope_key(kind, scope_id)
+    memberships_collection.delete_one({"principal": principal, "scope": scope})
+    _invalidate(principal, scope)
+
+
+def revoke_scope(kind: str, scope_id: str) -> None:
+    """Remove every grant on a ledger or family that is being deleted."""
+    scope = scope_key(kind, scope_id)
+    principals = [m["principal"] for m in memberships_collection.find({"scope": scope}, {"principal": 1})]
+    memberships_collection.delete_many({"scope": scope})
+    for principal in principals:
+        _invalidate(principal, scope)
+    _decisions.invalidate(("principals", scope))
+
+
+def get_role(principal: str, kind: str, scope_id: str) -> Optional[str]:
+    """
+    Role of a user on a ledger or family.
+
+    Returns:
+        Role string, or None if the user has no access
+    """
+    scope = scope_key(kind, scope_id)
+    key = ("role", principal, scope)
+    role = _decisions.get(key)
+    if role is None:
+        doc = memberships_collection.find_one({"principal": principal, "scope": scope}, {"role": 1})
+        role = doc["role"] if doc else _NO_ROLE
+        _decisions.set(key, role)
+    return role or None
+
+
+def has_access(principal: str, kind: str, scope_id: str) -> bool:
+    """True if the user holds any role on the ledger or family."""
+    return get_role(principal, kind, scope_id) is not None
+
+
+def scopes_for(principal: str, kind: str) -> List[str]:
+    """IDs of every ledger (or family) a user belongs to."""
+    key = ("scopes", principal, kind)
+    ids = _decisions.get(key)
+    if ids is None:
+        prefix = f"{kind}:"
+        ids = [
+            m["scope"][len(prefix):]
+            for m in memberships_collection.find(
+                {"principal": principal, "scope": {"$regex": f"^{prefix}"}}, {"scope": 1}
+            )
+        ]
+        _decisions.set(key, ids)
+    return list(ids)
+
+
+def principals_in(kind: str, scope_id: str) -> List[str]:
+    """User IDs holding a role on a ledger or family."""
+    scope = scope_key(kind, scope_id)
+    key = ("principals", scope)
+    ids = _decisions.get(key)
+    if ids is None:
+        ids = [m["principal"] for m in memberships_collection.find({"scope": scope}, {"principal": 1})]
+        _decisions.set(key, ids)
+    return list(ids)
+
+
+def family_of(principal: str) -> Optional[str]:
+    """ID of the family a user belongs to, if any."""
+    families = scopes_for(principal, FAMILY)
+    return families[0] if families else None
+
+
+def rebuild_memberships() -> int:
+    """
+    Rebuild grants from the member lists embedded in ledgers and families.
+
+    Returns:
+        Number of grants written
+    """
+    ops = []
+    for ledger in ledgers_collection.find({}, {"owner_id": 1, "members": 1}):
+        ledger_id = str(ledger["_id"])
+        owner = ledger.get("owner_id")
+        for member in set(ledger.get("members", [])) | ({owner} if owner else set()):
+            role = "owner" if member == owner else "member"
+            ops.append(UpdateOne(
+                {"principal": member, "scope": scope_key(LEDGER, ledger_id)},
+                {"$set": {"role": role}},
+                upsert=True
+            ))
+    for family in families_collection.find({}, {"admin_id": 1, "members": 1}):
+        family_id = str(family["_id"])
+        admin = family.get("admin_id")
+        for member in family.get("members", []):
+            role = "admin" if member == admin else "member"
+            ops.append(UpdateOne(
+                {"principal": member, "scope": scope_key(FAMILY, family_id)},
+                {"$set": {"role": role}},
+                upsert=True
+            ))
+    if ops:
+        memberships_collection.bulk_write(ops, ordered=False)
+    _decisions.clear()
+    return len(ops)
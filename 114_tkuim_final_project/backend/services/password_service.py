@@ -0,0 +1,125 @@
+"""
+Password Service - Password Hashing and Verification
+
+This module contains the one password hashing scheme used by the backend:
+scrypt with a tunable cost, stored as "scrypt$n$r$p$salt$hash". Hashes made
+by older code (salted "salt$sha256" and unsalted SHA-256) still verify and
+are reported by `needs_rehash` so login can upgrade them transparently.
+
+scrypt is CPU- and memory-heavy, so hashing and verification run in a
+bounded thread pool (hashlib releases the GIL while it works). Callers
+beyond the pool's queue get `PasswordPoolBusy` instead of piling up.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+SCHEME = "scrypt"
+
+# Cost: N doubles the CPU time and memory (128 * N * r bytes) per hash
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+POOL_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+POOL_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", str(POOL_WORKERS * 8)))
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when too many hash operations are already queued."""
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * n * r + 1024 * 1024, dklen=KEY_BYTES
+    )
+
+
+def hash_password_sync(password: str, n: Optional[int] = None) -> str:
+    """Hash a password in the calling thread (used by the pool and benchmarks)."""
+    n = n or SCRYPT_N
+    salt = secrets.token_bytes(SALT_BYTES)
+    key = _scrypt(password, salt, n, SCRYPT_R, SCRYPT_P)
+    return f"{SCHEME}${n}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(key)}"
+
+
+def verify_password_sync(plain: str, hashed: str) -> bool:
+    """Verify a password against any supported hash format in the calling thread."""
+    if not hashed:
+        return False
+    parts = hashed.split("$")
+    try:
+        if parts[0] == SCHEME and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            expected = _unb64(parts[5])
+            return hmac.compare_digest(_scrypt(plain, _unb64(parts[4]), n, r, p), expected)
+        if len(parts) == 2:
+            # Legacy: salt$sha256(salt + password)
+            salt, hash_val = parts
+            return hmac.compare_digest(hashlib.sha256((salt + plain).encode()).hexdigest(), hash_val)
+        if len(parts) == 1 and len(hashed) == 64:
+            # Legacy: unsalted sha256(password)
+            return hmac.compare_digest(hashlib.sha256(plain.encode()).hexdigest(), hashed)
+    except (ValueError, TypeError):
+        return False
+    return False
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True for legacy hashes and scrypt hashes made with a different cost."""
+    parts = (hashed or "").split("$")
+    if parts[0] != SCHEME or len(parts) != 6:
+        return True
+    return (int(parts[1]), int(parts[2]), int(parts[3])) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+class _BoundedPool:
+    """Thread pool that rejects work instead of queueing without limit."""
+
+    def __init__(self, workers: int, queue: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(workers + queue)
+
+    def submit(self, fn, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        """Submit and wait in the calling thread (sync handlers run in FastAPI's threadpool)."""
+        return self.submit(fn, *args).result()
+
+
+_pool = _BoundedPool(POOL_WORKERS, POOL_QUEUE)
+
+
+def hash_password(password: str) -> str:
+    """Hash a password with scrypt at the configured cost."""
+    return _pool.run(hash_password_sync, password)
+
+
+def verify_password(plain: str, hashed: str) -> bool:
+    """Verify a password against its hash (any supported format)."""
+    return _pool.run(verify_password_sync, plain, hashed)
@@ -0,0 +1,371 @@
+"""
+Recurring Service - Recurring Transaction Business Logic
+
+This module contains the date arithmetic for recurring transactions and the
+background scheduler that materializes due occurrences.
+"""
+import calendar
+import heapq
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import List, Dict, Any, Optional, Iterator
+
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from database import transactions_collection, recurring_collection
+from services.currency_service import stamp_amount_base
+from services.balance_service import apply_transactions
+from services.categorizer_service import learn
+
+DATE_FORMAT = "%Y-%m-%d"
+
+# Upper bound on occurrences generated for one rule in one sweep,
+# so a daily rule that was paused for years cannot flood a single batch.
+MAX_CATCH_UP = 366
+
+# Claims older than this are considered abandoned by a crashed worker
+CLAIM_LEASE_SECONDS = 300
+
+
+def _add_months(dt: datetime, months: int, anchor_day: int) -> datetime:
+    """Shift `dt` by whole months, clamping `anchor_day` to the target month's length."""
+    total = dt.year * 12 + (dt.month - 1) + months
+    year, month = divmod(total, 12)
+    month += 1
+    day = min(anchor_day, calendar.monthrange(year, month)[1])
+    return dt.replace(year=year, month=month, day=day)
+
+
+def anchor_day_for(date_str: str) -> int:
+    """Day of month a monthly/yearly rule should recur on."""
+    return datetime.strptime(date_str, DATE_FORMAT).day
+
+
+def anchor_day_after_edit(stored: Optional[dict], next_date: str) -> int:
+    """
+    Anchor day of an edited rule whose client did not send one.
+
+    The stored anchor is kept unless the edit changed next_date's day of
+    month: a 31st rule currently due on Feb 28 stays anchored to the 31st.
+    """
+    if stored and stored.get("anchor_day") and stored.get("next_date"):
+        if anchor_day_for(stored["next_date"]) == anchor_day_for(next_date):
+            return stored["anchor_day"]
+    return anchor_day_for(next_date)
+
+
+def occurrence_at(origin: datetime, frequency: str, n: int, anchor_day: int) -> datetime:
+    """
+    Compute the n-th occurrence after `origin` directly, without iterating.
+
+    Month-end rules keep their anchor: a rule on the 31st runs on Feb 28/29
+    and returns to the 31st in March.
+    """
+    if frequency == "daily":
+        return origin + timedelta(days=n)
+    if frequency == "weekly":
+        return origin + timedelta(weeks=n)
+    if frequency == "monthly":
+        return _add_months(origin, n, anchor_day)
+    if frequency == "yearly":
+        return _add_months(origin, 12 * n, anchor_day)
+    return origin + timedelta(days=30 * n)
+
+
+def next_occurrence(date_str: str, frequency: str, anchor_day: Optional[int] = None) -> str:
+    """
+    Compute the occurrence after `date_str` for a frequency.
+
+    Args:
+        date_str: Current occurrence date (YYYY-MM-DD)
+        frequency: "daily", "weekly", "monthly" or "yearly"
+        anchor_day: Day of month the rule was created on, defaults to the current day
+
+    Returns:
+        Next occurrence date (YYYY-MM-DD)
+    """
+    current = datetime.strptime(date_str, DATE_FORMAT)
+    next_dt = occurrence_at(current, frequency, 1, anchor_day or current.day)
+    return next_dt.strftime(DATE_FORMAT)
+
+
+def iter_occurrences(next_date: str, frequency: str, start: str, end: str,
+                     anchor_day: Optional[int] = None) -> Iterator[str]:
+    """
+    Lazily yield a rule's occurrences that fall inside [start, end].
+
+    The first occurrence in the window is computed arithmetically, so a
+    daily rule from years ago does not iterate through its history.
+
+    Args:
+        next_date: The rule's next scheduled date (first possible occurrence)
+        frequency: Rule frequency
+        start: Window start (YYYY-MM-DD, inclusive)
+        end: Window end (YYYY-MM-DD, inclusive)
+        anchor_day: Day of month the rule recurs on
+
+    Yields:
+        Occurrence dates (YYYY-MM-DD) in ascending order
+    """
+    origin = datetime.strptime(next_date, DATE_FORMAT)
+    window_start = datetime.strptime(start, DATE_FORMAT)
+    window_end = datetime.strptime(end, DATE_FORMAT)
+    anchor_day = anchor_day or origin.day
+
+    # Jump close to the window start, then step forward
+    n = 0
+    if window_start > origin:
+        if frequency == "daily":
+            n = (window_start - origin).days
+        elif frequency == "weekly":
+            n = (window_start - origin).days // 7
+        elif frequency == "monthly":
+            n = (window_start.year - origin.year) * 12 + window_start.month - origin.month - 1
+        elif frequency == "yearly":
+            n = window_start.year - origin.year - 1
+        else:
+            n = (window_start - origin).days // 30
+        n = max(n, 0)
+
+    while True:
+        current = occurrence_at(origin, frequency, n, anchor_day)
+        if current > window_end:
+            return
+        if current >= window_start:
+            yield current.strftime(DATE_FORMAT)
+        n += 1
+
+
+def due_occurrences(next_date: str, frequency: str, today: str,
+                    limit: int = MAX_CATCH_UP, anchor_day: Optional[int] = None) -> tuple:
+    """
+    List every occurrence that is due on or before `today`.
+
+    Args:
+        next_date: The rule's next scheduled date
+        frequency: Rule frequency
+        today: Cut-off date (YYYY-MM-DD, inclusive)
+        limit: Maximum number of occurrences to return
+        anchor_day: Day of month the rule recurs on
+
+    Returns:
+        (dates, new_next_date) - new_next_date is the first date not returned
+    """
+    dates = list(islice(iter_occurrences(next_date, frequency, next_date, today, anchor_day), limit))
+    if not dates:
+        return dates, next_date
+    return dates, next_occurrence(dates[-1], frequency, anchor_day)
+
+
+def expand_occurrences(rules, start: str, end: str) -> Iterator[Dict[str, Any]]:
+    """
+    Merge the occurrences of many rules into one date-ordered stream.
+
+    Only one pending occurrence per rule is held in memory at a time.
+
+    Args:
+        rules: Iterable of recurring documents
+        start: Window start (YYYY-MM-DD, inclusive)
+        end: Window end (YYYY-MM-DD, inclusive)
+
+    Yields:
+        Dicts with date and the rule's display fields
+    """
+    def occurrences_of(rule):
+        rule_id = str(rule["_id"])
+        for date in iter_occurrences(rule["next_date"], rule["frequency"], start, end, rule.get("anchor_day")):
+            yield {
+                "date": date,
+                "recurring_id": rule_id,
+                "title": rule["title"],
+                "amount": rule["amount"],
+                "category": rule["category"],
+                "type": rule.get("type", "expense"),
+                "payment_method": rule.get("payment_method", "Cash"),
+                "user_id": rule.get("user_id")
+            }
+
+    return heapq.merge(*(occurrences_of(r) for r in rules), key=lambda o: o["date"])
+
+
+def build_transaction(recurring: dict, occurrence_date: str) -> dict:
+    """
+    Build the transaction document for one occurrence of a rule.
+
+    `recurring_id` + `occurrence_date` is unique, which makes execution idempotent.
+    """
+    tx_data = {
+        "title": recurring["title"],
+        "amount": recurring["amount"],
+        "category": recurring["category"],
+        "type": recurring["type"],
+        "payment_method": recurring["payment_method"],
+        "note": recurring.get("note", ""),
+        "date": occurrence_date,
+        "currency": "TWD",
+        "user_id": recurring.get("user_id"),
+        "recurring_id": str(recurring["_id"]),
+        "occurrence_date": occurrence_date
+    }
+    return stamp_amount_base(tx_data)
+
+
+def insert_occurrences(docs: List[dict]) -> int:
+    """
+    Insert occurrence transactions, skipping ones that already exist.
+
+    Account balances and category counters are updated for the newly
+    inserted transactions only.
+
+    Returns:
+        Number of newly inserted transactions
+    """
+    if not docs:
+        return 0
+    try:
+        transactions_collection.insert_many(docs, ordered=False)
+        inserted = docs
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != 11000 for err in errors):
+            raise
+        skipped = {err["index"] for err in errors}
+        inserted = [doc for i, doc in enumerate(docs) if i not in skipped]
+    apply_transactions(inserted)
+    learn(inserted)
+    return len(inserted)
+
+
+def execute_one(recurring: dict) -> Optional[str]:
+    """
+    Materialize the rule's current `next_date` and advance it by one period.
+
+    Returns:
+        The new next_date, or None if another writer advanced it first
+    """
+    occurrence = recurring["next_date"]
+    tx_data = build_transaction(recurring, occurrence)
+    try:
+        transactions_collection.insert_one(tx_data)
+        apply_transactions([tx_data])
+        learn([tx_data])
+    except DuplicateKeyError:
+        pass
+
+    new_next = next_occurrence(occurrence, recurring["frequency"], recurring.get("anchor_day"))
+    claimed = recurring_collection.find_one_and_update(
+        {"_id": recurring["_id"], "next_date": occurrence},
+        {"$set": {"next_date": new_next}}
+    )
+    return new_next if claimed else None
+
+
+def claim_due(today: str, worker_id: str, limit: int) -> List[dict]:
+    """
+    Atomically claim up to `limit` due rules for this worker.
+
+    Each claim is a find_one_and_update on the (is_active, next_date) index,
+    so two workers never hold the same rule at once.
+    """
+    now = datetime.utcnow()
+    lease = now + timedelta(seconds=CLAIM_LEASE_SECONDS)
+    claimed = []
+    while len(claimed) < limit:
+        doc = recurring_collection.find_one_and_update(
+            {
+                "is_active": True,
+                "next_date": {"$lte": today},
+                "$or": [{"claimed_until": None}, {"claimed_until": {"$lt": now}}]
+            },
+            {"$set": {"claimed_until": lease, "claimed_by": worker_id}},
+            sort=[("next_date", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if not doc:
+            break
+        claimed.append(doc)
+    return claimed
+
+
+def run_due_recurring(today: Optional[str] = None, batch_size: int = 500,
+                      worker_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Sweep all due recurring rules and materialize their occurrences.
+
+    Rules are claimed in batches; each batch is written with one insert_many
+    and one bulk_write, and missed periods are caught up in the same pass.
+
+    Args:
+        today: Cut-off date, defaults to the current date
+        batch_size: Number of rules claimed per batch
+        worker_id: Identifier stored on claims, defaults to a random id
+
+    Returns:
+        Dict with rules processed and transactions created
+    """
+    today = today or datetime.now().strftime(DATE_FORMAT)
+    worker_id = worker_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+
+    rules = 0
+    created = 0
+    while True:
+        batch = claim_due(today, worker_id, batch_size)
+        if not batch:
+            break
+
+        docs = []
+        ops = []
+        for recurring in batch:
+            dates, new_next = due_occurrences(
+                recurring["next_date"], recurring["frequency"], today,
+                anchor_day=recurring.get("anchor_day")
+            )
+            docs.extend(build_transaction(recurring, d) for d in dates)
+            ops.append(UpdateOne(
+                {"_id": recurring["_id"], "claimed_by": worker_id},
+                {"$set": {"next_date": new_next}, "$unset": {"claimed_until": "", "claimed_by": ""}}
+            ))
+
+        created += insert_occurrences(docs)
+        recurring_collection.bulk_write(ops, ordered=False)
+        rules += len(batch)
+
+    return {"rules": rules, "created": created}
+
+
+class RecurringScheduler:
+    """In-process background thread that periodically runs `run_due_recurring`."""
+
+    def __init__(self, interval: int = 300, batch_size: int = 500):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="recurring-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                result = run_due_recurring(batch_size=self.batch_size, worker_id=self.worker_id)
+                if result["created"]:
+                    print(f"🔁 已自動執行 {result['rules']} 筆重複交易，新增 {result['created']} 筆交易")
+            except Exception as e:
+                print(f"Recurring scheduler error: {e}")
+            self._stop.wait(self.interval)
@@ -0,0 +1,115 @@
+"""
+Session Service - JWT Claims and Token Revocation
+
+This module contains the claims carried by access tokens and the per-user
+token-version counters used to revoke them. Counters live in the
+`token_versions` collection (only users who ever revoked a token have
+one) and are mirrored in an in-memory map that is refreshed incrementally,
+so verifying a token normally needs no database access.
+
+The refresh cursor is `updated_at` as stamped by the MongoDB server
+(`$currentDate`), never a worker's own clock, and each refresh re-reads a
+short overlap so writes that commit slightly out of order are not missed.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from pymongo import ReturnDocument
+
+from database import token_versions_collection
+
+REFRESH_SECONDS = 15
+# Re-read this much before the newest seen update (versions only grow, so re-reading is harmless)
+SYNC_OVERLAP_SECONDS = 5
+
+
+def build_claims(user: dict, version: int) -> dict:
+    """
+    Claims stored in an access token.
+
+    Args:
+        user: User document from MongoDB
+        version: The user's current token version
+    """
+    return {
+        "sub": user["username"],
+        "uid": str(user["_id"]),
+        "role": user.get("role", "user"),
+        "ver": version
+    }
+
+
+def user_from_claims(payload: dict) -> dict:
+    """The `current_user` dict handlers receive for a verified token."""
+    return {
+        "id": payload["uid"],
+        "username": payload["sub"],
+        "role": payload.get("role", "user")
+    }
+
+
+class RevocationMap:
+    """In-memory copy of `token_versions`, refreshed from Mongo every few seconds."""
+
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._versions: Dict[str, int] = {}
+        self._synced_until: Optional[datetime] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """Pull counters changed since the last refresh."""
+        self._checked_at = time.monotonic()  # Other threads keep using the current map meanwhile
+        query = {}
+        if self._synced_until is not None:
+            query["updated_at"] = {"$gte": self._synced_until - timedelta(seconds=SYNC_OVERLAP_SECONDS)}
+        newest = self._synced_until
+        changed = {}
+        for doc in token_versions_collection.find(query, {"version": 1, "updated_at": 1}):
+            changed[doc["_id"]] = doc["version"]
+            if newest is None or doc["updated_at"] > newest:
+                newest = doc["updated_at"]
+        with self._lock:
+            for user_id, version in changed.items():
+                if version > self._versions.get(user_id, 0):
+                    self._versions[user_id] = version
+            self._synced_until = newest
+
+    def version(self, user_id: str) -> int:
+        """Current token version of a user (0 if never revoked)."""
+        if time.monotonic() - self._checked_at > self.refresh_seconds:
+            self.refresh()
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id: str) -> int:
+        """
+        Revoke every token issued to a user so far.
+
+        Returns:
+            The new version, to be embedded in tokens issued from now on
+        """
+        doc = token_versions_collection.find_one_and_update(
+            {"_id": user_id},
+            {"$inc": {"version": 1}, "$currentDate": {"updated_at": True}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        with self._lock:
+            self._versions[user_id] = max(doc["version"], self._versions.get(user_id, 0))
+        return doc["version"]
+
+    def is_current(self, payload: dict) -> bool:
+        """True unless the token was issued before the user's last revocation."""
+        return payload.get("ver", 0) >= self.version(payload["uid"])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._versions.clear()
+            self._synced_until = None
+            self._checked_at = 0.0
+
+
+revocations = RevocationMap()
@@ -0,0 +1,243 @@
+"""
+Stats Service - Dashboard Statistics Business Logic
+
+This module contains the time-bucketed aggregations behind the dashboard
+charts. Dates are stored as "YYYY-MM-DD" strings, so every range filter is a
+plain string range that the (user_id, date) index can serve.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple
+
+from database import transactions_collection
+from services.currency_service import AMOUNT_BASE_EXPR
+
+DATE_FORMAT = "%Y-%m-%d"
+GRANULARITIES = ("day", "week", "month", "year")
+
+# Default look-back when the caller gives no start date
+DEFAULT_SPAN = {"day": 90, "week": 7 * 26, "month": 366, "year": 366 * 5}
+
+# Hard cap on the number of buckets a single trend request may return
+MAX_BUCKETS = 1000
+
+
+def month_bounds(month: str, months: int = 1) -> Tuple[str, str]:
+    """
+    Half-open date bounds [first-of-month, first-of-month-after) for a month span.
+
+    Use as {"$gte": start, "$lt": end}; unlike "-31" or a "^YYYY-MM" regex this
+    is exact for every month length and gives the date index tight bounds.
+
+    Args:
+        month: First month (YYYY-MM)
+        months: Number of months covered
+
+    Returns:
+        (start, end) date strings
+
+    Raises:
+        ValueError: On a malformed month or non-positive span
+    """
+    first = datetime.strptime(month, "%Y-%m")
+    if months < 1:
+        raise ValueError("months must be positive")
+    year, index = divmod(first.year * 12 + first.month - 1 + months, 12)
+    return first.strftime(DATE_FORMAT), f"{year:04d}-{index + 1:02d}-01"
+
+
+def month_labels(month: str, months: int) -> List[str]:
+    """List `months` consecutive month labels (YYYY-MM) starting at `month`."""
+    first = datetime.strptime(month, "%Y-%m")
+    labels = []
+    for offset in range(months):
+        year, index = divmod(first.year * 12 + first.month - 1 + offset, 12)
+        labels.append(f"{year:04d}-{index + 1:02d}")
+    return labels
+
+
+def get_multi_month_stats(match_stage: Dict[str, Any], month: str, months: int) -> List[Dict[str, Any]]:
+    """
+    Income, expense and balance for several consecutive months in one aggregation.
+
+    Args:
+        match_stage: Base filter (e.g. user_id), the date range is added here
+        month: First month (YYYY-MM)
+        months: Number of months
+
+    Returns:
+        One dict per month, in order, including months without transactions
+    """
+    start, end = month_bounds(month, months)
+    pipeline = [
+        {"$match": {**match_stage, "date": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": {"month": {"$substrCP": ["$date", 0, 7]}, "type": "$type"},
+            "total": {"$sum": AMOUNT_BASE_EXPR}
+        }}
+    ]
+    totals = {}
+    for item in transactions_collection.aggregate(pipeline):
+        totals[(item["_id"]["month"], item["_id"]["type"])] = item["total"]
+
+    result = []
+    for label in month_labels(month, months):
+        income = totals.get((label, "income"), 0)
+        expense = totals.get((label, "expense"), 0)
+        result.append({"month": label, "income": income, "expense": expense, "balance": income - expense})
+    return result
+
+
+def get_category_spend_by_month(match_stage: Dict[str, Any], month: str, months: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Expense totals per (month, category) for several months in one aggregation.
+
+    Returns:
+        {"YYYY-MM": {category: total}} for months that have expenses
+    """
+    start, end = month_bounds(month, months)
+    pipeline = [
+        {"$match": {**match_stage, "type": "expense", "date": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": {"month": {"$substrCP": ["$date", 0, 7]}, "category": "$category"},
+            "total": {"$sum": AMOUNT_BASE_EXPR}
+        }}
+    ]
+    spend = {}
+    for item in transactions_collection.aggregate(pipeline):
+        spend.setdefault(item["_id"]["month"], {})[item["_id"]["category"]] = item["total"]
+    return spend
+
+
+def bucket_key_expr(granularity: str) -> Any:
+    """
+    Aggregation expression that maps a transaction to its bucket label.
+
+    Day, month and year use a prefix of the date string; week truncates to
+    the Monday that starts the ISO week.
+    """
+    if granularity == "day":
+        return "$date"
+    if granularity == "month":
+        return {"$substrCP": ["$date", 0, 7]}
+    if granularity == "year":
+        return {"$substrCP": ["$date", 0, 4]}
+    return {"$dateToString": {
+        "format": "%Y-%m-%d",
+        "date": {"$dateTrunc": {
+            "date": {"$dateFromString": {"dateString": "$date", "format": "%Y-%m-%d", "onError": None}},
+            "unit": "week",
+            "startOfWeek": "monday"
+        }}
+    }}
+
+
+def bucket_label(date: datetime, granularity: str) -> str:
+    """Python counterpart of bucket_key_expr for a single date."""
+    if granularity == "day":
+        return date.strftime(DATE_FORMAT)
+    if granularity == "month":
+        return date.strftime("%Y-%m")
+    if granularity == "year":
+        return date.strftime("%Y")
+    return (date - timedelta(days=date.weekday())).strftime(DATE_FORMAT)
+
+
+def bucket_count(start: str, end: str, granularity: str) -> int:
+    """
+    Number of buckets bucket_labels would return, computed without listing them.
+
+    Lets callers reject an oversized range before doing work proportional to it.
+    """
+    first = datetime.strptime(start, DATE_FORMAT)
+    last = datetime.strptime(end, DATE_FORMAT)
+    if first > last:
+        return 0
+    if granularity == "day":
+        return (last - first).days + 1
+    if granularity == "week":
+        return (last.toordinal() - last.weekday() - (first.toordinal() - first.weekday())) // 7 + 1
+    if granularity == "month":
+        return (last.year * 12 + last.month) - (first.year * 12 + first.month) + 1
+    return last.year - first.year + 1
+
+
+def bucket_labels(start: str, end: str, granularity: str) -> List[str]:
+    """
+    List every bucket label between start and end (inclusive), in order.
+
+    Args:
+        start: Range start (YYYY-MM-DD)
+        end: Range end (YYYY-MM-DD)
+        granularity: One of GRANULARITIES
+
+    Returns:
+        Ordered, de-duplicated bucket labels
+    """
+    current = datetime.strptime(start, DATE_FORMAT)
+    last = datetime.strptime(end, DATE_FORMAT)
+    labels = []
+    while current <= last:
+        labels.append(bucket_label(current, granularity))
+        if granularity == "day":
+            current += timedelta(days=1)
+        elif granularity == "week":
+            current = current - timedelta(days=current.weekday()) + timedelta(weeks=1)
+        elif granularity == "month":
+            current = (current.replace(day=1) + timedelta(days=32)).replace(day=1)
+        else:
+            current = current.replace(year=current.year + 1, month=1, day=1)
+    return labels
+
+
+def resolve_range(granularity: str, start: Optional[str], end: Optional[str],
+                  today: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Fill in a missing start/end so the trend range is always bounded.
+
+    Raises:
+        ValueError: On malformed dates or a start after end
+    """
+    end = end or today or datetime.now().strftime(DATE_FORMAT)
+    end_dt = datetime.strptime(end, DATE_FORMAT)
+    if start:
+        start_dt = datetime.strptime(start, DATE_FORMAT)
+    else:
+        start_dt = end_dt - timedelta(days=DEFAULT_SPAN[granularity] - 1)
+    if start_dt > end_dt:
+        raise ValueError("start is after end")
+    return start_dt.strftime(DATE_FORMAT), end
+
+
+def get_trend(match_stage: Dict[str, Any], granularity: str, start: str, end: str) -> Dict[str, List]:
+    """
+    Income and expense totals per time bucket, with empty buckets filled in.
+
+    Args:
+        match_stage: Base filter (e.g. user_id), the date range is added here
+        granularity: One of GRANULARITIES
+        start: Range start (YYYY-MM-DD, inclusive)
+        end: Range end (YYYY-MM-DD, inclusive)
+
+    Returns:
+        Dict with labels, incomes and expenses lists of equal length
+    """
+    if bucket_count(start, end, granularity) > MAX_BUCKETS:
+        raise ValueError(f"range produces more than {MAX_BUCKETS} buckets")
+    labels = bucket_labels(start, end, granularity)
+
+    match = {**match_stage, "date": {"$gte": start, "$lte": end}, "type": {"$in": ["income", "expense"]}}
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": bucket_key_expr(granularity), "income": {
+            "$sum": {"$cond": [{"$eq": ["$type", "income"]}, AMOUNT_BASE_EXPR, 0]}
+        }, "expense": {
+            "$sum": {"$cond": [{"$eq": ["$type", "expense"]}, AMOUNT_BASE_EXPR, 0]}
+        }}}
+    ]
+    totals = {item["_id"]: item for item in transactions_collection.aggregate(pipeline)}
+
+    return {
+        "labels": labels,
+        "incomes": [totals[l]["income"] if l in totals else 0 for l in labels],
+        "expenses": [totals[l]["expense"] if l in totals else 0 for l in labels]
+    }
@@ -0,0 +1,155 @@
+"""
+Suggest Service - Title Autocomplete for Quick Entry
+
+Each worker keeps, per user, a sorted array of normalized titles with how
+often each was used and its usual category, amount and payment method.
+A prefix lookup is a binary search plus a scan of the matching range, so
+suggestions are answered from memory without querying MongoDB. The index
+is built from history on first use, updated on every write made through
+this worker, and rebuilt after `INDEX_TTL_SECONDS` to pick up writes made
+by other workers.
+"""
+import bisect
+import heapq
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List
+
+from database import transactions_collection
+from services.cache import TTLCache
+from services.import_service import normalize_title
+
+INDEX_TTL_SECONDS = 600
+DEFAULT_LIMIT = 5
+
+_indexes = TTLCache(ttl=INDEX_TTL_SECONDS, maxsize=1000)
+_build_lock = threading.Lock()
+
+
+class _TitleStats:
+    """Usage of one normalized title."""
+
+    __slots__ = ("count", "last_date", "titles", "categories", "amounts", "methods", "types")
+
+    def __init__(self):
+        self.count = 0
+        self.last_date = ""
+        self.titles = Counter()
+        self.categories = Counter()
+        self.amounts = Counter()
+        self.methods = Counter()
+        self.types = Counter()
+
+    def add(self, tx: dict, sign: int) -> None:
+        self.count += sign
+        for counter, value in ((self.titles, tx.get("title")), (self.categories, tx.get("category")),
+                               (self.amounts, tx.get("amount")), (self.methods, tx.get("payment_method")),
+                               (self.types, tx.get("type"))):
+            if value is not None:
+                counter[value] += sign
+                if counter[value] <= 0:
+                    del counter[value]
+        if sign > 0 and str(tx.get("date") or "") > self.last_date:
+            self.last_date = str(tx.get("date"))
+
+    def to_api(self) -> dict:
+        def usual(counter):
+            return counter.most_common(1)[0][0] if counter else None
+        return {
+            "title": usual(self.titles),
+            "category": usual(self.categories),
+            "amount": usual(self.amounts),
+            "payment_method": usual(self.methods),
+            "type": usual(self.types),
+            "count": self.count
+        }
+
+
+class TitleIndex:
+    """Sorted array of one user's normalized titles."""
+
+    def __init__(self, txs: Iterable[dict] = ()):
+        self._stats: Dict[str, _TitleStats] = {}
+        self._keys: List[str] = []
+        self._lock = threading.Lock()
+        for tx in txs:
+            self._add(tx, 1, sort=False)
+        self._keys.sort()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _add(self, tx: dict, sign: int, sort: bool = True) -> None:
+        key = normalize_title(tx.get("title"))
+        if not key:
+            return
+        stats = self._stats.get(key)
+        if stats is None:
+            if sign < 0:
+                return
+            stats = self._stats[key] = _TitleStats()
+            if sort:
+                bisect.insort(self._keys, key)
+            else:
+                self._keys.append(key)
+        stats.add(tx, sign)
+        if stats.count <= 0:
+            del self._stats[key]
+            self._keys.pop(bisect.bisect_left(self._keys, key))
+
+    def add(self, tx: dict, sign: int = 1) -> None:
+        """Record (sign=1) or forget (sign=-1) one transaction."""
+        with self._lock:
+            self._add(tx, sign)
+
+    def suggest(self, prefix: str, limit: int = DEFAULT_LIMIT) -> List[dict]:
+        """
+        Most used titles starting with a prefix (most recent first on ties).
+
+        Args:
+            prefix: Typed text; normalized like stored titles
+            limit: Maximum number of suggestions
+
+        Returns:
+            [{title, category, amount, payment_method, type, count}]
+        """
+        prefix = normalize_title(prefix)
+        if not prefix:
+            return []  # Nothing typed yet; ranking every title is not a prefix lookup
+        with self._lock:
+            start = bisect.bisect_left(self._keys, prefix)
+            end = bisect.bisect_left(self._keys, prefix + "\U0010ffff", lo=start)
+            top = heapq.nlargest(
+                limit, self._keys[start:end],
+                key=lambda key: (self._stats[key].count, self._stats[key].last_date)
+            )
+            return [self._stats[key].to_api() for key in top]
+
+
+def get_index(user_id: str) -> TitleIndex:
+    """A user's title index (built from history on first use)."""
+    index = _indexes.get(user_id)
+    if index is not None:
+        return index
+    with _build_lock:
+        index = _indexes.get(user_id)
+        if index is None:
+            index = TitleIndex(transactions_collection.find(
+                {"user_id": user_id},
+                {"title": 1, "category": 1, "amount": 1, "payment_method": 1, "type": 1, "date": 1, "_id": 0}
+            ))
+            _indexes.set(user_id, index)
+    return index
+
+
+def observe(txs: Iterable[dict], sign: int = 1) -> None:
+    """Apply written transactions to the indexes loaded in this worker."""
+    for tx in txs:
+        user_id = tx.get("user_id")
+        index = _indexes.get(user_id) if user_id else None
+        if index is not None:
+            index.add(tx, sign)
+
+
+def suggest(user_id: str, prefix: str, limit: int = DEFAULT_LIMIT) -> List[dict]:
+    return get_index(user_id).suggest(prefix, limit)
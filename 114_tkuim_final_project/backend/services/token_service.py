@@ -0,0 +1,107 @@
+"""
+Token Service - Single-use Tokens (Password Reset, Account Deletion)
+
+This module contains the `tokens` collection. Only a SHA-256 hash of each
+token is stored, under a unique index, together with its purpose, owner
+and a UTC `expires_at` covered by a TTL index. Redeeming a token is one
+indexed lookup and user documents no longer carry ephemeral fields.
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from database import tokens_collection, users_collection
+
+PURPOSE_PASSWORD_RESET = "password_reset"
+PURPOSE_ACCOUNT_DELETE = "account_delete"
+
+LEGACY_USER_FIELDS = ("reset_token", "reset_expires", "delete_code", "delete_code_expires")
+
+
+def _now() -> datetime:
+    # PyMongo returns naive UTC datetimes
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def hash_token(token: str, purpose: str, user_id: Optional[str] = None) -> str:
+    """
+    Hash a token for storage.
+
+    Short codes (e.g. 6-digit delete codes) are scoped to their user so two
+    users can hold the same code without colliding on the unique index.
+    """
+    return hashlib.sha256(f"{purpose}:{user_id or ''}:{token}".encode()).hexdigest()
+
+
+def issue_token(token: str, user_id: str, purpose: str, ttl: timedelta, scoped: bool = False) -> None:
+    """
+    Store a token, replacing any earlier token of the same purpose for the user.
+
+    Args:
+        token: The plaintext token sent to the user
+        user_id: Owner of the token
+        purpose: One of the PURPOSE_* constants
+        ttl: How long the token stays valid
+        scoped: Hash with the user ID (needed for short codes)
+    """
+    tokens_collection.delete_many({"user_id": user_id, "purpose": purpose})
+    now = _now()
+    try:
+        tokens_collection.insert_one({
+            "token_hash": hash_token(token, purpose, user_id if scoped else None),
+            "purpose": purpose,
+            "user_id": user_id,
+            "expires_at": now + ttl,
+            "created_at": now
+        })
+    except DuplicateKeyError:
+        raise ValueError("Token already issued")
+
+
+def find_token(token: str, purpose: str, user_id: Optional[str] = None) -> Optional[dict]:
+    """
+    Look up a token by its hash.
+
+    Args:
+        token: Plaintext token supplied by the user
+        purpose: Expected purpose
+        user_id: Owner, for tokens issued with scoped=True
+
+    Returns:
+        Token document (check `is_expired` before use), or None
+    """
+    return tokens_collection.find_one({
+        "token_hash": hash_token(token, purpose, user_id),
+        "purpose": purpose
+    })
+
+
+def is_expired(token_doc: dict) -> bool:
+    """True once the token is past its expiry (the TTL sweep may lag by a minute)."""
+    return token_doc["expires_at"] <= _now()
+
+
+def consume_token(token_doc: dict) -> bool:
+    """
+    Delete a token after use.
+
+    Returns:
+        False if another request already consumed it
+    """
+    return tokens_collection.delete_one({"_id": token_doc["_id"]}).deleted_count == 1
+
+
+def purge_legacy_user_fields() -> int:
+    """
+    Remove reset tokens and delete codes stored on user documents.
+
+    Returns:
+        Number of users cleaned
+    """
+    result = users_collection.update_many(
+        {"$or": [{field: {"$exists": True}} for field in LEGACY_USER_FIELDS]},
+        {"$unset": {field: "" for field in LEGACY_USER_FIELDS}}
+    )
+    return result.modified_count
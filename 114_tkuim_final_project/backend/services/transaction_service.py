@@ -8,6 +8,9 @@ from typing import Optional, List, Dict, Any
 from bson import ObjectId
 
 from database import transactions_collection, paginate_query, DESCENDING
+from services.currency_service import stamp_amount_base
+from services.balance_service import apply_transactions, replace_transaction
+from services import stats_service
 
 
 def fix_id(doc: dict) -> dict:
@@ -86,7 +89,9 @@ def create_transaction(data: dict, user_id: str) -> dict:
         "user_id": user_id,
         "created_at": datetime.now().isoformat()
     }
+    stamp_amount_base(transaction)
     result = transactions_collection.insert_one(transaction)
+    apply_transactions([transaction])
     transaction["id"] = str(result.inserted_id)
     return transaction
 
@@ -114,10 +119,15 @@ def update_transaction(tx_id: str, data: dict, user_id: str) -> Optional[dict]:
             **data,
             "updated_at": datetime.now().isoformat()
         }
+        # Re-normalize against the merged document so partial updates keep a valid amount_base
+        merged = stamp_amount_base({**existing, **update_data})
+        for key in ("amount_base", "base_rate", "base_currency"):
+            update_data[key] = merged[key]
         transactions_collection.update_one(
             {"_id": ObjectId(tx_id)},
             {"$set": update_data}
         )
+        replace_transaction(existing, {**existing, **update_data})
         
         updated = transactions_collection.find_one({"_id": ObjectId(tx_id)})
         return fix_id(updated)
@@ -144,6 +154,7 @@ def delete_transaction(tx_id: str, user_id: str) -> bool:
             return False
         
         transactions_collection.delete_one({"_id": ObjectId(tx_id)})
+        apply_transactions([existing], sign=-1)
         return True
     except:
         return False
@@ -161,31 +172,25 @@ def get_monthly_stats(user_id: str, year: int, month: int) -> Dict[str, float]:
     Returns:
         Dict with income, expense, balance
     """
-    month_str = f"{year}-{month:02d}"
-    
-    pipeline = [
-        {"$match": {
-            "user_id": user_id,
-            "date": {"$regex": f"^{month_str}"}
-        }},
-        {"$group": {
-            "_id": "$type",
-            "total": {"$sum": "$amount"}
-        }}
-    ]
-    
-    result = list(transactions_collection.aggregate(pipeline))
-    
-    income = 0
-    expense = 0
-    for item in result:
-        if item["_id"] == "income":
-            income = item["total"]
-        elif item["_id"] == "expense":
-            expense = item["total"]
-    
+    stats = get_multi_month_stats(user_id, year, month, 1)[0]
     return {
-        "income": income,
-        "expense": expense,
-        "balance": income - expense
+        "income": stats["income"],
+        "expense": stats["expense"],
+        "balance": stats["balance"]
     }
+
+
+def get_multi_month_stats(user_id: str, year: int, month: int, months: int = 12) -> List[Dict[str, Any]]:
+    """
+    Calculate statistics for several consecutive months in one query.
+    
+    Args:
+        user_id: User ID
+        year: Year of the first month
+        month: First month
+        months: Number of months
+    
+    Returns:
+        List of dicts with month, income, expense, balance
+    """
+    return stats_service.get_multi_month_stats({"user_id": user_id}, f"{year}-{month:02d}", months)
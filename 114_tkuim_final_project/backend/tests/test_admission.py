@@ -0,0 +1,116 @@
+"""
+Unit Tests for Admission Control Middleware
+
+Run with: pytest tests/test_admission.py -v
+"""
+import pytest
+import sys
+import os
+import asyncio
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+from middleware.admission import AdmissionGate, setup_admission_control
+
+
+class TestAdmissionGate:
+    """Tests for the concurrency limit and bounded queue"""
+
+    def test_queue_full_rejects_immediately(self):
+        async def scenario():
+            gate = AdmissionGate("t", limit=1, max_queue=0, max_wait=1)
+            assert await gate.acquire()
+            assert not await gate.acquire()
+            return gate.metrics()
+        metrics = asyncio.run(scenario())
+        assert metrics["active"] == 1
+        assert metrics["rejected"] == 1
+
+    def test_queued_request_gets_released_slot(self):
+        async def scenario():
+            gate = AdmissionGate("t", limit=1, max_queue=1, max_wait=1)
+            await gate.acquire()
+            waiting = asyncio.ensure_future(gate.acquire())
+            await asyncio.sleep(0.01)
+            assert gate.metrics()["queue_depth"] == 1
+            gate.release()
+            assert await waiting
+            gate.release()
+            return gate.metrics()
+        metrics = asyncio.run(scenario())
+        assert metrics["active"] == 0
+        assert metrics["admitted"] == 2
+        assert metrics["wait_seconds_max"] > 0
+
+    def test_wait_timeout_rejects(self):
+        async def scenario():
+            gate = AdmissionGate("t", limit=1, max_queue=1, max_wait=0.01)
+            await gate.acquire()
+            assert not await gate.acquire()
+            gate.release()
+            return gate.metrics()
+        metrics = asyncio.run(scenario())
+        assert metrics == dict(metrics, active=0, queue_depth=0, rejected=1)
+
+    def test_cancelled_waiter_does_not_leak_slot(self):
+        async def scenario():
+            gate = AdmissionGate("t", limit=1, max_queue=1, max_wait=5)
+            await gate.acquire()
+            waiting = asyncio.ensure_future(gate.acquire())
+            await asyncio.sleep(0.01)
+            waiting.cancel()
+            await asyncio.sleep(0.01)
+            gate.release()
+            return gate.metrics()
+        metrics = asyncio.run(scenario())
+        assert metrics["active"] == 0
+        assert metrics["queue_depth"] == 0
+
+
+class TestMiddleware:
+    """Tests for shedding heavy requests while cheap ones pass"""
+
+    def test_heavy_burst_is_shed_cheap_request_passes(self):
+        app = FastAPI()
+        release = asyncio.Event()
+
+        @app.get("/api/export")
+        async def export():
+            await release.wait()
+            return {"ok": True}
+
+        @app.post("/api/transactions")
+        async def create():
+            return {"ok": True}
+
+        admission = setup_admission_control(app, [("export", r"^/api/export", 1, 1, 0.05)])
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                first = asyncio.ensure_future(client.get("/api/export"))
+                await asyncio.sleep(0.02)
+                queued = asyncio.ensure_future(client.get("/api/export"))
+                await asyncio.sleep(0.01)
+                shed = await client.get("/api/export")
+                cheap = await client.post("/api/transactions")
+                timed_out = await queued
+                release.set()
+                return (await first), timed_out, shed, cheap
+
+        first, timed_out, shed, cheap = asyncio.run(scenario())
+        assert first.status_code == 200
+        assert cheap.status_code == 200
+        assert shed.status_code == 503
+        assert shed.headers["retry-after"] == "1"
+        assert timed_out.status_code == 503
+        metrics = admission.metrics()["export"]
+        assert metrics["rejected"] == 2
+        assert metrics["active"] == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
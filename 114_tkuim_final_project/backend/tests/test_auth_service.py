@@ -26,11 +26,13 @@ class TestPasswordHashing:
         result = hash_password("test123")
         assert isinstance(result, str)
     
-    def test_hash_password_consistent(self):
-        """Same password should produce same hash"""
+    def test_hash_password_salted(self):
+        """Same password should produce different (salted) hashes that both verify"""
         hash1 = hash_password("mypassword")
         hash2 = hash_password("mypassword")
-        assert hash1 == hash2
+        assert hash1 != hash2
+        assert verify_password("mypassword", hash1)
+        assert verify_password("mypassword", hash2)
     
     def test_hash_password_different_for_different_inputs(self):
         """Different passwords should produce different hashes"""
@@ -0,0 +1,151 @@
+"""
+Unit Tests for Balance Service
+
+Run with: pytest tests/test_balance_service.py -v
+"""
+import pytest
+import sys
+import os
+from unittest.mock import patch
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.balance_service import (
+    balance_deltas,
+    merge_deltas,
+    check_balances,
+    repair_balances,
+    rebuild_balances,
+    apply_transactions
+)
+
+
+class TestBalanceDeltas:
+    """Tests for the balance effect of one transaction"""
+
+    def test_income_adds(self):
+        tx = {"type": "income", "amount": 500, "payment_method": "Bank", "user_id": "u1"}
+        assert balance_deltas(tx) == [("u1", "Bank", 500)]
+
+    def test_expense_subtracts(self):
+        tx = {"type": "expense", "amount": 120, "payment_method": "Cash", "user_id": "u1"}
+        assert balance_deltas(tx) == [("u1", "Cash", -120)]
+
+    def test_transfer_moves_between_accounts(self):
+        tx = {"type": "transfer", "amount": 1000, "payment_method": "Bank",
+              "target_account": "LinePay", "user_id": "u1"}
+        assert balance_deltas(tx) == [("u1", "Bank", -1000), ("u1", "LinePay", 1000)]
+
+    def test_prefers_amount_base(self):
+        """Foreign transactions should move balances by their base amount"""
+        tx = {"type": "expense", "amount": 10, "amount_base": 320, "payment_method": "Credit Card"}
+        assert balance_deltas(tx) == [(None, "Credit Card", -320)]
+
+    def test_nan_amount_ignored(self):
+        tx = {"type": "expense", "amount": float("nan"), "payment_method": "Cash"}
+        assert balance_deltas(tx) == [(None, "Cash", 0)]
+
+
+class TestMergeDeltas:
+    """Tests for combining many writes into one bulk update"""
+
+    def test_update_reverts_old_and_applies_new(self):
+        old = {"type": "expense", "amount": 100, "payment_method": "Cash", "user_id": "u1"}
+        new = {"type": "expense", "amount": 150, "payment_method": "Cash", "user_id": "u1"}
+        assert merge_deltas([([old], -1), ([new], 1)]) == {("u1", "Cash"): -50}
+
+    def test_account_change(self):
+        old = {"type": "expense", "amount": 100, "payment_method": "Cash", "user_id": "u1"}
+        new = {"type": "expense", "amount": 100, "payment_method": "Bank", "user_id": "u1"}
+        assert merge_deltas([([old], -1), ([new], 1)]) == {("u1", "Cash"): 100, ("u1", "Bank"): -100}
+
+
+class TestCheckBalances:
+    """Tests for the drift checker"""
+
+    def test_reports_drift(self):
+        with patch("services.balance_service.compute_balances") as compute, \
+                patch("services.balance_service.account_balances_collection") as coll:
+            compute.return_value = {("u1", "Cash"): 500, ("u1", "Bank"): 1000}
+            coll.find.return_value = [
+                {"user_id": "u1", "account": "Cash", "balance": 500},
+                {"user_id": "u1", "account": "Bank", "balance": 900},
+            ]
+            drift = check_balances()
+        assert drift == [{"user_id": "u1", "account": "Bank", "stored": 900,
+                          "expected": 1000, "drift": -100, "exists": True}]
+        coll.bulk_write.assert_not_called()
+
+    def test_repair_is_conditional_on_checked_value(self):
+        drift = [
+            {"user_id": "u1", "account": "Bank", "stored": 900, "expected": 1000, "drift": -100, "exists": True},
+            {"user_id": "u1", "account": "Cash", "stored": 0, "expected": 500, "drift": -500, "exists": False},
+        ]
+        with patch("services.balance_service.account_balances_collection") as coll:
+            coll.bulk_write.return_value.modified_count = 1
+            coll.bulk_write.return_value.upserted_count = 1
+            assert repair_balances(drift) == 2
+        bank, cash = coll.bulk_write.call_args[0][0]
+        assert bank._filter == {"user_id": "u1", "account": "Bank", "balance": 900}
+        assert bank._doc == {"$inc": {"balance": 100}} and not bank._upsert
+        assert cash._filter == {"user_id": "u1", "account": "Cash", "balance": {"$exists": False}}
+        assert cash._doc == {"$set": {"balance": 500}} and cash._upsert
+
+    def test_concurrently_created_balance_skipped(self):
+        drift = [{"user_id": "u1", "account": "Cash", "stored": 0, "expected": 500, "drift": -500, "exists": False}]
+        with patch("services.balance_service.account_balances_collection") as coll:
+            coll.bulk_write.side_effect = BulkWriteError({
+                "writeErrors": [{"index": 0, "code": 11000}], "nModified": 0, "nUpserted": 0
+            })
+            assert repair_balances(drift) == 0
+
+
+class TestRebuild:
+    """Tests for rebuilding balances while other workers write"""
+
+    def test_corrects_in_place_without_deleting(self):
+        with patch("services.balance_service.compute_balances") as compute, \
+                patch("services.balance_service.account_balances_collection") as coll:
+            compute.return_value = {("u1", "Cash"): 500}
+            coll.find.return_value = [{"user_id": "u1", "account": "Old", "balance": 50}]
+            coll.bulk_write.return_value.modified_count = 1
+            coll.bulk_write.return_value.upserted_count = 1
+            assert rebuild_balances() == 2
+        coll.delete_many.assert_not_called()
+        coll.insert_many.assert_not_called()
+        ops = {op._filter["account"]: op._doc for op in coll.bulk_write.call_args[0][0]}
+        assert ops == {"Cash": {"$set": {"balance": 500}}, "Old": {"$inc": {"balance": -50}}}
+
+    def test_only_one_worker_claims(self):
+        import database
+        with patch.object(database, "migrations_collection") as migrations:
+            migrations.update_one.side_effect = [None, DuplicateKeyError("E11000")]
+            assert database.claim_migration("account_balances") is True
+            assert database.claim_migration("account_balances") is False
+
+    def test_finished_migration_never_reclaimed(self):
+        import database
+        with patch.object(database, "migrations_collection") as migrations:
+            database.claim_migration("dedupe_categories")
+        assert migrations.update_one.call_args[0][0]["done"] == {"$ne": True}
+
+
+class TestDataVersions:
+    """Tests for the per-user version bumped on every write"""
+
+    @patch("services.balance_service.data_versions_collection")
+    @patch("services.balance_service.account_balances_collection")
+    def test_one_bump_per_user(self, _balances, versions):
+        apply_transactions([
+            {"type": "expense", "amount": 1, "payment_method": "Cash", "user_id": "u1"},
+            {"type": "expense", "amount": 2, "payment_method": "Cash", "user_id": "u1"},
+            {"type": "income", "amount": 3, "payment_method": "Bank", "user_id": "u2"},
+        ])
+        ops = versions.bulk_write.call_args[0][0]
+        assert sorted(op._filter["_id"] for op in ops) == ["u1", "u2"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,130 @@
+"""
+Unit Tests for Categorizer Service
+
+Run with: pytest tests/test_categorizer_service.py -v
+"""
+import pytest
+import sys
+import os
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import categorizer_service
+from services.categorizer_service import (
+    tokenize,
+    is_generic,
+    count_tokens,
+    Categorizer,
+    evaluate,
+    build_model,
+    learn
+)
+
+HISTORY = [
+    {"title": "便利商店午餐", "category": "Food", "type": "expense"},
+    {"title": "公司樓下午餐", "category": "Food", "type": "expense"},
+    {"title": "加油", "category": "Transport", "type": "expense"},
+    {"title": "中油加油站", "category": "Transport", "type": "expense"},
+    {"title": "Uber Eats dinner", "category": "Food", "type": "expense"},
+    {"title": "Uber ride", "category": "Transport", "type": "expense"},
+    {"title": "Uber ride", "category": "Transport", "type": "expense"},
+    {"title": "1月薪資", "category": "Salary", "type": "income"},
+    {"title": "雜項", "category": "Other", "type": "expense"},
+]
+
+
+class TestTokenize:
+    """Tests for title tokens"""
+
+    def test_cjk_bigrams(self):
+        assert tokenize("便利商店") == ["=便利商店", "便利", "利商", "商店"]
+
+    def test_words_are_normalized(self):
+        assert tokenize("  UBER   Eats ") == ["=uber eats", "uber", "eats"]
+
+    def test_empty(self):
+        assert tokenize("") == []
+        assert tokenize(None) == []
+
+
+class TestModel:
+    """Tests for training and prediction"""
+
+    def test_generic_categories_not_learned(self):
+        assert is_generic("Other") and is_generic("其他") and is_generic(None)
+        assert not any(category == "Other" for _, _, category in count_tokens(HISTORY))
+
+    def test_auto_categorized_rows_not_learned(self):
+        auto = {"title": "加油", "category": "Food", "type": "expense", "category_auto": True}
+        assert count_tokens([auto]) == {}
+
+    def test_exact_title(self):
+        model = Categorizer(count_tokens(HISTORY))
+        assert model.predict("加油") == ("Transport", 1.0)
+
+    def test_shared_tokens(self):
+        model = Categorizer(count_tokens(HISTORY))
+        assert model.predict("晚餐午餐")[0] == "Food"
+        assert model.predict("Uber")[0] == "Transport"  # 2 rides vs 1 meal
+
+    def test_type_separates_models(self):
+        model = Categorizer(count_tokens(HISTORY))
+        assert model.predict("1月薪資", "income")[0] == "Salary"
+        assert model.predict("1月薪資", "expense") == (None, 0.0)
+
+    def test_unknown_title(self):
+        assert Categorizer(count_tokens(HISTORY)).predict("電影票") == (None, 0.0)
+
+    def test_removed_counts_are_ignored(self):
+        counts = count_tokens(HISTORY)
+        counts.subtract(count_tokens([{"title": "加油", "category": "Transport", "type": "expense"}]))
+        assert Categorizer(counts).predict("加油")[0] == "Transport"  # Still known from 中油加油站
+
+    def test_evaluate(self):
+        result = evaluate(HISTORY * 5, holdout=0.2)
+        assert result["test"] == 8
+        assert result["accuracy"] == 1.0
+
+
+class TestLearn:
+    """Tests for incremental counter updates"""
+
+    @patch.object(categorizer_service, "_is_built", return_value=True)
+    @patch.object(categorizer_service, "category_tokens_collection")
+    def test_increments_per_token(self, tokens, _built):
+        learn([{"user_id": "u1", "title": "加油", "category": "Transport", "type": "expense"}], sign=-1)
+        ops = tokens.bulk_write.call_args[0][0]
+        assert {op._filter["token"] for op in ops} == {"=加油", "加油"}
+        assert all(op._doc == {"$inc": {"n": -1}} for op in ops)
+
+    @patch.object(categorizer_service, "_is_built", return_value=False)
+    @patch.object(categorizer_service, "category_tokens_collection")
+    def test_unbuilt_users_skipped(self, tokens, _built):
+        learn([{"user_id": "u1", "title": "加油", "category": "Transport"}])
+        tokens.bulk_write.assert_not_called()
+
+
+class TestBuildModel:
+    """Tests for (re)building counters from history"""
+
+    @patch.object(categorizer_service, "category_models_collection")
+    @patch.object(categorizer_service, "category_tokens_collection")
+    @patch.object(categorizer_service, "transactions_collection")
+    def test_overwrites_with_upserts(self, transactions, tokens, models):
+        transactions.find.return_value = [{"title": "加油", "category": "Transport", "type": "expense"}]
+        tokens.find.return_value = [{"type": "expense", "token": "午餐", "category": "Food"}]
+        assert build_model("u1") == 2
+        tokens.delete_many.assert_not_called()
+        tokens.insert_many.assert_not_called()
+        ops = tokens.bulk_write.call_args[0][0]
+        assert {op._filter["token"]: op._doc for op in ops} == {
+            "=加油": {"$set": {"n": 1}}, "加油": {"$set": {"n": 1}}, "午餐": {"$set": {"n": 0}}
+        }
+        assert all(op._upsert for op in ops)
+        models.update_one.assert_called_once()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,105 @@
+"""
+Unit Tests for Category Service and TTL Cache
+
+Run with: pytest tests/test_category_service.py -v
+"""
+import pytest
+import sys
+import os
+import time
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from services.cache import TTLCache
+from services import category_service
+
+
+class TestTTLCache:
+    """Tests for the in-process TTL cache"""
+
+    def test_set_and_get(self):
+        cache = TTLCache(ttl=60)
+        cache.set("a", [1])
+        assert cache.get("a") == [1]
+
+    def test_expiry(self):
+        cache = TTLCache(ttl=0.01)
+        cache.set("a", 1)
+        time.sleep(0.02)
+        assert cache.get("a") is None
+
+    def test_invalidate(self):
+        cache = TTLCache()
+        cache.set("a", 1)
+        cache.invalidate("a")
+        assert "a" not in cache
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert "a" in cache
+        assert "b" not in cache
+
+
+class TestUserLists:
+    """Tests for reading a user's lists"""
+
+    def test_every_read_sees_other_workers_writes(self):
+        docs = [{"_id": ObjectId(), "name": "Food", "user_id": "u1"}]
+        with patch.object(category_service, "categories_collection") as coll:
+            coll.find.return_value = docs
+            first = category_service.get_user_categories("u1")
+            coll.find.return_value = docs + [{"_id": ObjectId(), "name": "Pets", "user_id": "u1"}]
+            second = category_service.get_user_categories("u1")
+        assert [c["name"] for c in first] == ["Food"]
+        assert [c["name"] for c in second] == ["Food", "Pets"]
+        assert "_id" not in first[0]
+
+    def test_unseeded_user_gets_defaults(self):
+        with patch.object(category_service, "categories_collection") as coll, \
+                patch.object(category_service, "seed_user_defaults") as seed:
+            coll.find.side_effect = [[], [{"_id": ObjectId(), "name": "Food", "user_id": "u1"}]]
+            assert category_service.get_user_categories("u1")[0]["name"] == "Food"
+        seed.assert_called_once_with("u1")
+
+
+class TestSeeding:
+    """Tests for seeding under concurrent workers"""
+
+    def test_lost_upsert_race_counts_as_seeded(self):
+        with patch.object(category_service, "categories_collection") as coll:
+            coll.find.return_value = [{"_id": ObjectId(), "name": "Food", "type": "expense",
+                                       "is_default": True, "user_id": None}]
+            coll.bulk_write.side_effect = BulkWriteError({
+                "writeErrors": [{"index": 0, "code": 11000, "errmsg": "E11000 duplicate key"}],
+                "nUpserted": 0
+            })
+            assert category_service._seed(coll, "u1", category_service.CATEGORY_KEY) == 0
+
+    def test_other_write_errors_raised(self):
+        with patch.object(category_service, "categories_collection") as coll:
+            coll.find.return_value = [{"_id": ObjectId(), "name": "Food", "is_default": True, "user_id": None}]
+            coll.bulk_write.side_effect = BulkWriteError({"writeErrors": [{"index": 0, "code": 2}]})
+            with pytest.raises(BulkWriteError):
+                category_service._seed(coll, "u1", category_service.CATEGORY_KEY)
+
+    def test_remove_duplicates_keeps_oldest(self):
+        first, second, third = ObjectId(), ObjectId(), ObjectId()
+        with patch.object(category_service, "categories_collection") as categories, \
+                patch.object(category_service, "payment_methods_collection") as methods:
+            categories.aggregate.return_value = [{"_id": {}, "ids": [first, second, third], "n": 3}]
+            methods.aggregate.return_value = []
+            assert category_service.remove_duplicates() == 2
+        categories.delete_many.assert_called_once_with({"_id": {"$in": [second, third]}})
+        methods.delete_many.assert_not_called()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
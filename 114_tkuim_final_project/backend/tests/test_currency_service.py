@@ -0,0 +1,79 @@
+"""
+Unit Tests for Currency Service
+
+Run with: pytest tests/test_currency_service.py -v
+"""
+import pytest
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.currency_service import (
+    BASE_CURRENCY,
+    normalize_amount,
+    stamp_amount_base
+)
+
+
+def fail_lookup(currency):
+    raise AssertionError(f"rate lookup should not be called for {currency}")
+
+
+class TestNormalizeAmount:
+    """Tests for base-currency normalization"""
+
+    def test_base_currency_passthrough(self):
+        """TWD amounts should be stored as-is with rate 1"""
+        result = normalize_amount({"amount": 150, "currency": "TWD"}, fail_lookup)
+        assert result == (150, 1.0)
+
+    def test_missing_currency_defaults_to_base(self):
+        """Rows without currency (e.g. imports) are base currency"""
+        result = normalize_amount({"amount": 80}, fail_lookup)
+        assert result == (80, 1.0)
+
+    def test_nan_currency_defaults_to_base(self):
+        """pandas NaN in the currency column should not trigger a lookup"""
+        result = normalize_amount({"amount": 80, "currency": float("nan")}, fail_lookup)
+        assert result == (80, 1.0)
+
+    def test_foreign_amount_uses_given_rate(self):
+        """foreign_amount * exchange_rate should be the base amount"""
+        doc = {"amount": 3200, "currency": "USD", "foreign_amount": 100, "exchange_rate": 32.0}
+        assert normalize_amount(doc, fail_lookup) == (3200, 32.0)
+
+    def test_foreign_without_foreign_amount(self):
+        """Amount is treated as foreign when no foreign_amount is given"""
+        doc = {"amount": 10, "currency": "usd", "exchange_rate": 31.5}
+        assert normalize_amount(doc, fail_lookup) == (315, 31.5)
+
+    def test_missing_rate_uses_lookup(self):
+        """Missing exchange_rate should fall back to the rate lookup"""
+        doc = {"amount": 1000, "currency": "JPY"}
+        assert normalize_amount(doc, lambda c: 0.21) == (210, 0.21)
+
+    def test_nan_amount_is_zero(self):
+        """NaN amounts should normalize to zero instead of poisoning sums"""
+        assert normalize_amount({"amount": float("nan")}, fail_lookup) == (0, 1.0)
+
+
+class TestStampAmountBase:
+    """Tests for stamping write-time fields"""
+
+    def test_stamp_sets_fields(self):
+        """Stamped doc should carry amount_base, base_rate and base_currency"""
+        doc = stamp_amount_base({"amount": 500, "currency": "TWD"}, fail_lookup)
+        assert doc["amount_base"] == 500
+        assert doc["base_rate"] == 1.0
+        assert doc["base_currency"] == BASE_CURRENCY
+
+    def test_stamp_is_in_place(self):
+        """stamp_amount_base should mutate and return the same dict"""
+        doc = {"amount": 1}
+        assert stamp_amount_base(doc, fail_lookup) is doc
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
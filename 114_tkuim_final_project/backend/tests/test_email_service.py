@@ -0,0 +1,161 @@
+"""
+Unit Tests for Email Service
+
+Delivery tests run against a local debugging SMTP server started on a
+free port, so no real mail is sent.
+
+Run with: pytest tests/test_email_service.py -v
+"""
+import pytest
+import sys
+import os
+import socket
+import socketserver
+import threading
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import email_service
+from services.email_service import SmtpSession, deliver_batch, backoff_seconds
+
+
+class DebuggingSMTPHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP dialogue that records every received message"""
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost debugging server")
+        while True:
+            line = self.rfile.readline().decode(errors="replace").strip()
+            if not line:
+                return
+            verb = line.split(" ", 1)[0].upper()
+            self.server.commands.append(verb)
+            if verb == "EHLO":
+                lines = ["localhost"] + self.server.extensions
+                for i, text in enumerate(lines):
+                    self.reply(f"250{' ' if i == len(lines) - 1 else '-'}{text}")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline().decode(errors="replace")
+                    if chunk in (".\r\n", ""):
+                        break
+                    data.append(chunk)
+                self.server.messages.append("".join(data))
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), DebuggingSMTPHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.messages = []
+    server.commands = []
+    server.extensions = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _session(server, **kwargs):
+    return SmtpSession("127.0.0.1", server.server_address[1], starttls=False, timeout=5, **kwargs)
+
+
+def _doc(n):
+    return {"_id": n, "to": f"user{n}@example.com", "subject": f"Test {n}", "html": "<p>hi</p>", "attempts": 0}
+
+
+class TestSmtpSession:
+    """Tests for SMTP connection reuse"""
+
+    def test_reuses_one_connection(self, smtp_server):
+        session = _session(smtp_server)
+        for n in range(3):
+            session.send(email_service.build_message("noreply@example.com", _doc(n)))
+        session.close()
+        assert len(smtp_server.messages) == 3
+        assert smtp_server.connections == 1
+        assert session.connections == 1
+
+    def test_reconnects_after_idle_timeout(self, smtp_server):
+        session = _session(smtp_server, idle_timeout=-1)
+        session.send(email_service.build_message(None, _doc(1)))
+        session.send(email_service.build_message(None, _doc(2)))
+        session.close()
+        assert session.connections == 2
+
+    def test_missing_starttls_never_sends_credentials(self, smtp_server):
+        smtp_server.extensions = ["AUTH PLAIN LOGIN"]  # Advertises AUTH but not STARTTLS
+        session = SmtpSession("127.0.0.1", smtp_server.server_address[1], username="me@example.com",
+                              password="secret", starttls=True, timeout=5)
+        with pytest.raises(email_service.smtplib.SMTPNotSupportedError):
+            session.send(email_service.build_message(None, _doc(1)))
+        assert "AUTH" not in smtp_server.commands
+        assert smtp_server.messages == []
+        assert session.connections == 0
+
+
+class TestDeliverBatch:
+    """Tests for batch delivery and retry bookkeeping"""
+
+    def test_batch_sent_over_one_session(self, smtp_server):
+        session = _session(smtp_server)
+        with patch.object(email_service, "claim_batch", return_value=[_doc(1), _doc(2)]), \
+                patch.object(email_service, "email_outbox_collection") as coll:
+            result = deliver_batch(session, "w1")
+        session.close()
+        assert result == {"sent": 2, "retry": 0, "failed": 0}
+        assert smtp_server.connections == 1
+        assert coll.update_one.call_args[0][1]["$set"]["status"] == email_service.STATUS_SENT
+        assert coll.update_one.call_args[0][1]["$unset"] == {"html": ""}
+
+    def test_unreachable_server_schedules_retry(self):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        session = SmtpSession("127.0.0.1", port, starttls=False, timeout=1)
+        with patch.object(email_service, "claim_batch", return_value=[_doc(1)]), \
+                patch.object(email_service, "email_outbox_collection") as coll:
+            result = deliver_batch(session, "w1")
+        assert result == {"sent": 0, "retry": 1, "failed": 0}
+        update = coll.update_one.call_args[0][1]
+        assert update["$set"]["status"] == email_service.STATUS_PENDING
+        assert update["$set"]["attempts"] == 1
+        assert "$unset" not in update  # Still needed for the retry
+
+    def test_gives_up_after_max_attempts(self):
+        doc = dict(_doc(1), attempts=email_service.MAX_ATTEMPTS - 1)
+        with patch.object(email_service, "email_outbox_collection") as coll:
+            assert email_service._record_failure(doc, OSError("down"))
+        assert coll.update_one.call_args[0][1]["$set"]["status"] == email_service.STATUS_FAILED
+        assert coll.update_one.call_args[0][1]["$unset"] == {"html": ""}
+
+
+class TestBackoff:
+    """Tests for exponential backoff"""
+
+    def test_doubles(self):
+        assert backoff_seconds(1) == email_service.BACKOFF_BASE_SECONDS
+        assert backoff_seconds(3) == email_service.BACKOFF_BASE_SECONDS * 4
+
+    def test_capped(self):
+        assert backoff_seconds(50) == email_service.BACKOFF_MAX_SECONDS
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,207 @@
+"""
+Unit Tests for Export Service
+
+Run with: pytest tests/test_export_service.py -v
+"""
+import pytest
+import sys
+import os
+import io
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from services import export_service
+from services.export_service import (
+    export_query,
+    cache_key,
+    submit_export,
+    can_access_job,
+    run_export_job,
+    write_export_xlsx,
+    parse_range,
+    iter_file_range
+)
+
+
+class TestParseRange:
+    """Tests for single-range Range headers"""
+
+    def test_no_header(self):
+        assert parse_range(None, 100) is None
+
+    def test_closed_range(self):
+        assert parse_range("bytes=0-49", 100) == (0, 49)
+
+    def test_open_ended_range(self):
+        assert parse_range("bytes=50-", 100) == (50, 99)
+
+    def test_suffix_range(self):
+        assert parse_range("bytes=-10", 100) == (90, 99)
+
+    def test_end_is_clamped(self):
+        assert parse_range("bytes=90-500", 100) == (90, 99)
+
+    def test_multiple_ranges_ignored(self):
+        assert parse_range("bytes=0-1,5-6", 100) is None
+
+    def test_unsatisfiable(self):
+        with pytest.raises(ValueError):
+            parse_range("bytes=100-", 100)
+
+
+class TestIterFileRange:
+    """Tests for chunked range reads"""
+
+    def test_reads_inclusive_range_in_chunks(self):
+        chunks = list(iter_file_range(io.BytesIO(b"0123456789"), 2, 7, chunk_size=4))
+        assert chunks == [b"2345", b"67"]
+
+
+class TestCacheKey:
+    """Tests for keying exports by filter and data version"""
+
+    def test_scope_query(self):
+        assert export_query(None) == {}
+        assert export_query(["u1"]) == {"user_id": {"$in": ["u1"]}}
+
+    def test_changes_with_data_version(self):
+        with patch.object(export_service, "get_data_versions", return_value={"u1": 1}):
+            before = cache_key(["u1"])
+        with patch.object(export_service, "get_data_versions", return_value={"u1": 2}):
+            after = cache_key(["u1"])
+        assert before != after
+
+    def test_changes_with_scope(self):
+        with patch.object(export_service, "get_data_versions", return_value={}):
+            assert cache_key(["u1"]) != cache_key(None)
+
+
+class TestSubmitExport:
+    """Tests for reusing jobs instead of rebuilding"""
+
+    def _existing(self, status):
+        now = datetime.utcnow()
+        return {"_id": ObjectId(), "status": status, "rows": 3, "size": 100,
+                "created_at": now, "expires_at": now + timedelta(hours=1)}
+
+    @patch.object(export_service, "purge_expired", return_value=0)
+    @patch.object(export_service, "cache_key", return_value="k")
+    @patch.object(export_service, "_executor")
+    @patch.object(export_service, "export_jobs_collection")
+    def test_reuses_matching_job(self, jobs, executor, _key, _purge):
+        existing = self._existing("done")
+        jobs.find_one.return_value = existing
+        job, cached = submit_export(["u1"], "u1")
+        assert cached
+        assert job["id"] == str(existing["_id"])
+        jobs.insert_one.assert_not_called()
+        executor.submit.assert_not_called()
+
+    @patch.object(export_service, "purge_expired", return_value=0)
+    @patch.object(export_service, "cache_key", return_value="k")
+    @patch.object(export_service, "_executor")
+    @patch.object(export_service, "export_jobs_collection")
+    def test_starts_new_job(self, jobs, executor, _key, _purge):
+        jobs.find_one.return_value = None
+        jobs.insert_one.return_value.inserted_id = ObjectId()
+        job, cached = submit_export(["u1"], "u1")
+        assert not cached
+        assert job["status"] == "pending"
+        inserted = jobs.insert_one.call_args[0][0]
+        assert inserted["cache_key"] == "k"
+        assert inserted["scope"] == ["u1"]
+        executor.submit.assert_called_once_with(run_export_job, inserted["_id"])
+
+
+class TestCanAccessJob:
+    """Tests for job access (jobs are shared across requesters)"""
+
+    def test_reused_admin_job_of_own_data(self):
+        job = {"scope": ["u1"], "requested_by": "admin1"}
+        assert can_access_job(job, {"id": "u1", "role": "user"})
+
+    def test_other_users_data(self):
+        job = {"scope": ["u2"], "requested_by": "admin1"}
+        assert not can_access_job(job, {"id": "u1", "role": "user"})
+        assert not can_access_job({"scope": ["u1", "u2"], "requested_by": "admin1"}, {"id": "u1", "role": "user"})
+
+    def test_all_users_export_is_admin_only(self):
+        job = {"scope": None, "requested_by": "admin1"}
+        assert not can_access_job(job, {"id": "u1", "role": "user"})
+        assert can_access_job(job, {"id": "admin2", "role": "admin"})
+
+
+class TestRunExportJob:
+    """Tests for the worker side of a job"""
+
+    @patch.object(export_service, "export_jobs_collection")
+    def test_skips_job_claimed_elsewhere(self, jobs):
+        jobs.find_one_and_update.return_value = None
+        run_export_job(ObjectId())
+        jobs.update_one.assert_not_called()
+
+    @patch.object(export_service, "_fs")
+    @patch.object(export_service, "write_export_xlsx", side_effect=RuntimeError("boom"))
+    @patch.object(export_service, "export_jobs_collection")
+    def test_failure_is_recorded(self, jobs, _write, fs):
+        job_id = ObjectId()
+        jobs.find_one_and_update.return_value = {"_id": job_id, "scope": None, "expires_at": datetime.utcnow()}
+        run_export_job(job_id)
+        update = jobs.update_one.call_args[0][1]["$set"]
+        assert update["status"] == "failed"
+        assert update["error"] == "boom"
+        fs.put.assert_not_called()
+
+    @patch.object(export_service, "_fs")
+    @patch.object(export_service, "write_export_xlsx")
+    @patch.object(export_service, "export_jobs_collection")
+    def test_file_stored_with_expiry(self, jobs, write, fs):
+        def fake_write(scope, fileobj):
+            fileobj.write(b"xlsx-bytes")
+            return 2
+        write.side_effect = fake_write
+        job_id = ObjectId()
+        expires_at = datetime.utcnow() + timedelta(hours=1)
+        jobs.find_one_and_update.return_value = {"_id": job_id, "scope": ["u1"], "expires_at": expires_at}
+        fs.put.return_value = "file-id"
+        run_export_job(job_id)
+        assert fs.put.call_args[1]["metadata"] == {"job_id": job_id, "expires_at": expires_at}
+        update = jobs.update_one.call_args[0][1]["$set"]
+        assert update == dict(update, status="done", file_id="file-id", rows=2, size=10)
+
+
+class TestWriteExportXlsx:
+    """Tests for building the workbook"""
+
+    @patch.object(export_service, "resolve_members")
+    @patch.object(export_service, "transactions_collection")
+    def test_names_resolved_in_one_batch(self, transactions, members):
+        transactions.find.return_value.sort.return_value = [
+            {"_id": ObjectId(), "date": "2024-01-02", "type": "expense", "title": "Lunch", "amount": 120, "user_id": "u1"},
+            {"_id": ObjectId(), "date": "2024-01-01", "type": "income", "title": "Pay", "amount": 500, "user_id": "u2"},
+        ]
+        members.return_value = {"u1": {"display_name": "Alice"}}
+        output = io.BytesIO()
+        assert write_export_xlsx(["u1", "u2"], output) == 2
+        members.assert_called_once_with({"u1", "u2"})
+
+        from openpyxl import load_workbook
+        output.seek(0)
+        rows = list(load_workbook(output).active.values)
+        assert rows[0][-1] == "user_display_name"
+        assert [row[-1] for row in rows[1:]] == ["Alice", "Unknown"]
+
+    @patch.object(export_service, "transactions_collection")
+    def test_empty_scope_writes_nothing(self, transactions):
+        transactions.find.return_value.sort.return_value = []
+        output = io.BytesIO()
+        assert write_export_xlsx(["u1"], output) == 0
+        assert output.getvalue() == b""
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,78 @@
+"""
+Unit Tests for Family Service
+
+Run with: pytest tests/test_family_service.py -v
+"""
+import pytest
+import sys
+import os
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from services import family_service
+
+
+def _user(name):
+    return {"_id": ObjectId(), "username": name, "display_name": name.title(), "role": "user"}
+
+
+class TestResolveMembers:
+    """Tests for batched member lookups"""
+
+    def setup_method(self):
+        family_service._member_directory.clear()
+
+    def test_single_in_query(self):
+        users = [_user("alice"), _user("bob"), _user("carol")]
+        ids = [str(u["_id"]) for u in users]
+        with patch.object(family_service, "users_collection") as coll:
+            coll.find.return_value = users
+            profiles = family_service.resolve_members(ids)
+        assert coll.find.call_count == 1
+        query, projection = coll.find.call_args[0]
+        assert len(query["_id"]["$in"]) == 3
+        assert projection == family_service.MEMBER_PROJECTION
+        assert profiles[ids[1]]["display_name"] == "Bob"
+
+    def test_cached_members_not_refetched(self):
+        alice, bob = _user("alice"), _user("bob")
+        with patch.object(family_service, "users_collection") as coll:
+            coll.find.return_value = [alice]
+            family_service.resolve_members([str(alice["_id"])])
+            coll.find.return_value = [bob]
+            profiles = family_service.resolve_members([str(alice["_id"]), str(bob["_id"])])
+        assert coll.find.call_args[0][0]["_id"]["$in"] == [bob["_id"]]
+        assert set(profiles) == {str(alice["_id"]), str(bob["_id"])}
+
+    def test_fully_cached_makes_no_query(self):
+        alice = _user("alice")
+        with patch.object(family_service, "users_collection") as coll:
+            coll.find.return_value = [alice]
+            family_service.resolve_members([str(alice["_id"])])
+            family_service.resolve_members([str(alice["_id"])])
+        assert coll.find.call_count == 1
+
+    def test_invalid_and_duplicate_ids(self):
+        alice = _user("alice")
+        alice_id = str(alice["_id"])
+        with patch.object(family_service, "users_collection") as coll:
+            coll.find.return_value = [alice]
+            profiles = family_service.resolve_members([alice_id, "not-an-id", alice_id])
+        assert coll.find.call_args[0][0]["_id"]["$in"] == [alice["_id"]]
+        assert list(profiles) == [alice_id]
+
+    def test_invalidate_member(self):
+        alice = _user("alice")
+        with patch.object(family_service, "users_collection") as coll:
+            coll.find.return_value = [alice]
+            family_service.resolve_members([str(alice["_id"])])
+            family_service.invalidate_member(str(alice["_id"]))
+            family_service.resolve_members([str(alice["_id"])])
+        assert coll.find.call_count == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,68 @@
+"""
+Unit Tests for Forecast Service
+
+Run with: pytest tests/test_forecast_service.py -v
+"""
+import pytest
+import sys
+import os
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.forecast_service import project_balances
+from services.recurring_service import expand_occurrences
+
+
+class TestProjectBalances:
+    """Tests for the vectorized balance projection"""
+
+    def test_no_activity_keeps_balance(self):
+        """Without rules or spending the balance stays flat"""
+        result = project_balances({"Bank": 1000}, [], [], "2026-01-01", (30, 90))
+        assert result["accounts"][0]["projected"] == {"30": 1000.0, "90": 1000.0}
+
+    def test_recurring_income_and_expense(self):
+        """Occurrences inside the horizon should move the balance"""
+        occurrences = [
+            {"date": "2026-01-05", "type": "income", "amount": 50000, "payment_method": "Bank"},
+            {"date": "2026-01-10", "type": "expense", "amount": 15000, "payment_method": "Bank"},
+            {"date": "2026-03-01", "type": "expense", "amount": 999, "payment_method": "Bank"},
+        ]
+        result = project_balances({"Bank": 0}, occurrences, [], "2026-01-01", (30,))
+        assert result["accounts"][0]["projected"]["30"] == 35000.0
+
+    def test_trailing_rate_is_daily_outflow(self):
+        """A daily spending rate should accumulate linearly"""
+        rates = [{"category": "Food", "account": "Cash", "daily_rate": 100}]
+        result = project_balances({"Cash": 10000}, [], rates, "2026-01-01", (30, 90))
+        assert result["accounts"][0]["projected"] == {"30": 7000.0, "90": 1000.0}
+        assert result["category_spend"]["Food"] == {"30": 3000, "90": 9000}
+
+    def test_new_accounts_from_rules(self):
+        """Accounts only referenced by rules should appear with zero start balance"""
+        occurrences = [{"date": "2026-01-02", "type": "expense", "amount": 500, "payment_method": "Credit Card"}]
+        result = project_balances({"Bank": 100}, occurrences, [], "2026-01-01", (30,))
+        accounts = {a["account"]: a for a in result["accounts"]}
+        assert accounts["Credit Card"]["projected"]["30"] == -500.0
+        assert accounts["Bank"]["projected"]["30"] == 100.0
+
+    def test_year_projection_is_fast(self):
+        """A year-long projection over many accounts and rules should be quick"""
+        rules = [{
+            "_id": str(i), "title": "r", "amount": 100 + i, "category": "c",
+            "type": "expense", "payment_method": f"Account {i % 20}",
+            "next_date": "2026-01-01", "frequency": "weekly" if i % 2 else "monthly"
+        } for i in range(200)]
+        balances = {f"Account {i}": 10000 for i in range(20)}
+        started = time.perf_counter()
+        result = project_balances(
+            balances, expand_occurrences(rules, "2026-01-01", "2026-12-31"), [], "2026-01-01"
+        )
+        assert time.perf_counter() - started < 1.0
+        assert len(result["accounts"]) == 20
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,350 @@
+"""
+Unit Tests for Import Service
+
+Run with: pytest tests/test_import_service.py -v
+"""
+import pytest
+import sys
+import os
+import io
+import tempfile
+from datetime import datetime
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.import_service import (
+    detect_encoding,
+    iter_csv_rows,
+    iter_xlsx_rows,
+    read_rows,
+    missing_columns,
+    chunked,
+    DateParser,
+    parse_amount,
+    normalize_record,
+    validate_chunk,
+    validate_upload,
+    normalize_title,
+    Fingerprinter,
+    insert_new
+)
+from pymongo.errors import BulkWriteError
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "test_data")
+
+
+class TestDetectEncoding:
+    """Tests for BOM and encoding detection"""
+
+    def test_utf8_bom(self):
+        assert detect_encoding("\ufeffdate".encode("utf-8")) == "utf-8-sig"
+
+    def test_utf16_bom(self):
+        assert detect_encoding("date".encode("utf-16")) == "utf-16"
+
+    def test_plain_utf8(self):
+        assert detect_encoding("午餐".encode("utf-8")) == "utf-8"
+
+    def test_multibyte_char_cut_by_sample(self):
+        assert detect_encoding("午餐".encode("utf-8")[:4]) == "utf-8"
+
+    def test_big5_fallback(self):
+        assert detect_encoding("午餐".encode("cp950")) == "cp950"
+
+
+class TestIterCsvRows:
+    """Tests for streaming CSV rows"""
+
+    def _read(self, data: bytes):
+        columns, rows = iter_csv_rows(io.BytesIO(data))
+        return columns, list(rows)
+
+    def test_bom_stripped_from_header(self):
+        columns, rows = self._read("\ufeffdate,title\n2024/1/1,午餐\n".encode("utf-8"))
+        assert columns == ["date", "title"]
+        assert rows == [{"date": "2024/1/1", "title": "午餐"}]
+
+    def test_big5_file(self):
+        _, rows = self._read("date,title\n2024/1/1,便利商店\n".encode("cp950"))
+        assert rows[0]["title"] == "便利商店"
+
+    def test_quoted_newline_and_blank_lines(self):
+        _, rows = self._read(b'date,note\r\n2024-01-01,"a\r\nb"\r\n,\r\n\r\n')
+        assert rows == [{"date": "2024-01-01", "note": "a\r\nb"}]
+
+    def test_reads_spooled_upload(self):
+        with tempfile.SpooledTemporaryFile(max_size=10) as upload:
+            with open(os.path.join(TEST_DATA, "dad.csv"), "rb") as f:
+                upload.write(f.read())
+            upload.seek(0)
+            columns, rows = read_rows(upload, "dad.csv")
+            rows = list(rows)
+        assert missing_columns(columns) == []
+        assert len(rows) == 20
+        assert rows[0]["title"] == "1月薪資"
+
+    def test_unsupported_extension(self):
+        with pytest.raises(ValueError):
+            read_rows(io.BytesIO(b""), "data.txt")
+
+
+def _workbook(*sheets) -> io.BytesIO:
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in sheets:
+        sheet = workbook.create_sheet(title)
+        for row in rows:
+            sheet.append(row)
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+class TestIterXlsxRows:
+    """Tests for read-only XLSX streaming"""
+
+    HEADER = ["date", "title", "amount", "category"]
+
+    def test_typed_cells(self):
+        columns, rows = iter_xlsx_rows(_workbook(
+            ("Jan", [self.HEADER, [datetime(2026, 1, 5), "加油", 1500, "Transport"]])
+        ))
+        assert columns == self.HEADER
+        assert list(rows) == [
+            {"date": datetime(2026, 1, 5), "title": "加油", "amount": 1500, "category": "Transport"}
+        ]
+
+    def test_all_matching_sheets_imported(self):
+        _, rows = iter_xlsx_rows(_workbook(
+            ("Summary", [["total"], [1650]]),
+            ("Jan", [self.HEADER, ["2026/1/5", "加油", 1500, "Transport"], [None, None, None, None]]),
+            ("Feb", [self.HEADER, ["2026/2/1", "午餐", 150, "Food"]]),
+        ))
+        assert [row["title"] for row in rows] == ["加油", "午餐"]
+
+    def test_missing_columns_reported_from_first_sheet(self):
+        columns, rows = iter_xlsx_rows(_workbook(("Sheet", [["date", "title"], ["2026/1/1", "x"]])))
+        assert missing_columns(columns) == ["amount"]
+        assert list(rows) == []
+
+    def test_normalizes_like_csv(self):
+        _, rows = read_rows(_workbook(("Jan", [self.HEADER, [datetime(2026, 1, 5), " 加油 ", 1500.0, "Transport"]])), "bank.xlsx")
+        record, errors = normalize_record(next(rows), DateParser())
+        assert errors == []
+        assert record["date"] == "2026-01-05"
+        assert record["title"] == "加油"
+        assert record["amount"] == 1500 and isinstance(record["amount"], int)
+
+
+class TestChunked:
+    """Tests for chunking"""
+
+    def test_sizes(self):
+        assert [len(c) for c in chunked(range(7), 3)] == [3, 3, 1]
+
+
+class TestDateParser:
+    """Tests for date format detection"""
+
+    @pytest.mark.parametrize("value", [
+        "2026/1/1", "2026-01-01", "2026.01.01", "20260101", "01/01/2026", "2026-01-01 08:30:00"
+    ])
+    def test_formats(self, value):
+        assert DateParser().parse(value) == "2026-01-01"
+
+    def test_datetime_cells(self):
+        assert DateParser().parse(datetime(2026, 3, 4, 5, 6)) == "2026-03-04"
+
+    def test_unparseable(self):
+        parser = DateParser()
+        assert parser.parse("yesterday") is None
+        assert parser.parse("2026/13/40") is None
+        assert parser.parse("") is None
+
+    def test_last_match_tried_first(self):
+        parser = DateParser()
+        parser.parse("20260101")
+        assert parser._patterns[0] is DateParser.PATTERNS[1]
+
+
+class TestParseAmount:
+    """Tests for numeric coercion"""
+
+    def test_whole_numbers_become_int(self):
+        assert parse_amount("1500") == 1500
+        assert isinstance(parse_amount("1500.0"), int)
+
+    def test_separators_and_currency(self):
+        assert parse_amount("NT$ 1,250") == 1250
+
+    def test_decimal(self):
+        assert parse_amount("12.5") == 12.5
+
+    def test_empty(self):
+        assert parse_amount("") is None
+        assert parse_amount(None) is None
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            parse_amount("abc")
+        with pytest.raises(ValueError):
+            parse_amount("nan")
+
+
+class TestNormalizeRecord:
+    """Tests for typed row coercion"""
+
+    def test_defaults_and_types(self):
+        record, errors = normalize_record(
+            {"date": "2026/1/3", "type": "", "category": "Food", "title": " 便利商店午餐 ",
+             "amount": "120", "note": ""},
+            DateParser()
+        )
+        assert errors == []
+        assert record == {
+            "date": "2026-01-03", "type": "expense", "category": "Food", "title": "便利商店午餐",
+            "amount": 120, "note": None, "payment_method": "Cash"
+        }
+
+    def test_headerless_cells_dropped(self):
+        record, _ = normalize_record({"date": "2026/1/3", "amount": "1", "": "x"}, DateParser())
+        assert "" not in record
+
+    def test_problems_reported_together(self):
+        _, errors = normalize_record(
+            {"date": "someday", "type": "refund", "title": "x", "amount": "abc"},
+            DateParser()
+        )
+        assert errors == ["金額格式錯誤: abc", "日期無法解析: someday", "未知的類型: refund"]
+
+    def test_category_may_be_empty(self):
+        _, errors = normalize_record({"date": "2026/1/1", "category": "", "title": "x", "amount": "1"}, DateParser())
+        assert errors == []
+
+    def test_missing_date_is_an_error(self):
+        _, errors = normalize_record({"date": "", "category": "Food", "title": "x", "amount": "1"}, DateParser())
+        assert errors == ["date 不可為空白"]
+
+
+class TestValidation:
+    """Tests for per-chunk validation and the dry-run report"""
+
+    ROW = {"date": "2026/1/3", "category": "Food", "title": "午餐", "amount": "120"}
+
+    def test_chunk_row_numbers(self):
+        valid, invalid = validate_chunk([self.ROW, dict(self.ROW, amount="x"), self.ROW], DateParser(), 10)
+        assert len(valid) == 2
+        assert invalid == [{"row": 11, "errors": ["金額格式錯誤: x"]}]
+
+    def test_report_spans_chunks(self):
+        rows = [self.ROW] * 5 + [dict(self.ROW, date="bad")] + [self.ROW] * 3
+        report = validate_upload(iter(rows), chunk_size=4).to_api()
+        assert report["rows"] == 9
+        assert report["valid_rows"] == 8
+        assert report["errors"] == [{"row": 7, "errors": ["日期無法解析: bad"]}]
+        assert not report["errors_truncated"]
+
+    def test_report_is_capped(self):
+        with patch("services.import_service.MAX_REPORTED_ERRORS", 2):
+            report = validate_upload(iter([dict(self.ROW, amount="x")] * 5), chunk_size=2).to_api()
+        assert report["error_rows"] == 5
+        assert len(report["errors"]) == 2
+        assert report["errors_truncated"]
+
+    @patch("services.import_service.find_existing")
+    def test_dry_run_counts_stored_rows(self, find_existing):
+        find_existing.side_effect = lambda fingerprints: set(fingerprints[:1])
+        report = validate_upload(iter([self.ROW] * 3), Fingerprinter("u1"), chunk_size=2)
+        assert report.duplicates == 2  # One per chunk
+        assert find_existing.call_count == 2
+
+    def test_csv_upload_can_be_read_twice(self):
+        upload = io.BytesIO(b"date,title,amount,category\n2026/1/1,x,1,Food\n")
+        _, rows = read_rows(upload, "a.csv")
+        assert len(list(rows)) == 1
+        upload.seek(0)
+        _, rows = read_rows(upload, "a.csv")
+        assert len(list(rows)) == 1
+
+
+def _fingerprints(filename: str, user_id: str = "u1"):
+    with open(os.path.join(TEST_DATA, filename), "rb") as f:
+        _, rows = read_rows(f, filename)
+        date_parser = DateParser()
+        fingerprint = Fingerprinter(user_id)
+        return [fingerprint(normalize_record(row, date_parser)[0]) for row in rows]
+
+
+class TestFingerprint:
+    """Tests for duplicate-import fingerprints"""
+
+    def test_title_normalization(self):
+        assert normalize_title("  Ｌｕｎｃｈ   Box ") == normalize_title("lunch box")
+
+    def test_reimport_reproduces_fingerprints(self):
+        first = _fingerprints("mom.csv")
+        assert first == _fingerprints("mom.csv")
+        assert len(set(first)) == len(first)
+
+    def test_identical_rows_in_one_file_are_kept_apart(self):
+        fingerprint = Fingerprinter("u1")
+        row = {"date": "2026-01-03", "amount": 60, "title": "咖啡", "payment_method": "Cash"}
+        assert fingerprint(row) != fingerprint(dict(row))
+
+    def test_user_and_fields_matter(self):
+        row = {"date": "2026-01-03", "amount": 60, "title": "咖啡", "payment_method": "Cash"}
+        base = Fingerprinter("u1")(row)
+        assert Fingerprinter("u2")(row) != base
+        assert Fingerprinter("u1")(dict(row, amount=61)) != base
+        assert Fingerprinter("u1")(dict(row, payment_method="Bank")) != base
+        assert Fingerprinter("u1")(dict(row, title=" 咖啡 ")) == base
+
+
+class TestInsertNew:
+    """Tests for skipping stored rows with one probe per chunk"""
+
+    def _records(self, *fingerprints):
+        return [{"title": fp, "import_fingerprint": fp} for fp in fingerprints]
+
+    @patch("services.import_service.transactions_collection")
+    def test_skips_stored_fingerprints(self, transactions):
+        transactions.find.return_value = [{"import_fingerprint": "a"}]
+        inserted, skipped = insert_new(self._records("a", "b", "c"))
+        assert [r["import_fingerprint"] for r in inserted] == ["b", "c"]
+        assert skipped == 1
+        assert transactions.find.call_count == 1
+        assert transactions.find.call_args[0][0] == {"import_fingerprint": {"$in": ["a", "b", "c"]}}
+
+    @patch("services.import_service.transactions_collection")
+    def test_all_duplicates_inserts_nothing(self, transactions):
+        transactions.find.return_value = [{"import_fingerprint": "a"}]
+        assert insert_new(self._records("a")) == ([], 1)
+        transactions.insert_many.assert_not_called()
+
+    @patch("services.import_service.transactions_collection")
+    def test_concurrent_duplicate_counted_as_skipped(self, transactions):
+        transactions.find.return_value = []
+        transactions.insert_many.side_effect = BulkWriteError(
+            {"writeErrors": [{"index": 1, "code": 11000, "errmsg": "dup"}]}
+        )
+        inserted, skipped = insert_new(self._records("a", "b"))
+        assert [r["import_fingerprint"] for r in inserted] == ["a"]
+        assert skipped == 1
+
+    @patch("services.import_service.transactions_collection")
+    def test_other_write_errors_raise(self, transactions):
+        transactions.find.return_value = []
+        transactions.insert_many.side_effect = BulkWriteError(
+            {"writeErrors": [{"index": 0, "code": 121, "errmsg": "validation"}]}
+        )
+        with pytest.raises(BulkWriteError):
+            insert_new(self._records("a"))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,62 @@
+"""
+Unit Tests for Invite Service
+
+Run with: pytest tests/test_invite_service.py -v
+"""
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo.errors import DuplicateKeyError
+from services import invite_service
+
+
+class TestCreateInvite:
+    """Tests for insert-and-retry code generation"""
+
+    def test_stores_datetime_expiry(self):
+        with patch.object(invite_service, "invites_collection") as coll:
+            invite = invite_service.create_invite("L1", "u1", timedelta(days=7))
+        stored = coll.insert_one.call_args[0][0]
+        assert isinstance(stored["expires_at"], datetime)
+        assert stored["expires_at"] - stored["created_at"] == timedelta(days=7)
+        assert len(invite["code"]) == invite_service.CODE_LENGTH
+
+    def test_retries_on_duplicate_code(self):
+        with patch.object(invite_service, "invites_collection") as coll:
+            coll.insert_one.side_effect = [DuplicateKeyError("dup"), DuplicateKeyError("dup"), None]
+            invite_service.create_invite("L1", "u1", timedelta(minutes=30))
+        assert coll.insert_one.call_count == 3
+
+    def test_gives_up_after_max_attempts(self):
+        with patch.object(invite_service, "invites_collection") as coll:
+            coll.insert_one.side_effect = DuplicateKeyError("dup")
+            with pytest.raises(RuntimeError):
+                invite_service.create_invite("L1", "u1", timedelta(minutes=30))
+        assert coll.insert_one.call_count == invite_service.MAX_ATTEMPTS
+
+
+class TestLookup:
+    """Tests for indexed lookups"""
+
+    def test_find_invite_filters_expired(self):
+        with patch.object(invite_service, "invites_collection") as coll:
+            invite_service.find_invite("ABC123")
+        query = coll.find_one.call_args[0][0]
+        assert query["code"] == "ABC123"
+        assert isinstance(query["expires_at"]["$gt"], datetime)
+
+    def test_to_api_serializes_utc(self):
+        doc = {"_id": "x", "code": "ABC123", "expires_at": datetime(2025, 1, 1, 12, 0)}
+        api = invite_service.to_api(doc)
+        assert api["id"] == "x"
+        assert api["expires_at"] == "2025-01-01T12:00:00+00:00"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,89 @@
+"""
+Unit Tests for Membership Service
+
+Run with: pytest tests/test_membership_service.py -v
+"""
+import pytest
+import sys
+import os
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from services import membership_service
+from services.membership_service import LEDGER, FAMILY
+
+
+@pytest.fixture
+def coll():
+    membership_service._decisions.clear()
+    with patch.object(membership_service, "memberships_collection") as mock:
+        yield mock
+    membership_service._decisions.clear()
+
+
+class TestDecisions:
+    """Tests for cached permission checks"""
+
+    def test_role_lookup_is_cached(self, coll):
+        coll.find_one.return_value = {"role": "owner"}
+        assert membership_service.get_role("u1", LEDGER, "L1") == "owner"
+        assert membership_service.has_access("u1", LEDGER, "L1")
+        coll.find_one.assert_called_once_with({"principal": "u1", "scope": "ledger:L1"}, {"role": 1})
+
+    def test_denial_is_cached(self, coll):
+        coll.find_one.return_value = None
+        assert not membership_service.has_access("u1", LEDGER, "L1")
+        assert not membership_service.has_access("u1", LEDGER, "L1")
+        assert coll.find_one.call_count == 1
+
+    def test_grant_invalidates_denial(self, coll):
+        coll.find_one.return_value = None
+        assert not membership_service.has_access("u1", LEDGER, "L1")
+        membership_service.grant("u1", LEDGER, "L1")
+        coll.find_one.return_value = {"role": "member"}
+        assert membership_service.has_access("u1", LEDGER, "L1")
+
+    def test_revoke_invalidates_scope_lists(self, coll):
+        coll.find.return_value = [{"scope": "ledger:L1"}, {"scope": "ledger:L2"}]
+        assert membership_service.scopes_for("u1", LEDGER) == ["L1", "L2"]
+        membership_service.revoke("u1", LEDGER, "L2")
+        coll.find.return_value = [{"scope": "ledger:L1"}]
+        assert membership_service.scopes_for("u1", LEDGER) == ["L1"]
+        assert coll.find.call_count == 2
+
+    def test_scopes_for_uses_prefix(self, coll):
+        coll.find.return_value = [{"scope": "family:F1"}]
+        assert membership_service.family_of("u1") == "F1"
+        query = coll.find.call_args[0][0]
+        assert query == {"principal": "u1", "scope": {"$regex": "^family:"}}
+
+    def test_principals_in(self, coll):
+        coll.find.return_value = [{"principal": "u1"}, {"principal": "u2"}]
+        assert membership_service.principals_in(FAMILY, "F1") == ["u1", "u2"]
+        assert membership_service.principals_in(FAMILY, "F1") == ["u1", "u2"]
+        assert coll.find.call_count == 1
+
+
+class TestRebuild:
+    """Tests for building grants from embedded member lists"""
+
+    def test_roles_from_ledgers_and_families(self, coll):
+        ledger_id, family_id = ObjectId(), ObjectId()
+        with patch.object(membership_service, "ledgers_collection") as ledgers, \
+                patch.object(membership_service, "families_collection") as families:
+            ledgers.find.return_value = [{"_id": ledger_id, "owner_id": "u1", "members": ["u1", "u2"]}]
+            families.find.return_value = [{"_id": family_id, "admin_id": "u1", "members": ["u1", "u3"]}]
+            assert membership_service.rebuild_memberships() == 4
+        ops = coll.bulk_write.call_args[0][0]
+        grants = {(op._filter["principal"], op._filter["scope"]): op._doc["$set"]["role"] for op in ops}
+        assert grants[("u1", f"ledger:{ledger_id}")] == "owner"
+        assert grants[("u2", f"ledger:{ledger_id}")] == "member"
+        assert grants[("u1", f"family:{family_id}")] == "admin"
+        assert grants[("u3", f"family:{family_id}")] == "member"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,89 @@
+"""
+Unit Tests for Password Service
+
+Run with: pytest tests/test_password_service.py -v
+"""
+import pytest
+import sys
+import os
+import hashlib
+import threading
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import password_service
+from services.password_service import (
+    hash_password_sync,
+    verify_password_sync,
+    needs_rehash,
+    PasswordPoolBusy
+)
+
+
+class TestScrypt:
+    """Tests for the scrypt format"""
+
+    def test_round_trip(self):
+        hashed = hash_password_sync("S3cret!", n=2 ** 10)
+        assert hashed.startswith("scrypt$1024$")
+        assert verify_password_sync("S3cret!", hashed)
+        assert not verify_password_sync("s3cret!", hashed)
+
+    def test_cost_is_read_from_hash(self):
+        """Hashes made at an old cost still verify after the setting changes"""
+        hashed = hash_password_sync("pw", n=2 ** 11)
+        assert verify_password_sync("pw", hashed)
+        assert needs_rehash(hashed) == (password_service.SCRYPT_N != 2 ** 11)
+
+    def test_current_cost_needs_no_rehash(self):
+        assert not needs_rehash(hash_password_sync("pw"))
+
+
+class TestLegacyHashes:
+    """Tests for hashes written by earlier versions"""
+
+    def test_salted_sha256(self):
+        legacy = "abcd1234abcd1234$" + hashlib.sha256(b"abcd1234abcd1234" + b"pw").hexdigest()
+        assert verify_password_sync("pw", legacy)
+        assert not verify_password_sync("other", legacy)
+        assert needs_rehash(legacy)
+
+    def test_unsalted_sha256(self):
+        legacy = hashlib.sha256(b"pw").hexdigest()
+        assert verify_password_sync("pw", legacy)
+        assert needs_rehash(legacy)
+
+    def test_garbage_rejected(self):
+        assert not verify_password_sync("pw", "")
+        assert not verify_password_sync("pw", "scrypt$x$y$z$a$b")
+        assert not verify_password_sync("pw", "not-a-hash")
+
+
+class TestBoundedPool:
+    """Tests for the bounded hashing pool"""
+
+    def test_rejects_when_full(self):
+        pool = password_service._BoundedPool(workers=1, queue=0)
+        release = threading.Event()
+        started = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return True
+
+        result = {}
+        thread = threading.Thread(target=lambda: result.setdefault("v", pool.run(slow)))
+        thread.start()
+        started.wait(5)
+        with pytest.raises(PasswordPoolBusy):
+            pool.run(lambda: True)
+        release.set()
+        thread.join(5)
+        assert result["v"] is True
+        assert pool.run(lambda: 42) == 42
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
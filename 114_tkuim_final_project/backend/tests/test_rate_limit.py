@@ -0,0 +1,125 @@
+"""
+Unit Tests for Rate Limiting Middleware
+
+Run with: pytest tests/test_rate_limit.py -v
+"""
+import pytest
+import sys
+import os
+from unittest.mock import MagicMock
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from middleware.rate_limit import (
+    Quota,
+    InMemoryStorage,
+    MongoStorage,
+    RateLimiter,
+    setup_rate_limiting
+)
+
+
+class TestQuota:
+    """Tests for quota parsing"""
+
+    def test_parse(self):
+        quota = Quota("120/minute", burst=60)
+        assert quota.rate == 2
+        assert quota.burst == 60
+
+    def test_burst_defaults_to_count(self):
+        assert Quota("5/hours").burst == 5
+
+
+class TestInMemoryStorage:
+    """Tests for the token bucket arithmetic"""
+
+    def test_burst_then_reject(self):
+        storage = InMemoryStorage()
+        quota = Quota("60/minute", burst=3)
+        results = [storage.consume("k", quota, now=100.0)[0] for _ in range(4)]
+        assert results == [True, True, True, False]
+
+    def test_refill(self):
+        storage = InMemoryStorage()
+        quota = Quota("60/minute", burst=1)
+        assert storage.consume("k", quota, now=100.0)[0]
+        allowed, retry_after = storage.consume("k", quota, now=100.5)
+        assert not allowed
+        assert retry_after == pytest.approx(0.5)
+        assert storage.consume("k", quota, now=101.0)[0]
+
+    def test_keys_are_independent(self):
+        storage = InMemoryStorage()
+        quota = Quota("1/minute")
+        assert storage.consume("user:a", quota, now=0)[0]
+        assert storage.consume("user:b", quota, now=0)[0]
+        assert not storage.consume("user:a", quota, now=0)[0]
+
+
+class TestMongoStorage:
+    """Tests for the shared store (collection stubbed)"""
+
+    def test_one_atomic_update(self):
+        coll = MagicMock()
+        coll.find_one_and_update.return_value = {"allowed": False, "tokens": 0.25}
+        allowed, retry_after = MongoStorage(coll).consume("api:user:a", Quota("60/minute"), now=10.0)
+        assert not allowed
+        assert retry_after == pytest.approx(0.75)
+        assert coll.find_one_and_update.call_count == 1
+        args, kwargs = coll.find_one_and_update.call_args
+        assert args[0] == {"_id": "api:user:a"}
+        assert isinstance(args[1], list)  # Pipeline update
+        assert kwargs["upsert"] is True
+
+
+class TestRouteClasses:
+    """Tests for per-route-class quotas"""
+
+    def test_matching(self):
+        limiter = RateLimiter(InMemoryStorage())
+        assert limiter.route_class("POST", "/api/auth/login")[0] == "auth"
+        assert limiter.route_class("POST", "/api/auth/forgot-password")[0] == "strict"
+        assert limiter.route_class("GET", "/api/export")[0] == "heavy"
+        assert limiter.route_class("GET", "/api/transactions")[0] == "api"
+        assert limiter.route_class("GET", "/docs") is None
+
+
+class TestMiddleware:
+    """Tests for the 429 response"""
+
+    def _client(self):
+        app = FastAPI()
+
+        @app.get("/api/ping")
+        def ping():
+            return {"ok": True}
+
+        setup_rate_limiting(
+            app, InMemoryStorage(),
+            key_func=lambda request: request.headers.get("x-user", "anon"),
+            route_classes=[("api", None, r"^/api/", Quota("2/minute"))]
+        )
+        return TestClient(app)
+
+    def test_rejects_with_retry_after(self):
+        client = self._client()
+        assert client.get("/api/ping").status_code == 200
+        assert client.get("/api/ping").status_code == 200
+        response = client.get("/api/ping")
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+
+    def test_principals_have_separate_buckets(self):
+        client = self._client()
+        for _ in range(2):
+            client.get("/api/ping", headers={"x-user": "a"})
+        assert client.get("/api/ping", headers={"x-user": "a"}).status_code == 429
+        assert client.get("/api/ping", headers={"x-user": "b"}).status_code == 200
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,169 @@
+"""
+Unit Tests for Recurring Service
+
+Run with: pytest tests/test_recurring_service.py -v
+"""
+import pytest
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unittest.mock import patch
+from bson import ObjectId
+from services.recurring_service import (
+    next_occurrence,
+    due_occurrences,
+    iter_occurrences,
+    expand_occurrences,
+    anchor_day_after_edit,
+    insert_occurrences,
+    build_transaction
+)
+from services import recurring_service
+
+
+class TestNextOccurrence:
+    """Tests for advancing a rule by one period"""
+
+    def test_daily(self):
+        assert next_occurrence("2026-01-31", "daily") == "2026-02-01"
+
+    def test_weekly(self):
+        assert next_occurrence("2026-12-28", "weekly") == "2027-01-04"
+
+    def test_monthly_year_rollover(self):
+        assert next_occurrence("2026-12-05", "monthly") == "2027-01-05"
+
+    def test_yearly(self):
+        assert next_occurrence("2026-03-01", "yearly") == "2027-03-01"
+
+    def test_monthly_month_end_clamps(self):
+        """Jan 31 should move to the last day of February"""
+        assert next_occurrence("2026-01-31", "monthly") == "2026-02-28"
+
+    def test_monthly_anchor_restores_day(self):
+        """A rule anchored on the 31st returns to the 31st after February"""
+        assert next_occurrence("2026-02-28", "monthly", anchor_day=31) == "2026-03-31"
+
+    def test_yearly_leap_day(self):
+        """Feb 29 rules run on Feb 28 in common years"""
+        assert next_occurrence("2028-02-29", "yearly") == "2029-02-28"
+
+
+class TestDueOccurrences:
+    """Tests for catch-up of missed periods"""
+
+    def test_nothing_due(self):
+        """Future rules should produce no occurrences"""
+        dates, new_next = due_occurrences("2026-02-01", "monthly", "2026-01-15")
+        assert dates == []
+        assert new_next == "2026-02-01"
+
+    def test_due_today_inclusive(self):
+        """A rule due today should run today"""
+        dates, new_next = due_occurrences("2026-01-15", "daily", "2026-01-15")
+        assert dates == ["2026-01-15"]
+        assert new_next == "2026-01-16"
+
+    def test_catch_up_missed_periods(self):
+        """All missed weeks should be generated in one pass"""
+        dates, new_next = due_occurrences("2026-01-01", "weekly", "2026-01-29")
+        assert dates == ["2026-01-01", "2026-01-08", "2026-01-15", "2026-01-22", "2026-01-29"]
+        assert new_next == "2026-02-05"
+
+    def test_catch_up_limit(self):
+        """Catch-up should stop at the limit and resume from the next date"""
+        dates, new_next = due_occurrences("2026-01-01", "daily", "2026-12-31", limit=10)
+        assert len(dates) == 10
+        assert new_next == "2026-01-11"
+
+
+class TestIterOccurrences:
+    """Tests for lazy occurrence expansion"""
+
+    def test_monthly_window(self):
+        """Month-end rule should clamp per month and keep its anchor"""
+        dates = list(iter_occurrences("2026-01-31", "monthly", "2026-01-01", "2026-05-31"))
+        assert dates == ["2026-01-31", "2026-02-28", "2026-03-31", "2026-04-30", "2026-05-31"]
+
+    def test_window_before_rule_start(self):
+        """Occurrences should not be generated before next_date"""
+        dates = list(iter_occurrences("2026-03-10", "weekly", "2026-01-01", "2026-03-24"))
+        assert dates == ["2026-03-10", "2026-03-17", "2026-03-24"]
+
+    def test_far_window_jumps(self):
+        """A distant window should start at the right occurrence"""
+        dates = list(iter_occurrences("2020-01-15", "monthly", "2030-06-01", "2030-07-31"))
+        assert dates == ["2030-06-15", "2030-07-15"]
+
+    def test_daily_far_window(self):
+        dates = list(iter_occurrences("2000-01-01", "daily", "2030-01-01", "2030-01-03"))
+        assert dates == ["2030-01-01", "2030-01-02", "2030-01-03"]
+
+    def test_is_lazy(self):
+        """The engine should be a generator, not a list"""
+        gen = iter_occurrences("2026-01-01", "daily", "2026-01-01", "9999-12-31")
+        assert next(gen) == "2026-01-01"
+
+    def test_expand_merges_by_date(self):
+        """Occurrences of several rules should come out date-ordered"""
+        base = {"title": "t", "amount": 1, "category": "c"}
+        rules = [
+            {**base, "_id": "a", "next_date": "2026-01-05", "frequency": "weekly"},
+            {**base, "_id": "b", "next_date": "2026-01-01", "frequency": "monthly"},
+        ]
+        result = list(expand_occurrences(rules, "2026-01-01", "2026-01-31"))
+        assert [o["date"] for o in result] == [
+            "2026-01-01", "2026-01-05", "2026-01-12", "2026-01-19", "2026-01-26"
+        ]
+        assert result[0]["recurring_id"] == "b"
+
+
+class TestAnchorDayAfterEdit:
+    """Tests for keeping month-end anchors when a rule is edited"""
+
+    def test_kept_when_day_unchanged(self):
+        stored = {"anchor_day": 31, "next_date": "2026-02-28"}
+        assert anchor_day_after_edit(stored, "2026-02-28") == 31
+
+    def test_recomputed_when_day_changed(self):
+        stored = {"anchor_day": 31, "next_date": "2026-02-28"}
+        assert anchor_day_after_edit(stored, "2026-03-15") == 15
+
+    def test_legacy_rule_without_anchor(self):
+        assert anchor_day_after_edit({"next_date": "2026-02-28"}, "2026-02-28") == 28
+        assert anchor_day_after_edit(None, "2026-01-31") == 31
+
+
+class TestInsertOccurrences:
+    """Tests for side effects of materialized occurrences"""
+
+    @patch.object(recurring_service, "learn")
+    @patch.object(recurring_service, "apply_transactions")
+    @patch.object(recurring_service, "transactions_collection")
+    def test_inserted_rows_are_learned(self, _transactions, _apply, learn):
+        docs = [{"title": "房租", "category": "Rent", "type": "expense", "user_id": "u1"}]
+        assert insert_occurrences(docs) == 1
+        learn.assert_called_once_with(docs)
+
+
+class TestBuildTransaction:
+    """Tests for occurrence transaction documents"""
+
+    def test_idempotency_key(self):
+        """Transactions should carry recurring_id and occurrence_date"""
+        rule = {
+            "_id": ObjectId(), "title": "Rent", "amount": 15000, "category": "Rent",
+            "type": "expense", "payment_method": "Bank", "user_id": "u1"
+        }
+        tx = build_transaction(rule, "2026-02-01")
+        assert tx["recurring_id"] == str(rule["_id"])
+        assert tx["occurrence_date"] == "2026-02-01"
+        assert tx["date"] == "2026-02-01"
+        assert tx["amount_base"] == 15000
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
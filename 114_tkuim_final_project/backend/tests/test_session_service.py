@@ -0,0 +1,81 @@
+"""
+Unit Tests for Session Service
+
+Run with: pytest tests/test_session_service.py -v
+"""
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from services import session_service
+from services.session_service import RevocationMap, build_claims, user_from_claims
+
+
+class TestClaims:
+    """Tests for token claims"""
+
+    def test_round_trip(self):
+        user = {"_id": ObjectId(), "username": "alice", "role": "admin", "password": "x"}
+        claims = build_claims(user, 3)
+        assert claims == {"sub": "alice", "uid": str(user["_id"]), "role": "admin", "ver": 3}
+        assert user_from_claims(claims) == {"id": str(user["_id"]), "username": "alice", "role": "admin"}
+
+
+class TestRevocationMap:
+    """Tests for the in-memory token-version map"""
+
+    def test_no_db_access_between_refreshes(self):
+        revocations = RevocationMap(refresh_seconds=60)
+        with patch.object(session_service, "token_versions_collection") as coll:
+            coll.find.return_value = []
+            for _ in range(5):
+                assert revocations.is_current({"uid": "u1", "ver": 0})
+        assert coll.find.call_count == 1
+
+    def test_bump_revokes_older_tokens(self):
+        revocations = RevocationMap(refresh_seconds=60)
+        with patch.object(session_service, "token_versions_collection") as coll:
+            coll.find.return_value = []
+            coll.find_one_and_update.return_value = {"_id": "u1", "version": 1}
+            old = {"uid": "u1", "ver": revocations.version("u1")}
+            new_version = revocations.bump("u1")
+        assert not revocations.is_current(old)
+        assert revocations.is_current({"uid": "u1", "ver": new_version})
+
+    def test_refresh_picks_up_other_workers(self):
+        revocations = RevocationMap(refresh_seconds=-1)
+        now = datetime.utcnow()
+        with patch.object(session_service, "token_versions_collection") as coll:
+            coll.find.return_value = []
+            assert revocations.version("u1") == 0
+            coll.find.return_value = [{"_id": "u1", "version": 2, "updated_at": now}]
+            assert revocations.version("u1") == 2
+            coll.find.return_value = []
+            assert revocations.version("u1") == 2
+            cursor = coll.find.call_args[0][0]["updated_at"]["$gte"]
+            assert cursor == now - timedelta(seconds=session_service.SYNC_OVERLAP_SECONDS)
+
+    def test_bump_stamped_by_server_clock(self):
+        revocations = RevocationMap(refresh_seconds=60)
+        with patch.object(session_service, "token_versions_collection") as coll:
+            coll.find_one_and_update.return_value = {"_id": "u1", "version": 1}
+            revocations.bump("u1")
+        update = coll.find_one_and_update.call_args[0][1]
+        assert update == {"$inc": {"version": 1}, "$currentDate": {"updated_at": True}}
+
+    def test_legacy_token_without_version(self):
+        revocations = RevocationMap(refresh_seconds=60)
+        with patch.object(session_service, "token_versions_collection") as coll:
+            coll.find.return_value = [{"_id": "u1", "version": 1, "updated_at": datetime.utcnow() - timedelta(days=1)}]
+            assert not revocations.is_current({"uid": "u1"})
+            assert revocations.is_current({"uid": "u2"})
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
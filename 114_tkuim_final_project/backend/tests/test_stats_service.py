@@ -0,0 +1,155 @@
+"""
+Unit Tests for Stats Service
+
+Run with: pytest tests/test_stats_service.py -v
+"""
+import pytest
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unittest.mock import patch
+from services.stats_service import (
+    bucket_labels,
+    bucket_count,
+    get_trend,
+    MAX_BUCKETS,
+    bucket_key_expr,
+    resolve_range,
+    month_bounds,
+    month_labels,
+    get_multi_month_stats
+)
+
+
+class TestBucketLabels:
+    """Tests for server-side gap filling labels"""
+
+    def test_day_labels(self):
+        assert bucket_labels("2026-01-30", "2026-02-02", "day") == [
+            "2026-01-30", "2026-01-31", "2026-02-01", "2026-02-02"
+        ]
+
+    def test_week_labels_start_on_monday(self):
+        """Weeks are labelled by their Monday, even mid-week starts"""
+        # 2026-01-01 is a Thursday
+        assert bucket_labels("2026-01-01", "2026-01-19", "week") == [
+            "2025-12-29", "2026-01-05", "2026-01-12", "2026-01-19"
+        ]
+
+    def test_month_labels(self):
+        assert bucket_labels("2025-11-15", "2026-02-01", "month") == [
+            "2025-11", "2025-12", "2026-01", "2026-02"
+        ]
+
+    def test_year_labels(self):
+        assert bucket_labels("2024-06-01", "2026-01-01", "year") == ["2024", "2025", "2026"]
+
+
+class TestBucketCount:
+    """Tests for rejecting oversized ranges before listing buckets"""
+
+    @pytest.mark.parametrize("granularity", ["day", "week", "month", "year"])
+    @pytest.mark.parametrize("start,end", [
+        ("2026-01-01", "2026-01-19"), ("2025-11-15", "2026-02-01"), ("2024-02-29", "2026-03-01"),
+        ("2026-01-05", "2026-01-05"), ("2026-01-04", "2026-01-05"), ("2026-02-01", "2026-01-01")
+    ])
+    def test_matches_labels(self, start, end, granularity):
+        assert bucket_count(start, end, granularity) == len(bucket_labels(start, end, granularity))
+
+    def test_huge_range_rejected_without_listing(self):
+        with patch("services.stats_service.bucket_labels") as labels, \
+                patch("services.stats_service.transactions_collection") as coll:
+            with pytest.raises(ValueError):
+                get_trend({}, "day", "0001-01-01", "2026-01-01")
+        labels.assert_not_called()
+        coll.aggregate.assert_not_called()
+        assert bucket_count("0001-01-01", "2026-01-01", "day") > MAX_BUCKETS
+
+
+class TestBucketKeyExpr:
+    """Tests for the aggregation grouping key"""
+
+    def test_day_uses_raw_date(self):
+        assert bucket_key_expr("day") == "$date"
+
+    def test_month_uses_prefix(self):
+        assert bucket_key_expr("month") == {"$substrCP": ["$date", 0, 7]}
+
+    def test_week_uses_date_trunc(self):
+        assert "$dateTrunc" in bucket_key_expr("week")["$dateToString"]["date"]
+
+
+class TestResolveRange:
+    """Tests for bounded default ranges"""
+
+    def test_default_range_is_bounded(self):
+        start, end = resolve_range("day", None, None, today="2026-03-31")
+        assert end == "2026-03-31"
+        assert start == "2026-01-01"
+
+    def test_explicit_range_kept(self):
+        assert resolve_range("month", "2025-01-01", "2025-12-31") == ("2025-01-01", "2025-12-31")
+
+    def test_start_after_end_rejected(self):
+        with pytest.raises(ValueError):
+            resolve_range("day", "2026-02-01", "2026-01-01")
+
+    def test_bad_format_rejected(self):
+        with pytest.raises(ValueError):
+            resolve_range("day", "2026/01/01", "2026-01-31")
+
+
+class TestMonthBounds:
+    """Tests for half-open month ranges"""
+
+    def test_single_month(self):
+        assert month_bounds("2026-02") == ("2026-02-01", "2026-03-01")
+
+    def test_december_rolls_over(self):
+        assert month_bounds("2025-12") == ("2025-12-01", "2026-01-01")
+
+    def test_multi_month(self):
+        assert month_bounds("2025-06", 12) == ("2025-06-01", "2026-06-01")
+
+    def test_excludes_next_month(self):
+        """Bounds are half-open: the next month's first day is excluded"""
+        start, end = month_bounds("2026-04")
+        assert start <= "2026-04-30" < end
+        assert not ("2026-05-01" < end)
+
+    def test_invalid_month(self):
+        with pytest.raises(ValueError):
+            month_bounds("2026-13")
+
+    def test_month_labels(self):
+        assert month_labels("2025-11", 3) == ["2025-11", "2025-12", "2026-01"]
+
+
+class TestMultiMonthStats:
+    """Tests for multi-month statistics in one aggregation"""
+
+    def test_single_aggregation_with_range(self):
+        """All months should come from one pipeline with index-friendly bounds"""
+        rows = [
+            {"_id": {"month": "2026-01", "type": "income"}, "total": 1000},
+            {"_id": {"month": "2026-01", "type": "expense"}, "total": 300},
+            {"_id": {"month": "2026-03", "type": "expense"}, "total": 50},
+        ]
+        with patch("services.stats_service.transactions_collection") as coll:
+            coll.aggregate.return_value = rows
+            result = get_multi_month_stats({"user_id": "u1"}, "2026-01", 3)
+
+        assert coll.aggregate.call_count == 1
+        match = coll.aggregate.call_args[0][0][0]["$match"]
+        assert match["date"] == {"$gte": "2026-01-01", "$lt": "2026-04-01"}
+        assert [r["month"] for r in result] == ["2026-01", "2026-02", "2026-03"]
+        assert result[0]["balance"] == 700
+        assert result[1] == {"month": "2026-02", "income": 0, "expense": 0, "balance": 0}
+        assert result[2]["expense"] == 50
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
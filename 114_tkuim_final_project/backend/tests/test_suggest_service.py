@@ -0,0 +1,88 @@
+"""
+Unit Tests for Suggest Service
+
+Run with: pytest tests/test_suggest_service.py -v
+"""
+import pytest
+import sys
+import os
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import suggest_service
+from services.suggest_service import TitleIndex, get_index, observe
+
+HISTORY = [
+    {"title": "加油", "category": "Transport", "amount": 1500, "payment_method": "Credit Card", "type": "expense", "date": "2026-01-02"},
+    {"title": "加油", "category": "Transport", "amount": 1200, "payment_method": "Credit Card", "type": "expense", "date": "2026-01-16"},
+    {"title": "加油", "category": "Transport", "amount": 1500, "payment_method": "Cash", "type": "expense", "date": "2026-01-30"},
+    {"title": "加班費", "category": "Salary", "amount": 3000, "payment_method": "Bank", "type": "income", "date": "2026-01-31"},
+    {"title": "便利商店午餐", "category": "Food", "amount": 120, "payment_method": "E-wallet", "type": "expense", "date": "2026-01-03"},
+    {"title": "Coffee", "category": "Food", "amount": 60, "payment_method": "Cash", "type": "expense", "date": "2026-01-04"},
+]
+
+
+class TestTitleIndex:
+    """Tests for prefix lookups"""
+
+    def test_ranked_by_use_with_usual_values(self):
+        results = TitleIndex(HISTORY).suggest("加")
+        assert [r["title"] for r in results] == ["加油", "加班費"]
+        assert results[0] == {
+            "title": "加油", "category": "Transport", "amount": 1500,
+            "payment_method": "Credit Card", "type": "expense", "count": 3
+        }
+
+    def test_prefix_is_normalized(self):
+        assert TitleIndex(HISTORY).suggest(" coF")[0]["title"] == "Coffee"
+
+    def test_no_match(self):
+        assert TitleIndex(HISTORY).suggest("晚餐") == []
+
+    def test_empty_prefix(self):
+        assert TitleIndex(HISTORY).suggest("  ") == []
+
+    def test_ties_prefer_recent(self):
+        index = TitleIndex([
+            {"title": "午餐A", "date": "2026-01-01"},
+            {"title": "午餐B", "date": "2026-02-01"},
+        ])
+        assert [r["title"] for r in index.suggest("午餐")] == ["午餐B", "午餐A"]
+
+    def test_add_and_remove(self):
+        index = TitleIndex(HISTORY)
+        index.add({"title": "加值悠遊卡", "category": "Transport", "amount": 500})
+        assert "加值悠遊卡" in [r["title"] for r in index.suggest("加值")]
+        index.add({"title": "加值悠遊卡", "category": "Transport", "amount": 500}, sign=-1)
+        assert index.suggest("加值") == []
+        assert len(index) == 4
+
+    def test_removing_unknown_title_is_ignored(self):
+        index = TitleIndex(HISTORY)
+        index.add({"title": "不存在"}, sign=-1)
+        assert len(index) == 4
+
+
+class TestIndexCache:
+    """Tests for building from history and updating on write"""
+
+    @patch.object(suggest_service, "transactions_collection")
+    def test_built_once_and_updated_on_write(self, transactions):
+        suggest_service._indexes.clear()
+        transactions.find.return_value = HISTORY
+        assert get_index("u1").suggest("便利")[0]["count"] == 1
+        observe([dict(HISTORY[4], user_id="u1")])
+        assert get_index("u1").suggest("便利")[0]["count"] == 2
+        assert transactions.find.call_count == 1
+
+    @patch.object(suggest_service, "transactions_collection")
+    def test_unloaded_users_ignored(self, transactions):
+        suggest_service._indexes.clear()
+        observe([dict(HISTORY[0], user_id="u2")])
+        transactions.find.assert_not_called()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,68 @@
+"""
+Unit Tests for Token Service
+
+Run with: pytest tests/test_token_service.py -v
+"""
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import token_service
+from services.token_service import PURPOSE_PASSWORD_RESET, PURPOSE_ACCOUNT_DELETE
+
+
+class TestHashToken:
+    """Tests for token hashing"""
+
+    def test_plaintext_not_stored(self):
+        h = token_service.hash_token("secret", PURPOSE_PASSWORD_RESET)
+        assert "secret" not in h
+        assert len(h) == 64
+
+    def test_purpose_separates_hashes(self):
+        assert token_service.hash_token("x", PURPOSE_PASSWORD_RESET) != \
+            token_service.hash_token("x", PURPOSE_ACCOUNT_DELETE)
+
+    def test_scoped_codes_do_not_collide(self):
+        """Two users may hold the same 6-digit code"""
+        assert token_service.hash_token("123456", PURPOSE_ACCOUNT_DELETE, "u1") != \
+            token_service.hash_token("123456", PURPOSE_ACCOUNT_DELETE, "u2")
+
+
+class TestIssueAndRedeem:
+    """Tests for the token lifecycle"""
+
+    def test_issue_replaces_previous(self):
+        with patch.object(token_service, "tokens_collection") as coll:
+            token_service.issue_token("abc", "u1", PURPOSE_PASSWORD_RESET, timedelta(minutes=30))
+        coll.delete_many.assert_called_once_with({"user_id": "u1", "purpose": PURPOSE_PASSWORD_RESET})
+        doc = coll.insert_one.call_args[0][0]
+        assert doc["token_hash"] == token_service.hash_token("abc", PURPOSE_PASSWORD_RESET)
+        assert isinstance(doc["expires_at"], datetime)
+
+    def test_scoped_issue_matches_scoped_lookup(self):
+        with patch.object(token_service, "tokens_collection") as coll:
+            token_service.issue_token("123456", "u1", PURPOSE_ACCOUNT_DELETE, timedelta(minutes=10), scoped=True)
+            stored = coll.insert_one.call_args[0][0]["token_hash"]
+            token_service.find_token("123456", PURPOSE_ACCOUNT_DELETE, "u1")
+        assert coll.find_one.call_args[0][0]["token_hash"] == stored
+
+    def test_is_expired(self):
+        past = {"expires_at": datetime.utcnow() - timedelta(seconds=1)}
+        future = {"expires_at": datetime.utcnow() + timedelta(minutes=5)}
+        assert token_service.is_expired(past)
+        assert not token_service.is_expired(future)
+
+    def test_consume_only_once(self):
+        with patch.object(token_service, "tokens_collection") as coll:
+            coll.delete_one.return_value.deleted_count = 0
+            assert not token_service.consume_token({"_id": "t1"})
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
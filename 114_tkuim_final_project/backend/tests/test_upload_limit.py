@@ -0,0 +1,81 @@
+"""
+Unit Tests for Upload Size Limit Middleware
+
+Run with: pytest tests/test_upload_limit.py -v
+"""
+import pytest
+import sys
+import os
+import asyncio
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI, UploadFile, File
+from middleware.upload_limit import setup_upload_limit
+
+
+def _app():
+    app = FastAPI()
+    seen = []
+
+    @app.post("/api/import")
+    async def upload(file: UploadFile = File(...)):
+        seen.append(file.filename)
+        return {"size": len(file.file.read())}
+
+    @app.post("/api/other")
+    async def other(file: UploadFile = File(...)):
+        return {"size": len(file.file.read())}
+
+    setup_upload_limit(app, [(r"^/api/import$", 1024)])
+    return app, seen
+
+
+def _post(app, path, **kwargs):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(path, **kwargs)
+    return asyncio.run(scenario())
+
+
+class TestUploadLimit:
+    """Tests for rejecting oversized uploads early"""
+
+    def test_small_upload_passes(self):
+        app, seen = _app()
+        response = _post(app, "/api/import", files={"file": ("a.csv", b"x" * 100)})
+        assert response.status_code == 200
+        assert response.json() == {"size": 100}
+        assert seen == ["a.csv"]
+
+    def test_declared_length_rejected_before_endpoint(self):
+        app, seen = _app()
+        response = _post(app, "/api/import", files={"file": ("a.csv", b"x" * 4096)})
+        assert response.status_code == 413
+        assert seen == []
+
+    def test_chunked_body_cut_off(self):
+        app, seen = _app()
+
+        async def body():
+            yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.csv"\r\n\r\n'
+            for _ in range(16):
+                yield b"x" * 256
+            yield b"\r\n--b--\r\n"
+
+        response = _post(app, "/api/import", content=body(),
+                         headers={"content-type": "multipart/form-data; boundary=b"})
+        assert response.status_code == 413
+        assert seen == []
+
+    def test_other_routes_unlimited(self):
+        app, _ = _app()
+        response = _post(app, "/api/other", files={"file": ("a.csv", b"x" * 4096)})
+        assert response.status_code == 200
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -1,6 +1,5 @@
 # utils.py - Shared utilities for backend
 import secrets
-import hashlib
 import os
 import jwt
 from datetime import datetime, timedelta
@@ -16,19 +15,8 @@ else:
     SECRET_KEY = _env_secret
 ALGORITHM = "HS256"
 
-# --- Password Hashing (Salted SHA256) ---
-def hash_password(password: str) -> str:
-    salt = secrets.token_hex(8)  # 16 chars
-    hashed = hashlib.sha256((salt + password).encode()).hexdigest()
-    return f"{salt}${hashed}"
-
-def verify_password(plain: str, hashed: str) -> bool:
-    try:
-        salt, hash_val = hashed.split('$')
-        verify_hash = hashlib.sha256((salt + plain).encode()).hexdigest()
-        return verify_hash == hash_val
-    except ValueError:
-        return False
+# --- Password Hashing (see services/password_service) ---
+from services.password_service import hash_password, verify_password
 
 # --- JWT Token ---
 def create_access_token(data: dict):